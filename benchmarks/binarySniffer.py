@@ -0,0 +1,90 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This script compares the classification of files used previously by BufferManager.is_binary()
+# (chardet on every file whose mimetype is unknown) with classify_file(), which tries
+# sniff_file_prefix() first; it reports the time taken by each and any differing verdicts,
+# over a generated tree of source, text and binary files, or over the given directories
+#
+# usage: python3 benchmarks/binarySniffer.py [directory ...]
+
+import os
+import sys
+import time
+import random
+import codecs
+import tempfile
+import mimetypes
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ash.utils.fileUtils import *
+
+FILES_PER_KIND	= 200
+SOURCE_LINE		= "\tdef render_data_to_lines(self, text):\t# sample line of source code\n"
+ACCENTED_LINE	= "Ünïcödé sample line, with a few accents: café, naïve, résumé\n"
+
+# the previous classification: mimetype, then chardet
+def legacy_classify(filename):
+	mt = str(mimetypes.guess_type(filename, strict=False)[0]).lower()
+	if(mt.startswith("text/")): return (False, None)
+	if(mt != "none"): return (True, None)
+	pf = predict_file_encoding(filename)
+	if(pf == None): return (True, None)
+	if(str(pf).lower() not in SUPPORTED_ENCODINGS): return (True, pf)
+	return (False, pf)
+
+# generates files of every kind (named without extensions, so that they have to be sniffed)
+def generate_tree(dirname):
+	rand = random.Random(0)
+	kinds = {
+		"source":		lambda: (SOURCE_LINE * rand.randint(1, 400)).encode("utf-8"),
+		"minified":		lambda: ("var a=1;" * rand.randint(1000, 20000)).encode("utf-8"),
+		"utf8":			lambda: (ACCENTED_LINE * rand.randint(1, 400)).encode("utf-8"),
+		"utf8-few":		lambda: (SOURCE_LINE * 10 + "é\n" + SOURCE_LINE * 10).encode("utf-8"),
+		"utf8-bom":		lambda: (ACCENTED_LINE * rand.randint(1, 40)).encode("utf-8-sig"),
+		"utf16":		lambda: (ACCENTED_LINE * rand.randint(1, 40)).encode("utf-16"),
+		"latin1":		lambda: (ACCENTED_LINE * rand.randint(1, 40)).encode("latin-1"),
+		"escape":		lambda: ("\x1b[1mbold\x1b[0m\n" * rand.randint(1, 40)).encode("ascii"),
+		"binary":		lambda: bytes(rand.getrandbits(8) for _ in range(rand.randint(1, 64 * 1024))),
+		"executable":	lambda: b"\x7fELF\x02\x01\x01" + bytes(9) + bytes(rand.getrandbits(8) for _ in range(4096)),
+		"empty":		lambda: b"",
+	}
+	for kind, generate in kinds.items():
+		for i in range(FILES_PER_KIND):
+			with open(os.path.join(dirname, kind + "-" + str(i)), "wb") as f:
+				f.write(generate())
+
+def list_files(directories):
+	files = list()
+	for d in directories:
+		for root, dirs, names in os.walk(d):
+			files.extend([ os.path.join(root, n) for n in names if os.path.isfile(os.path.join(root, n)) ])
+	return files
+
+def measure(func, files):
+	start = time.perf_counter()
+	verdicts = [ func(f) for f in files ]
+	return (time.perf_counter() - start, verdicts)
+
+def run(directories):
+	with tempfile.TemporaryDirectory() as tmpdir:
+		if(len(directories) == 0):
+			generate_tree(tmpdir)
+			directories = [ tmpdir ]
+		files = list_files(directories)
+
+		t_old, old_verdicts = measure(legacy_classify, files)
+		t_new, new_verdicts = measure(classify_file, files)
+		fast = sum([ 1 for f in files if sniff_file_prefix(f) != None ])
+
+		mismatches = [ (f, o, n) for f, o, n in zip(files, old_verdicts, new_verdicts) if o[0] != n[0] ]
+		print("%d files (%d classified without chardet)" % (len(files), fast))
+		print("old: %.3fs   new: %.3fs   speed-up: %.1fx" % (t_old, t_new, t_old / max([t_new, 1e-9])))
+		print("differing verdicts: " + str(len(mismatches)))
+		for f, o, n in mismatches:
+			print("\t%s: binary %s -> %s (%s -> %s)" % (f, o[0], n[0], o[1], n[1]))
+
+if(__name__ == "__main__"):
+	run(sys.argv[1:])
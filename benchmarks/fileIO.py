@@ -0,0 +1,74 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This script compares the line-by-line file I/O used previously by Buffer with the bulk
+# read_text_file() / write_text_file() path, on generated 1 MB, 10 MB and 100 MB files
+#
+# usage: python3 benchmarks/fileIO.py [size-in-MB ...]
+
+import os
+import sys
+import time
+import codecs
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ash.utils.fileUtils import *
+
+DEFAULT_SIZES	= [ 1, 10, 100 ]		# in MB
+SAMPLE_LINE		= "\tdef render_data_to_lines(self, text): # ünïcödé sample line of source code"
+
+# generates a text file of approximately the given size
+def generate_file(filename, size, newline):
+	line = SAMPLE_LINE + newline
+	count = (size * 1024 * 1024) // len(line.encode("utf-8"))
+	with open(filename, "wb") as f:
+		f.write((line * count).encode("utf-8"))
+
+# the previous read path: codecs.open() + readline() loop
+def legacy_read(filename, encoding):
+	lines = list()
+	textFile = codecs.open(filename, "r", encoding)
+	data  = " "
+	while(len(data) > 0):
+		data = textFile.readline()
+		lines.append(data[:-1])
+	textFile.close()
+	return lines
+
+# the previous write path: one write() per line
+def legacy_write(filename, lines, encoding):
+	textFile = codecs.open(filename, "w", encoding)
+	for line in lines:
+		textFile.write(line + "\n")
+	textFile.close()
+
+def measure(func, *args):
+	start = time.perf_counter()
+	result = func(*args)
+	return (time.perf_counter() - start, result)
+
+def run(sizes):
+	print("%-8s %-6s %12s %12s %12s %12s" % ("size", "eol", "old read", "new read", "old write", "new write"))
+	with tempfile.TemporaryDirectory() as tmpdir:
+		source = os.path.join(tmpdir, "source.txt")
+		target = os.path.join(tmpdir, "target.txt")
+		for size in sizes:
+			for newline in [ "\n", "\r\n" ]:
+				generate_file(source, size, newline)
+				t_old_read, old_lines = measure(legacy_read, source, "utf-8")
+				t_new_read, (new_lines, detected) = measure(read_text_file, source, "utf-8")
+				t_old_write, _ = measure(legacy_write, target, old_lines, "utf-8")
+				t_new_write, _ = measure(write_text_file, target, new_lines, "utf-8", detected)
+
+				with open(source, "rb") as f1, open(target, "rb") as f2:
+					if(f1.read() != f2.read()): print("error: round-trip mismatch for " + str(size) + " MB")
+
+				eol = ("CRLF" if newline == "\r\n" else "LF")
+				print("%-8s %-6s %11.3fs %11.3fs %11.3fs %11.3fs" % (str(size) + " MB", eol, t_old_read, t_new_read, t_old_write, t_new_write))
+
+if(__name__ == "__main__"):
+	sizes = [ int(x) for x in sys.argv[1:] ]
+	run(sizes if len(sizes) > 0 else DEFAULT_SIZES)
@@ -0,0 +1,60 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This script measures the cost of mapping real lines to rendered lines (and back) with the
+# LineLayout used by Screen, at the top, middle and bottom of a generated wrapped file (1M lines
+# by default), along with the cost of patching the layout after an edit; the previous approach
+# (summing the rendered lines of all the lines above) is measured alongside for comparison
+#
+# usage: python3 benchmarks/lineLayout.py [number-of-lines]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+import pyximport; pyximport.install(language_level=3)
+from ash.core.screen import *
+
+DEFAULT_LINE_COUNT	= 1000000
+REPEAT				= 1000
+
+# the previous lookup: sums the rendered lines of all the lines above
+def legacy_first_row(heights, line_index):
+	row = 0
+	for y in range(line_index):
+		row += heights[y]
+	return row
+
+def measure(func, repeat):
+	start = time.perf_counter()
+	for i in range(repeat): func()
+	return (time.perf_counter() - start) / repeat
+
+def run(count):
+	rand = random.Random(0)
+	heights = [ rand.choice([1, 1, 1, 2, 3]) for i in range(count) ]
+	start = time.perf_counter()
+	layout = LineLayout(heights)
+	print("built the layout of %d lines (%d rendered lines) in %.3fs" % (count, layout.get_total_rows(), time.perf_counter() - start))
+
+	print("%-8s %16s %16s %16s" % ("line", "first row", "line at row", "legacy"))
+	for line_index in [ 0, count // 2, count - 1 ]:
+		row = layout.get_first_row(line_index)
+		if(row != legacy_first_row(heights, line_index) or layout.get_line_at_row(row) != (line_index, 0)): print("error: line " + str(line_index))
+		t_first = measure(lambda: layout.get_first_row(line_index), REPEAT)
+		t_line = measure(lambda: layout.get_line_at_row(row), REPEAT)
+		t_legacy = measure(lambda: legacy_first_row(heights, line_index), 3)
+		print("%-8d %14.2fus %14.2fus %14.2fus" % (line_index, t_first * 1e6, t_line * 1e6, t_legacy * 1e6))
+
+	middle = count // 2
+	t_wrap = measure(lambda: layout.replace(middle, middle + 1, [ rand.randint(1, 3) ]), REPEAT)
+	t_insert = measure(lambda: layout.replace(middle, middle, [ 1 ]), REPEAT)
+	t_delete = measure(lambda: layout.replace(middle, middle + 1, []), REPEAT)
+	print("patching: wrap-count change %.2fus, line inserted %.2fus, line deleted %.2fus" % (t_wrap * 1e6, t_insert * 1e6, t_delete * 1e6))
+
+if(__name__ == "__main__"):
+	run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINE_COUNT)
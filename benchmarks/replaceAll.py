@@ -0,0 +1,66 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This script compares the replace-all used previously by Buffer (one line-assignment, and so one
+# recorded edit, per match) with Buffer.replace_all(), which rebuilds each affected line once and
+# records the whole operation as a single edit, on a generated buffer with 100k matches by default
+#
+# usage: python3 benchmarks/replaceAll.py [number-of-lines]
+
+import os
+import sys
+import time
+import queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ash.core.bufferManager import *
+
+DEFAULT_LINE_COUNT	= 50000
+SAMPLE_LINE			= "\tself.render(buffer, width) # render the buffer %d"
+QUERIES				= [
+	("plain text",		("render", False, False, False), "draw"),
+	("regex groups",	("(\\w+)\\(buffer, (\\w+)\\)", False, False, True), "\\1(\\2, buffer)"),
+]
+
+# the minimum of the application needed by a BufferManager
+class App:
+	def __init__(self):
+		self.events = queue.Queue()
+
+	def post_event(self, func, *args):
+		self.events.put( (func, args) )
+
+# the previous replace-all: each match replaced by assigning its line
+def legacy_replace_all(buffer, search_result, replace_text):
+	for line_index, col, length in sorted(search_result, reverse=True):
+		data = buffer.lines[line_index]
+		buffer.lines[line_index] = data[0:col] + replace_text + data[col+length:]
+	buffer.major_update(buffer.last_curpos, None)
+
+def measure(buffers, count, query, replace_text, legacy):
+	bid, buffer = buffers.create_new_buffer()
+	buffer.set_lines([ SAMPLE_LINE % i for i in range(count) ])
+	pattern = get_search_pattern(*query)
+	start = time.perf_counter()
+	search_result = pattern.find_all(buffer.lines)
+	if(legacy):
+		legacy_replace_all(buffer, search_result, replace_text)
+	else:
+		buffer.replace_all(search_result, replace_text, pattern)
+	elapsed = time.perf_counter() - start
+	return (elapsed, len(search_result), len(buffer.history.undo_stack[-1].operations), list(buffer.lines))
+
+def run(count):
+	buffers = BufferManager(App())
+	print("%-15s %8s %12s %12s %12s" % ("query", "matches", "old", "new", "edits (old/new)"))
+	for name, query, replace_text in QUERIES:
+		t_old, matches, old_edits, old_lines = measure(buffers, count, query, replace_text, True)
+		t_new, matches, new_edits, new_lines = measure(buffers, count, query, replace_text, False)
+		if(query[3]): old_lines = None		# (the old replace-all did not expand group-references)
+		if(old_lines != None and old_lines != new_lines): print("error: " + name + ": the results differ")
+		print("%-15s %8d %11.3fs %11.3fs %8d/%d" % (name, matches, t_old, t_new, old_edits, new_edits))
+
+if(__name__ == "__main__"):
+	run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINE_COUNT)
@@ -0,0 +1,103 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This script measures the latency of project-wide searches over files on disk, with and without
+# the TrigramIndex narrowing them down to candidate files, on a generated corpus of small source
+# files (100k by default)
+#
+# usage: python3 benchmarks/trigramIndex.py [number-of-files]
+
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ash.core.searchEngine import *
+from ash.core.trigramIndex import *
+from ash.core.projectScanner import *
+
+DEFAULT_FILE_COUNT	= 100000
+LINES_PER_FILE		= 30
+WORDS				= [ "buffer", "render", "editor", "cursor", "screen", "line", "index", "width", "height", "text",
+						"self", "return", "def", "class", "import", "for", "while", "if", "else", "None" ]
+QUERIES				= [
+	("rare identifier",		("calculate_checksum_7", False, False, False)),
+	("common word",			("render", False, False, False)),
+	("whole word",			("cursor_42", True, True, False)),
+	("regex with literal",	("unique_token_\\d+_end", False, False, True)),
+	("regex, no literal",	("[xz]{2}\\d", False, False, True)),
+]
+
+# generates files of random source-like lines; a few of them contain the rare tokens searched for
+def generate_corpus(dirname, count):
+	rand = random.Random(0)
+	filenames = list()
+	for i in range(count):
+		subdir = os.path.join(dirname, str(i // 1000))
+		if(i % 1000 == 0): os.mkdir(subdir)
+		lines = list()
+		for j in range(LINES_PER_FILE):
+			words = [ rand.choice(WORDS) + ("_" + str(rand.randint(0, 99)) if rand.random() < 0.3 else "") for _ in range(6) ]
+			lines.append("\t" + " ".join(words))
+		if(i % 10000 == 7): lines.append("x = calculate_checksum_7(data)\t# unique_token_" + str(i) + "_end")
+		filename = os.path.join(subdir, "file" + str(i) + ".py")
+		with open(filename, "w") as f:
+			f.write("\n".join(lines))
+		filenames.append(filename)
+	return filenames
+
+# searches the files on disk, as a stubbed file is searched; returns the number of matches
+def search_files(filenames, query):
+	pattern = get_search_pattern(*query)
+	count = 0
+	for filename in filenames:
+		with open(filename, "rb") as f:
+			lines = f.read().decode("utf-8").split("\n")
+		count += len(pattern.find_all(lines))
+	return count
+
+# builds the index on a ProjectScanner, as the editor does
+def build_index(filenames):
+	index = TrigramIndex()
+	done = threading.Event()
+	def on_results(scanner, results, count):
+		for item, result in results:
+			index.set_file(item[0], result)
+	scanner = ProjectScanner([ (f, "utf-8", None) for f in filenames ], on_results, lambda scanner: done.set(), index_file)
+	scanner.start()
+	done.wait()
+	return index
+
+def run(count):
+	with tempfile.TemporaryDirectory() as tmpdir:
+		start = time.perf_counter()
+		filenames = generate_corpus(tmpdir, count)
+		print("generated %d files in %.1fs" % (count, time.perf_counter() - start))
+
+		start = time.perf_counter()
+		index = build_index(filenames)
+		size = sum([ entry[2] // 8 for entry in index.files.values() ])
+		print("indexed in %.1fs: %.1f MB of bitmaps" % (time.perf_counter() - start, size / (1024 * 1024)))
+
+		print("%-20s %12s %12s %12s %8s" % ("query", "no index", "with index", "candidates", "hits"))
+		for name, query in QUERIES:
+			start = time.perf_counter()
+			hits = search_files(filenames, query)
+			t_scan = time.perf_counter() - start
+
+			start = time.perf_counter()
+			trigrams = TrigramQuery.create(*query)
+			candidates = (filenames if trigrams == None else [ f for f in filenames if index.may_contain_file(f, trigrams) ])
+			indexed_hits = search_files(candidates, query)
+			t_index = time.perf_counter() - start
+
+			if(hits != indexed_hits): print("error: " + name + ": " + str(hits) + " hits without the index, " + str(indexed_hits) + " with it")
+			print("%-20s %11.3fs %11.3fs %12d %8d" % (name, t_scan, t_index, len(candidates), hits))
+
+if(__name__ == "__main__"):
+	run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILE_COUNT)
@@ -30,6 +30,9 @@ APP_MODE_PROJECT	= 2		# if ash is invoked with a single directory name
 # dictionary of settings for global access
 SETTINGS			= None
 
+# cache of file-metadata (see MetadataCache) for global access
+METADATA_CACHE		= None
+
 # minimum resolution required for ash
 MIN_WIDTH			= 102
 MIN_HEIGHT			= 22
@@ -47,5 +50,6 @@ APP_THEMES_DIR			= os.path.join(APP_DATA_DIR, "themes")
 LOG_FILE 				= os.path.join(APP_DATA_DIR, "log.txt")
 SESSION_FILE			= os.path.join(APP_DATA_DIR, "session.dat")
 SETTINGS_FILE			= os.path.join(APP_DATA_DIR, "settings.dat")
+METADATA_CACHE_FILE		= os.path.join(APP_DATA_DIR, "metadata.dat")
 INSTALLED_THEMES_FILE 	= os.path.join(APP_DATA_DIR, "installed_themes.txt")
 INSTALLED_KEYMAPS_FILE 	= os.path.join(APP_DATA_DIR, "installed_keymaps.txt")
\ No newline at end of file
@@ -11,14 +11,28 @@ from ash.core.logger import *
 from ash.gui.cursorPosition import *
 from ash.core.editHistory import *
 from ash.core.sessionStorage import *
+from ash.core.textStorage import *
+from ash.core.mappedTextStorage import *
+from ash.core.fileLoader import *
+from ash.core.fileSaver import *
+from ash.core.editJournal import *
+from ash.core.fileWatcher import *
+from ash.core.projectScanner import *
+from ash.core.metadataCache import *
+from ash.core.searchEngine import *
+from ash.core.searchSession import *
+from ash.core.trigramIndex import *
 from ash.formatting.syntaxHighlighting import *
 from ash.formatting.formatting import *
 
 import time
 
 LARGE_FILE_THRESHOLD	= 1024 * 1024		# large file if size > 1 MB
-BACKUP_FREQUENCY_SIZE	= 16				# backup after every 16 edits
+MAPPED_FILE_THRESHOLD	= 16 * 1024 * 1024	# memory-map the file (and load lines lazily) if size > 16 MB
+LOAD_REFRESH_INTERVAL	= 0.5				# minimum time (in seconds) between two screen-updates while loading
 HISTORY_FREQUENCY_SIZE	= 8					# undo: every 8 edit operations
+MAX_REPORTED_ERRORS		= 10				# files listed in the error-summary of a save-all
+REPLACE_MERGE_GAP		= 16				# replace-all: changed lines at most this far apart are replaced together
 
 # Buffer class: encapsulates a single buffer/file
 class Buffer:
@@ -27,6 +41,7 @@ class Buffer:
 		self.id = id
 		self.filename = normalized_path(filename)
 		self.encoding = encoding
+		self.newline = "\n"					# line-ending used when writing to disk, detected on read
 		self.editors = list()
 		self.display_name = None
 
@@ -37,24 +52,29 @@ class Buffer:
 
 		self.last_read_time = None
 		self.last_write_time = None
-		self.last_backup_time = None
+
+		self.lines = None
+		self.history = None
+		self.version = 0					# incremented on every change to the text
+		self.loader = None					# set while the file is being loaded in the background
+		self.last_load_refresh = 0
+		self.saver = None					# set while the file is being saved in the background
+		self.save_requested = False			# save again once the running save completes
+		self.journal = None					# crash-recovery journal: only for buffers with a file
+		self.recovering = False				# set while a file to be recovered from its journal is being loaded
+		self.watched_file = None			# the file registered with the buffer-manager's FileWatcher
 		
 		if(self.filename == None):
-			self.lines = list()
-			self.lines.append("")
+			self.set_lines([""])
 			self.save_status = False
-			self.backup_file = None
 			self.display_name = "untitled-" + str(self.id + 1)
 			self.formatter = SyntaxHighlighter(self.display_name)
 		else:
-			if(has_backup):
-				self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
-				self.read_file_from_disk(True)
-			else:
-				self.read_file_from_disk()			
+			self.journal = EditJournal(self.filename, self.on_journal_compacted)
+			self.read_file_from_disk(has_backup)
 			self.formatter = SyntaxHighlighter(self.filename)
 		
-		self.history = EditHistory(self.lines, CursorPosition(0,0))
+		self.history = EditHistory(CursorPosition(0,0))
 		if(self.encoding == None): self.encoding = "utf-8"
 
 	# set the text encoding for the buffer
@@ -77,50 +97,221 @@ class Buffer:
 	def has_file(self):
 		return (False if self.filename == None else True)
 
+	# replaces the text-storage of the buffer, and starts tracking changes made to it
+	def set_lines(self, lines):
+		if(not isinstance(lines, TextStorage)): lines = create_text_storage(lines)
+		if(self.lines != None):
+			self.wait_for_save()				# the saver may still be reading from the old storage
+			self.lines.remove_listener(self.on_lines_changed)
+			self.lines.close()
+		self.lines = lines
+		self.lines.add_listener(self.on_lines_changed)
+		self.version += 1
+
+	# called by the text-storage after every change: records it in the edit-history and the journal,
+	# and notifies the editors so that they reflow only the lines changed
+	def on_lines_changed(self, start, old_lines, new_lines):
+		self.version += 1
+		self.manager.index.update_buffer(self, new_lines)
+		for ed in self.editors:
+			ed.notify_lines_changed(start, len(old_lines), len(new_lines))
+		if(self.loader != None): return
+		if(self.history != None): self.history.record(start, old_lines, new_lines)
+		if(self.journal != None): self.journal.record(start, old_lines, new_lines)
+
+	# writes out the edits recorded in the journal, and compacts it once it grows too large;
+	# if sync is True, the journal is also flushed to the disk
+	def flush_journal(self, sync = False):
+		if(self.journal == None): return
+		self.journal.flush(sync)
+		if(self.journal.should_compact()): self.journal.compact(self.lines.snapshot())
+
+	# called from the journal's compactor thread
+	def on_journal_compacted(self, journal, compactor, error):
+		self.manager.app.post_event(journal.finish_compaction, compactor, error)
+
+	# replays the journal (left behind by a crash) onto the text read from disk
+	def recover_from_journal(self):
+		self.recovering = False
+		if(self.journal.replay(self.lines) > 0): self.save_status = False
+
+	# called from the indexer thread of a memory-mapped file
+	def on_index_progress(self, progress):
+		self.manager.app.post_event(self.update_index, progress)
+
+	# adds newly indexed lines of a memory-mapped file, and shows the progress
+	def update_index(self, progress):
+		if(not self.lines.is_lazy() or not self.lines.sync_index()): return
+		for ed in self.editors:
+			ed.notify_update()
+		if(progress < 1):
+			self.manager.app.progress_handler("Indexing " + get_file_title(self.filename) + "...", progress * 100)
+		else:
+			self.record_metadata()
+			self.manager.app.progress_handler("Ready", None)
+
+	# returns True if the file is still being loaded in the background (the buffer is read-only till then)
+	def is_loading(self):
+		return (self.loader != None)
+
+	# called from the loader thread: hands over a batch of lines to the main thread
+	def on_loader_batch(self, loader, lines, bytes_read):
+		self.manager.app.post_event(self.append_loaded_lines, loader, lines)
+
+	# called from the loader thread when it is done
+	def on_loader_finish(self, loader, last_line, error):
+		self.manager.app.post_event(self.finish_loading, loader, last_line, error)
+
+	# appends a batch of loaded lines before the last line, which holds the text yet to be completed
+	def append_loaded_lines(self, loader, lines):
+		if(loader != self.loader): return			# cancelled
+		n = len(self.lines)
+		self.lines.replace_lines(n-1, n-1, lines)
+		self.newline = loader.newline
+
+		now = time.time()
+		if(now - self.last_load_refresh < LOAD_REFRESH_INTERVAL): return
+		self.last_load_refresh = now
+		for ed in self.editors:
+			ed.notify_update()
+		self.manager.show_load_progress()
+
+	# completes the last line and makes the buffer editable
+	def finish_loading(self, loader, last_line, error):
+		if(loader != self.loader): return			# cancelled
+		n = len(self.lines)
+		self.lines[n-1] = last_line + self.lines[n-1]
+		self.newline = loader.newline
+		self.loader = None
+		self.last_read_time = time.time()
+		
+		if(error != None): 
+			self.detach_from_file(" (partial)")
+		else:
+			self.record_metadata()
+			if(self.recovering): self.recover_from_journal()
+		for ed in self.editors:
+			ed.notify_update()
+		self.manager.show_load_progress()
+		if(error != None): self.manager.app.show_error("error reading file: " + str(error))
+
+	# stops loading the file: the lines loaded so far are kept in an untitled buffer
+	def cancel_loading(self):
+		if(self.loader == None): return
+		self.loader.cancel()
+		self.loader = None
+		self.detach_from_file(" (partial)")
+		for ed in self.editors:
+			ed.notify_update()
+		self.manager.show_load_progress()
+
+	# remembers the encoding, line-count and line-ending of the file, as it is on disk (see MetadataCache)
+	def record_metadata(self):
+		if(ash.METADATA_CACHE == None or self.filename == None): return
+		ash.METADATA_CACHE.update(self.filename, False, self.encoding, len(self.lines), self.newline)
+
+	# returns True if the file is being saved in the background
+	def is_saving(self):
+		return (self.saver != None)
+
+	# called from the saver thread when it is done
+	def on_saver_finish(self, saver, error):
+		self.manager.app.post_event(self.finish_saving, saver, error)
+
+	# marks the buffer as saved (unless it was edited while saving) and starts any save requested meanwhile
+	def finish_saving(self, saver, error):
+		if(saver != self.saver): return
+		self.saver = None
+
+		if(error == None):
+			self.last_write_time = time.time()
+			if(self.last_read_time == None): self.last_read_time = self.last_write_time
+			if(self.version == saver.version): 
+				self.save_status = True
+				self.record_metadata()
+			
+			if(self.journal == None or self.journal.filename != self.filename):
+				if(self.journal != None): self.journal.discard()
+				self.journal = EditJournal(self.filename, self.on_journal_compacted)
+			self.journal.reset()
+			if(not self.save_status):
+				# the edits made while saving are not in the saved file: until the journal is rewritten
+				# with the whole text, it is marked as not applicable to any file
+				self.journal.base = None
+				self.journal.compact(self.lines.snapshot())
+
+			if(self.manager.app.app_mode != APP_MODE_PROJECT):
+				self.manager.app.session_storage.add_opened_file_to_record(self.filename)
+			self.watch_file()
+			self.manager.merge_if_required(self.id)
+
+		if(self.save_requested):
+			self.save_requested = False
+			self.write_to_disk()
+		elif(saver.batch == None):
+			self.manager.show_load_progress()
+		
+		# errors in a batch are reported together by the buffer-manager
+		if(error != None and saver.batch == None): self.manager.app.show_error("error saving file: " + str(error))
+
+	# blocks until the running save (and any save requested meanwhile) is complete
+	def wait_for_save(self):
+		while(self.saver != None):
+			saver = self.saver
+			saver.wait()
+			self.finish_saving(saver, saver.error)
+
+	# turns the buffer into an untitled one, so that an incomplete copy never overwrites its file
+	# (any journal is left on disk, as the file may still be recovered from it later)
+	def detach_from_file(self, suffix = ""):
+		if(self.filename == None): return
+		self.display_name = get_file_title(self.filename) + suffix
+		self.filename = None
+		self.journal = None
+		self.recovering = False
+		self.watch_file()
+
+	# closes the current undo-transaction
 	def add_change(self, curpos):
-		self.history.add_change(self.lines, curpos)
+		self.history.add_change(curpos)
 		self.undo_edit_count = 0
 		self.last_curpos = curpos
 
 	# revert the buffer to its previous state
 	def do_undo(self):
-		if(self.undo_edit_count > 0): 		# add the latest change forcefully
-			self.history.add_change(self.lines, self.last_curpos)
+		if(self.history.has_pending_changes()): 		# add the latest change forcefully
+			self.history.add_change(self.last_curpos)
 			self.undo_edit_count = 0
 
-		hdata = self.history.undo()
-		if(hdata == None):
+		curpos = self.history.undo(self.lines)
+		self.flush_journal()
+		if(curpos == None):
 			beep()
 		else:
-			self.lines = copy.copy(hdata.data)
 			for ed in self.editors:
-				ed.curpos = copy.copy(hdata.curpos)
+				ed.curpos = copy.copy(curpos)
 				ed.notify_update()
 
 	# revert the buffer to its previous state by cancelling the last do_undo() operation
 	def do_redo(self):
-		hdata = self.history.redo()
-		if(hdata == None):
+		curpos = self.history.redo(self.lines)
+		self.flush_journal()
+		if(curpos == None):
 			beep()
 		else:
-			self.lines = copy.copy(hdata.data)
 			for ed in self.editors:
-				ed.curpos = copy.copy(hdata.curpos)
+				ed.curpos = copy.copy(curpos)
 				ed.notify_update()
 
 	# keeps track of the number of edit operations performed on the buffer
 	# this is called after every edit by the editor
 	def update(self, curpos, caller):
 		self.save_status = False
-		
-		if(self.backup_file != None and self.backup_edit_count >= BACKUP_FREQUENCY_SIZE):
-			self.make_backup()
-			self.backup_edit_count = 0
-		else:
-			self.backup_edit_count += 1
+		self.backup_edit_count += 1
+		self.flush_journal()
 
 		if(self.undo_edit_count >= HISTORY_FREQUENCY_SIZE):
-			self.history.add_change(self.lines, curpos)
+			self.history.add_change(curpos)
 			self.undo_edit_count = 0
 		else:
 			self.undo_edit_count += 1
@@ -130,19 +321,15 @@ class Buffer:
 		
 		self.last_curpos = curpos
 		self.last_caller = caller
-		self.check_if_modified_externally()
 
 	# same as update() but forces the buffer to save changes to its edit-history,
-	# and to make a backup if desired
+	# and to flush the journal to the disk if desired
 	def major_update(self, curpos, caller, make_backup = False):
 		self.save_status = False
-		if(make_backup): 
-			self.make_backup()
-			self.backup_edit_count = 0
-		else:
-			self.backup_edit_count += 1
+		self.backup_edit_count += 1
+		self.flush_journal(make_backup)
 		
-		self.history.add_change(self.lines, curpos)
+		self.history.add_change(curpos)
 		self.undo_edit_count = 0
 		
 		for ed in self.editors:
@@ -150,63 +337,94 @@ class Buffer:
 
 		self.last_curpos = curpos
 		self.last_caller = caller
-		self.check_if_modified_externally()
 	
+	# called by the buffer-manager when the FileWatcher reports a change to the file
 	def check_if_modified_externally(self):
-		if(self.filename == None): return
+		if(self.filename == None or self.is_saving() or self.is_loading()): return
+		if(not os.path.isfile(self.filename)): return
 		last_time = max([self.last_read_time, self.last_write_time])
 		last_mod_time = BufferManager.get_last_modified(self.filename)
 		if(last_mod_time <= last_time): return
 		if(self.manager.app.ask_question("RELOAD", "File modified externally, reload?")):
 			self.reload_from_disk()
+			for ed in self.editors:
+				ed.notify_update()
 		else:
-			self.last_read_time = self.last_mod_time
+			self.last_read_time = last_mod_time
+
+	# registers the buffer's current file with the buffer-manager's FileWatcher
+	def watch_file(self):
+		if(self.watched_file == self.filename): return
+		if(self.watched_file != None): self.manager.watcher.unwatch(self.watched_file)
+		self.watched_file = self.filename
+		if(self.filename != None): self.manager.watcher.watch(self.filename)
+
+	# unregisters the buffer's file from the FileWatcher
+	def stop_watching(self):
+		if(self.watched_file != None): self.manager.watcher.unwatch(self.watched_file)
+		self.watched_file = None
 
 	def decode_unicode(self):
-		if(self.undo_edit_count > 0): 		# add the latest change forcefully
-			self.history.add_change(self.lines, self.last_curpos)
-			self.undo_edit_count = 0
+		self.add_change(self.last_curpos)		# keep the decoding as a separate undo-step
 
-		for index, line in enumerate(self.lines):
-			dec_line = get_unicode_encoded_line(line)
-			sub_lines = dec_line.splitlines()			# if they contained newlines
-			self.lines.pop(index)
-			for i in range(len(sub_lines)-1, -1, -1):
-				self.lines.insert(index, sub_lines[i])
-			self.encoding = "utf-8"
+		dec_lines = list()
+		for line in self.lines:
+			sub_lines = get_unicode_encoded_line(line).splitlines()		# if they contained newlines
+			dec_lines.extend(sub_lines if len(sub_lines) > 0 else [""])
+		self.lines.replace_lines(0, len(self.lines), dec_lines)
+		self.encoding = "utf-8"
+		self.add_change(self.last_curpos)
+		self.flush_journal()
 
 		for ed in self.editors:
 			ed.notify_update()
 	
 	# write out a copy
 	def write_a_copy(self, filename, encoding = "utf-8"):
-		textFile = codecs.open(filename, "w", encoding)
-		for line in self.lines:
-			textFile.write(line + "\n")
-		textFile.close()
-
-	# writes out the buffer to a file on disk
+		if(not self.lines.is_lazy()):
+			write_text_file(filename, self.lines, encoding, self.newline)
+			return
+		# a memory-mapped file is written through a FileSaver, which copies its untouched bytes as they are
+		saver = FileSaver(normalized_path(filename), self.lines.snapshot(), encoding, self.newline, None)
+		saver.error = self.get_replaced_bytes_error()
+		saver.write()
+		if(saver.error != None): raise(AshException("error writing file: " + str(saver.error)))
+
+	# writes out the buffer to a file on disk: a snapshot of the lines is saved in the background,
+	# and save_status is set by finish_saving() once the file has been replaced
 	def write_to_disk(self, filename = None):
+		saver = self.prepare_save(filename)
+		if(saver == None): return
+		saver.start()
+		self.manager.app.progress_handler("Saving " + get_file_title(self.filename) + "...", None)
+
+	# creates the FileSaver for write_to_disk(), without starting it; returns None if a save is
+	# already running (the buffer is then saved again once it completes)
+	def prepare_save(self, filename = None):
 		if(self.filename == None and filename == None): raise(AshException("Error 1: buffer.write_to_disk()"))
+		if(self.is_loading()): raise(AshException("Error 7: buffer.write_to_disk(): file is still being loaded"))
 		if(filename != None): self.filename = normalized_path(filename)		# update filename even if filename has changed
 		
 		self.formatter = SyntaxHighlighter(self.filename)
 		self.display_name = None
 
-		self.write_a_copy(self.filename, self.encoding)
-		
-		self.last_write_time = time.time()
-		if(self.last_read_time == None): self.last_read_time = self.last_write_time
-
-		self.save_status = True
-		self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
-
 		self.backup_edit_count = 0
 		self.undo_edit_count = 0
-		if(self.manager.app.app_mode != APP_MODE_PROJECT): 
-			self.manager.app.session_storage.add_opened_file_to_record(self.filename)
 
-		return self.manager.merge_if_required(self.id)
+		if(self.is_saving()):
+			self.save_requested = True
+			return None
+		
+		self.saver = FileSaver(self.filename, self.lines.snapshot(), self.encoding, self.newline, self.on_saver_finish)
+		self.saver.version = self.version
+		self.saver.error = self.get_replaced_bytes_error()
+		return self.saver
+
+	# returns the error with which saving a memory-mapped file fails once edited lines of it had
+	# bytes not valid in its encoding (they hold U+FFFD in their place), or None
+	def get_replaced_bytes_error(self):
+		if(not self.lines.is_lazy() or not self.lines.replaced_bytes): return None
+		return AshException("edited lines had bytes which are not valid " + str(self.encoding) + " and have been replaced: the file cannot be saved without losing them")
 
 	# checks to see if the buffer contains no data
 	def is_empty(self):
@@ -215,10 +433,62 @@ class Buffer:
 		else:
 			return False
 
-	# returns the number of non-empty lines in the buffer
+	# <------------------- range-based text access ---------------------->
+
+	# returns the number of lines in the buffer
+	def get_line_count(self):
+		return len(self.lines)
+
+	# returns a single line
+	def get_line(self, index):
+		return self.lines.get_line(index)
+
+	# returns the lines in [start, end) as a list
+	def get_lines(self, start, end):
+		return self.lines.get_lines(start, end)
+
+	# returns the text between two cursor positions (end is exclusive)
+	def get_text(self, start, end):
+		if(start.y == end.y): return self.lines.get_line(start.y)[start.x:end.x]
+		lines = self.lines.get_lines(start.y, end.y + 1)
+		lines[0] = lines[0][start.x:]
+		lines[-1] = lines[-1][0:end.x]
+		return "\n".join(lines)
+
+	# inserts text (which may contain newlines) at a given position;
+	# returns the position immediately after the inserted text
+	def insert_text(self, pos, text):
+		line = self.lines.get_line(pos.y)
+		left = line[0:pos.x]
+		right = line[pos.x:]
+		new_lines = text.split("\n")
+		end = CursorPosition(pos.y + len(new_lines) - 1, len(new_lines[-1]))
+		if(len(new_lines) == 1): end.x += pos.x
+		new_lines[0] = left + new_lines[0]
+		new_lines[-1] += right
+		self.lines.replace_lines(pos.y, pos.y + 1, new_lines)
+		return end
+
+	# deletes the text between two cursor positions (end is exclusive);
+	# returns the deleted text
+	def delete_text(self, start, end):
+		deleted = self.get_text(start, end)
+		first = self.lines.get_line(start.y)
+		last = (first if start.y == end.y else self.lines.get_line(end.y))
+		self.lines.replace_lines(start.y, end.y + 1, [ first[0:start.x] + last[end.x:] ])
+		return deleted
+
+	# replaces the text between two cursor positions with new text;
+	# returns the position immediately after the new text
+	def replace_text(self, start, end, text):
+		self.delete_text(start, end)
+		return self.insert_text(start, text)
+
+	# returns the number of non-empty lines in the buffer (None if counting requires loading the whole file)
 	def get_loc(self):
 		nlines = len(self.lines)
 		sloc = 0
+		if(self.lines.is_lazy()): return (nlines, None)
 		
 		for x in self.lines:
 			if(len(x.strip()) == 0):
@@ -230,7 +500,9 @@ class Buffer:
 	def reload_from_disk(self):
 		if(self.filename != None):
 			self.read_file_from_disk()
+			self.journal.reset()		# the unsaved edits are deliberately discarded
 			self.display_name = None
+			self.history = EditHistory(CursorPosition(0,0))		# old edits no longer apply to the new text
 
 	# returns the size of the assigned file
 	def get_file_size(self):
@@ -255,25 +527,32 @@ class Buffer:
 		if(self.is_empty()): return True
 		return False
 	
-	# removes any backup files if they exist, called when user deliberately discards unsaved changes
+	# removes the journal (if any), called when user deliberately discards unsaved changes
 	def destroy(self):
-		if(self.backup_file != None and os.path.isfile(self.backup_file)): 
-			os.remove(self.backup_file)
+		self.wait_for_save()
+		self.stop_watching()
+		if(self.is_loading()):
+			self.loader.cancel()
+			return						# the journal was never replayed: leave it in place
+		if(self.journal != None): self.journal.discard()
 
 	def get_persistent_data(self):
-		return ProjectBufferData(self.filename, self.backup_edit_count, self.undo_edit_count, self.history, max([self.last_read_time, self.last_write_time]))
+		# the edit-history is only valid against the text on disk, so it is discarded for unsaved buffers
+		if(self.save_status):
+			self.history.add_change(self.last_curpos)
+			history = self.history
+		else:
+			history = None
+		return ProjectBufferData(self.filename, self.backup_edit_count, self.undo_edit_count, history, max([self.last_read_time, self.last_write_time]))
 		
 	# <------------------- private functions ---------------------->
 
-	# makes a backup of the data
-	def make_backup(self):
-		if(self.backup_file == None): return
-		self.write_a_copy(self.backup_file, self.encoding)
-		self.last_backup_time = time.time()
-
-	# reads data from the assigned file on disk; optionally from a backup file instead
-	def read_file_from_disk(self, read_from_backup = False):
-		filename = (self.backup_file if read_from_backup else self.filename)
+	# reads data from the assigned file on disk; optionally recovers unsaved edits from its journal
+	def read_file_from_disk(self, recover = False):
+		filename = self.filename
+		if(self.loader != None):
+			self.loader.cancel()
+			self.loader = None
 
 		if(self.manager.is_binary(filename)): raise(AshException("Error: buffer: attempting to read binary file"))
 
@@ -282,17 +561,18 @@ class Buffer:
 			textFile.close()
 
 		try:
-			if(int(os.stat(filename).st_size) > LARGE_FILE_THRESHOLD):
-				self.lines = self.manager.app.load_file(filename, self.encoding)
-				if(self.lines == None): raise(AshFileReadAbortedException(filename))
+			file_size = int(os.stat(filename).st_size)
+			if(file_size > MAPPED_FILE_THRESHOLD and MappedTextStorage.supports_encoding(self.encoding)):
+				lines = MappedTextStorage(filename, self.encoding)
+				lines.start_indexing(self.on_index_progress)
+				self.newline = lines.newline
+			elif(file_size > LARGE_FILE_THRESHOLD):
+				lines = [""]
+				self.loader = FileLoader(filename, self.encoding, self.on_loader_batch, self.on_loader_finish)
 			else:
-				self.lines = list()
-				textFile = codecs.open(filename, "r", self.encoding)
-				data  = " "
-				while(len(data) > 0):
-					data = textFile.readline()
-					self.lines.append(data[:-1])
-				textFile.close()
+				lines, self.newline = read_text_file(filename, self.encoding)
+			self.set_lines(lines)
+			if(not self.lines.is_lazy() and self.loader == None): self.record_metadata()
 
 			self.last_read_time = time.time()
 			if(self.last_write_time == None): self.last_write_time = self.last_read_time
@@ -301,86 +581,110 @@ class Buffer:
 		except:			
 			raise(AshException("error reading file: " + filename))
 
-		if(not read_from_backup): 
-			self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
-			self.save_status = True
-		else:
-			self.save_status = False
-
+		self.save_status = True
 		self.backup_edit_count = 0
 		self.undo_edit_count = 0
+
+		if(not recover):
+			self.journal.start()
+		elif(self.loader != None):
+			self.recovering = True				# replayed once the file is loaded
+		else:
+			self.recover_from_journal()
 		
-		if(not read_from_backup and self.manager.app.app_mode != APP_MODE_PROJECT): 
+		if(self.manager.app.app_mode != APP_MODE_PROJECT): 
 			self.manager.app.session_storage.add_opened_file_to_record(self.filename)
+		self.watch_file()
+		if(self.loader != None): self.loader.start()
 		return 0
 
 	# splits the raw-data (read from a file) into separate lines
 	def render_data_to_lines(self, text):
-		self.lines = list()
-		if(len(text) == 0):
-			self.lines.append("")
-		else:
-			lines = text.splitlines()
-			for line in lines:
-				self.lines.append(line)
-			if(text.endswith("\n")): self.lines.append("")
+		self.newline = detect_line_ending(text)
+		self.set_lines(split_into_lines(text, self.newline))
 
 	def find_all(self, search_text, match_case, whole_words, is_regex):
-		# return a list of tuples(line_index, pos)
-		search_results = list()
-		for line_index, line in enumerate(self.lines):
-			lower_text = line.lower()
-			lower_stext = search_text.lower()
-			
-			corpus = (line if match_case else lower_text)
-			
-			if(is_regex or match_case):
-				search = search_text
-			else:
-				search = lower_stext
-
-			pos = -1
-			while(True):
-				if(is_regex):
-					pos = find_regex(corpus[pos+1:], search)
-				elif(whole_words):
-					pos = find_whole_word(corpus[pos+1:], search)
-				else:
-					pos = corpus.find(search, pos+1)
+		return Buffer.find_in_lines(self.lines, search_text, match_case, whole_words, is_regex)
 
-				if(pos >= 0):
-					search_results.append( (line_index, pos) )
-				else:
-					break
-		return search_results
+	# searches a list of lines (see SearchPattern): returns a list of tuples(line_index, col, length)
+	@staticmethod
+	def find_in_lines(lines, search_text, match_case, whole_words, is_regex):
+		return get_search_pattern(search_text, match_case, whole_words, is_regex).find_all(lines)
+
+	# replaces the matches found by find_all() (see replace_matches()) as a single undoable edit; each
+	# affected line is rebuilt once, and lines close to each other are replaced together, from the last
+	# to the first (so that the positions of the ones yet to be replaced remain valid even if lines are
+	# split); returns the number of matches replaced; raises re.error if replace_text is invalid
+	def replace_all(self, search_result, replace_text, pattern = None):
+		changed, count = replace_matches(self.lines, search_result, replace_text, pattern)
+		if(count == 0): return 0
+		if(self.history.has_pending_changes()): self.add_change(self.last_curpos)		# (keeps the edits before apart)
+
+		runs = list()
+		for line_index, new_line in changed:
+			if(len(runs) > 0 and line_index - runs[-1][1] <= REPLACE_MERGE_GAP):
+				runs[-1][2].extend(self.lines[runs[-1][1]:line_index])
+			else:
+				runs.append( [line_index, line_index, list()] )
+			runs[-1][1] = line_index + 1
+			runs[-1][2].extend(new_line.split("\n"))
+		for start, end, new_lines in reversed(runs):
+			self.lines.replace_lines(start, end, new_lines)
 
-	def replace_all(self, search_result, length, replace_text):
-		count = 0
-		for result in search_result:
-			line_index = result[0]
-			pos = result[1]
-			data = self.lines[line_index]
-			self.lines[line_index] = data[0:pos] + replace_text + data[pos+length:]
-			self.save_status = False
-			count += 1
 		self.major_update(self.last_curpos, None, True)
 		return count
 
+# BufferStub class: a file of a project which is known but not yet read; it is turned into a
+# Buffer (see BufferManager.materialize()) when it is opened, searched or restored from a session
+class BufferStub:
+	def __init__(self, filename):
+		self.filename = filename
+		st = os.stat(filename)
+		self.size = int(st.st_size)
+		self.mtime = st.st_mtime
+		self.encoding = None				# predicted when first needed
+		self.scanned = False				# set once the ProjectScanner has found it to be a text file
+
+	# returns the predicted encoding of the file
+	def get_encoding(self):
+		if(self.encoding == None): self.encoding = BufferManager.predict_encoding(self.filename)
+		return self.encoding
+
+	# searches the file on disk (without creating a buffer): returns a list of tuples(line_index, col, length)
+	def find_all(self, search_text, match_case, whole_words, is_regex):
+		if(not self.scanned and BufferManager.is_binary(self.filename)): return list()
+		try:
+			lines, newline = read_text_file(self.filename, self.get_encoding())
+		except (OSError, UnicodeError, LookupError):
+			return list()
+		return Buffer.find_in_lines(lines, search_text, match_case, whole_words, is_regex)
+
 # Buffer Manager class: for keeping track of the list of all active buffers
 class BufferManager:
 	def __init__(self, app):
 		self.app = app
 		self.buffers = dict()
 		self.buffer_count = 0
+		self.stubs = dict()					# filename -> BufferStub, for project files not yet read
+		self.scanner = None					# set while the stubs are being classified in the background
+		self.index = TrigramIndex()			# narrows down project-wide searches
+		self.indexer = None					# set while the stubs are being indexed in the background
+		self.replacer = None				# set while files on disk are being rewritten by replace_all()
+		self.workers = WorkerPool()			# the worker processes shared by all of these scans and by searches
+		self.save_batches = list()			# SaveBatches started by write_all() which have not yet been reported
+		self.watcher = FileWatcher(self.on_file_changed)
 	
 	# creates a new buffer: either blank or from a file on disk
 	def create_new_buffer(self, filename = None, encoding = None, has_backup = False):
 		if(self.does_file_have_its_own_buffer(filename)): raise(AshException("Error 5: buffermanager.create_new_buffer()"))
+		stub = self.stubs.pop(filename, None)
+		if(stub != None): self.index.remove_file(filename)
+		if(encoding == None and stub != None): encoding = stub.encoding
 		if(encoding == None):
 			if(filename == None or not os.path.isfile(filename)):
 				encoding = "utf-8"
 			else:
-				encoding = predict_file_encoding(filename)
+				encoding = BufferManager.predict_encoding(filename)
 		try:
 			self.buffers[self.buffer_count] = Buffer(self, self.buffer_count, filename, encoding, has_backup)
 			self.buffer_count += 1
@@ -389,6 +693,102 @@ class BufferManager:
 			self.buffers[self.buffer_count] = None
 			return (None, None)
 
+	# registers a file (of a project) to be read only when needed; files which are
+	# evidently binary (from their names) are left out
+	def add_stub(self, filename):
+		if(filename in self.stubs or self.does_file_have_its_own_buffer(filename)): return None
+		if(BufferManager.is_binary(filename, False)): return None
+		stub = BufferStub(filename)
+		self.stubs[filename] = stub
+		return stub
+
+	# classifies all the stubbed files in the background (see ProjectScanner):
+	# binary files are dropped, and the encodings of the others predicted
+	# (files unchanged since they were last classified are not scanned again)
+	def scan_stubs(self):
+		if(self.scanner != None): self.scanner.cancel()
+		filenames = list()
+		for filename, stub in list(self.stubs.items()):
+			meta = (None if ash.METADATA_CACHE == None else ash.METADATA_CACHE.get(filename))
+			if(meta == None or meta.binary == None or (not meta.binary and meta.encoding == None)):
+				filenames.append(filename)
+			elif(meta.binary):
+				del self.stubs[filename]
+			else:
+				stub.encoding = meta.encoding
+				stub.scanned = True
+		self.scanner = ProjectScanner(filenames, self.on_scan_results, self.on_scan_finish, scan_file, self.workers)
+		self.scanner.start()
+		self.show_load_progress()
+
+	# called from the scanner thread
+	def on_scan_results(self, scanner, results, done):
+		self.app.post_event(self.apply_scan_results, scanner, results)
+
+	def on_scan_finish(self, scanner):
+		self.app.post_event(self.finish_scan, scanner)
+
+	# updates the stubs with a batch of results from the scanner
+	def apply_scan_results(self, scanner, results):
+		if(scanner != self.scanner): return
+		for filename, (binary, encoding) in results:
+			stub = self.stubs.get(filename)
+			if(stub == None): continue
+			if(ash.METADATA_CACHE != None): ash.METADATA_CACHE.update(filename, binary, encoding)
+			if(binary):
+				del self.stubs[filename]
+			else:
+				stub.encoding = encoding
+				stub.scanned = True
+		self.show_load_progress()
+
+	def finish_scan(self, scanner):
+		if(scanner != self.scanner): return
+		self.scanner = None
+		if(ash.METADATA_CACHE != None): ash.METADATA_CACHE.save()
+		self.show_load_progress()
+		self.index_stubs()
+
+	# indexes the trigrams of the stubbed text files in the background (see TrigramIndex); files
+	# indexed earlier are indexed again only if they have changed since
+	def index_stubs(self):
+		if(self.indexer != None): self.indexer.cancel()
+		items = [ (filename, stub.encoding, self.index.get_file_version(filename)) for filename, stub in self.stubs.items() if stub.encoding != None ]
+		self.indexer = ProjectScanner(items, self.on_index_results, self.on_index_finish, index_file, self.workers)
+		self.indexer.start()
+
+	# brings the index up to date with the files on disk, unless the project is still being scanned or indexed
+	def refresh_index(self):
+		if(self.scanner == None and self.indexer == None): self.index_stubs()
+
+	# called from the indexer thread
+	def on_index_results(self, indexer, results, done):
+		self.app.post_event(self.apply_index_results, indexer, results)
+
+	def on_index_finish(self, indexer):
+		self.app.post_event(self.finish_indexing, indexer)
+
+	def apply_index_results(self, indexer, results):
+		if(indexer != self.indexer): return
+		for item, result in results:
+			if(item[0] in self.stubs): self.index.set_file(item[0], result)
+
+	def finish_indexing(self, indexer):
+		if(indexer == self.indexer): self.indexer = None
+
+	# returns the stub of a file which has not yet been read
+	def get_stub(self, filename):
+		return self.stubs.get(filename)
+
+	# reads a stubbed file into a buffer; returns tuple(buffer-ID, buffer), or (None, None) if it cannot be read
+	def materialize(self, filename):
+		stub = self.stubs.get(filename)
+		if(stub == None): return (None, None)
+		if(BufferManager.is_binary(filename)):
+			del self.stubs[filename]
+			return (None, None)
+		return self.create_new_buffer(filename, stub.get_encoding(), BufferManager.backup_exists(filename))
+
 	# creates a new buffer: either blank or from a file on disk
 	def create_new_buffer_from_data(self, data):
 		self.buffers[self.buffer_count] = Buffer(self, self.buffer_count, None, "utf-8", False)
@@ -467,23 +867,117 @@ class BufferManager:
 	def write_all_wherever_possible(self):
 		return self.write_all(True)
 						
-	# writes all buffers to disk
+	# writes all buffers to disk, concurrently in the background (see SaveBatch);
+	# returns the number of buffers which could not be saved as they have no file
 	def write_all(self, ignore_errors=False):
 		counter=0
+		savers = list()
 		for bid, buffer in self.buffers.items():
+			if(buffer.is_loading()): continue
 			if(not buffer.save_status):
 				if(buffer.filename == None):
 					counter += 1
 					if(not ignore_errors): 
 						raise(AshException("Error 4: buffermanager.write_all()"))
 				else:
-					buffer.write_to_disk()
+					saver = buffer.prepare_save()
+					if(saver != None): savers.append(saver)
+		
+		if(len(savers) > 0):
+			batch = SaveBatch(savers, self.on_save_all_progress, self.on_save_all_finish)
+			self.save_batches.append(batch)
+			batch.start()
+			self.show_save_all_progress(0, len(savers))
 		return counter
 
+	# called from the FileWatcher thread
+	def on_file_changed(self, filename):
+		self.app.post_event(self.check_if_modified_externally, filename)
+
+	# asks to reload a file changed outside the editor
+	def check_if_modified_externally(self, filename):
+		buffer = self.get_buffer_by_filename(filename)
+		if(buffer != None): buffer.check_if_modified_externally()
+
+	# called from the worker threads of a SaveBatch
+	def on_save_all_progress(self, done, total):
+		self.app.post_event(self.show_save_all_progress, done, total)
+
+	def on_save_all_finish(self, batch):
+		self.app.post_event(self.finish_save_all, batch)
+
+	# shows the combined progress of a SaveBatch in the status bar
+	def show_save_all_progress(self, done, total):
+		if(done >= total): return			# finish_save_all() restores the status bar
+		self.app.progress_handler("Saving " + str(done) + "/" + str(total) + " file(s)...", (done / total) * 100)
+
+	# reports all the files of a SaveBatch which could not be saved in a single message
+	def finish_save_all(self, batch):
+		if(batch not in self.save_batches): return
+		self.save_batches.remove(batch)
+		self.show_load_progress()
+
+		failed = batch.get_failed()
+		if(len(failed) == 0): return
+		msg = str(len(failed)) + " file(s) could not be saved:"
+		for saver in failed[0:MAX_REPORTED_ERRORS]:
+			msg += "\n" + get_file_title(saver.filename) + ": " + str(saver.error)
+		if(len(failed) > MAX_REPORTED_ERRORS): msg += "\n(and " + str(len(failed) - MAX_REPORTED_ERRORS) + " more)"
+		self.app.show_error(msg)
+
+	# returns the list of buffers being loaded in the background
+	def get_loading_buffers(self):
+		return [ buffer for bid, buffer in self.buffers.items() if buffer != None and buffer.is_loading() ]
+
+	# shows the combined progress of all background loads in the status bar
+	def show_load_progress(self):
+		loading = self.get_loading_buffers()
+		if(len(loading) == 0 and self.scanner != None):
+			self.app.progress_handler("Scanning " + str(len(self.scanner.items)) + " file(s)...", self.scanner.get_progress() * 100)
+			return
+		if(len(loading) == 0):
+			self.app.progress_handler("Ready", None)
+			return
+		total = sum([ b.loader.total_size for b in loading ])
+		done = sum([ b.loader.bytes_read for b in loading ])
+		progress = (100 if total == 0 else (done / total) * 100)
+		self.app.progress_handler("Loading " + str(len(loading)) + " file(s)... [" + KeyBindings.get_keyname("CANCEL_OPERATION") + ": cancel]", progress)
+
+	# blocks until all background saves are complete; returns the number of files which could not be saved
+	def wait_for_saves(self):
+		batches = list(self.save_batches)
+		for batch in batches:
+			batch.wait()
+		
+		failed = 0
+		for bid, buffer in list(self.buffers.items()):
+			saver = buffer.saver
+			buffer.wait_for_save()
+			if(saver != None and saver.batch == None and saver.error != None): failed += 1
+		
+		for batch in batches:
+			failed += len(batch.get_failed())
+			self.finish_save_all(batch)
+		return failed
+
+	# cancels all background loads
+	def cancel_all_loading(self):
+		for buffer in self.get_loading_buffers():
+			buffer.cancel_loading()
+
 	# destroy all buffers, reset counter
 	def destroy(self):
+		if(self.scanner != None): self.scanner.cancel()
+		if(self.indexer != None): self.indexer.cancel()
+		if(self.replacer != None): self.replacer.cancel()		# (each file is either rewritten entirely or not at all)
+		self.scanner = None
+		self.indexer = None
+		self.replacer = None
 		for bid, buffer in self.buffers.items():
 			buffer.destroy()
+			self.index.remove_buffer(bid)
+		self.watcher.stop()
+		self.workers.shutdown()
 
 		self.buffer_count = 0
 		self.buffers = dict()
@@ -515,7 +1009,9 @@ class BufferManager:
 			# attach the editors
 			parent_buffer.editors.extend(self.buffers[mid].editors)
 			# delete the buffer
+			self.buffers[mid].stop_watching()
 			del self.buffers[mid]
+			self.index.remove_buffer(mid)
 
 		return True
 
@@ -526,23 +1022,75 @@ class BufferManager:
 			buffer_list.append( (bid, buffer.save_status, buffer.get_name()) )
 		return buffer_list
 
+	# searches all buffers; stubbed files are searched on disk, and read into buffers only if they match
+	# (see SearchSession, which also serves live searches)
 	def find_all(self, search_text, match_case, whole_words, is_regex):
-		search_results = dict()
-		for bid, buffer in self.buffers.items():
-			search_results[bid] = buffer.find_all(search_text, match_case, whole_words, is_regex)
-		return search_results
-
-	def replace_all(self, search_text, replace_text, match_case, whole_words, is_regex):
-		search_results = self.find_all(search_text, search_text, match_case, whole_words, is_regex)
+		return SearchSession(self).find_all(search_text, match_case, whole_words, is_regex)
+
+	# replaces all matches in the buffers, each as an undoable edit, and in the given files on disk
+	# (tuples(filename, encoding); the stubbed files by default), which are rewritten in the background
+	# on a worker pool (see replace_in_file()) and summed up once done (the editor's own journals and
+	# temporary files among them are left untouched); returns tuple(count, buffer-count)
+	# of the replacements made in the buffers; raises re.error if replace_text is invalid
+	def replace_all(self, search_text, replace_text, match_case, whole_words, is_regex, files = None):
+		query = (search_text, bool(match_case), bool(whole_words), bool(is_regex))
+		pattern = get_search_pattern(*query)
+		pattern.check_replacement(replace_text)
 		count = 0
 		buffer_count = 0
 		for bid, buffer in self.buffers.items():
-			info = search_results.get(bid)
-			if(info != None): 
-				x = buffer.replace_all(info, len(search_text), replace_text)
-				count += x
-				if(x > 0): buffer_count += 1
-		return(count, buffer_count)
+			if(buffer == None or buffer.is_loading()): continue
+			x = buffer.replace_all(pattern.find_all(buffer.lines), replace_text, pattern)
+			count += x
+			if(x > 0): buffer_count += 1
+
+		if(files == None): files = [ (filename, stub.encoding) for filename, stub in self.stubs.items() ]
+		files = [ (filename, encoding) for filename, encoding in files if not is_editor_file(filename) ]
+		trigrams = (TrigramQuery.create(*query) if pattern.is_valid() else None)
+		items = [ ("r", filename, encoding, query, replace_text) for filename, encoding in files if trigrams == None or self.index.may_contain_file(filename, trigrams) ]
+		if(pattern.is_valid() and len(items) > 0):
+			if(self.replacer != None): self.replacer.cancel()
+			self.replacer = ProjectScanner(items, self.on_replace_results, self.on_replace_finish, replace_in_file, self.workers)
+			self.replacer.summary = list()			# tuples(filename, count, error) of the files with matches
+			self.replacer.start()
+			self.show_replace_progress()
+		return (count, buffer_count)
+
+	# called from the replacer thread
+	def on_replace_results(self, replacer, results, done):
+		self.app.post_event(self.apply_replace_results, replacer, results)
+
+	def on_replace_finish(self, replacer):
+		self.app.post_event(self.finish_replace, replacer)
+
+	def apply_replace_results(self, replacer, results):
+		if(replacer != self.replacer): return
+		for item, (count, error) in results:
+			if(count > 0): self.index.remove_file(item[1])			# (its trigrams have changed)
+			if(count > 0 or error != None): replacer.summary.append( (item[1], count, error) )
+		self.show_replace_progress()
+
+	def show_replace_progress(self):
+		self.app.progress_handler("Replacing in " + str(len(self.replacer.items)) + " file(s)...", self.replacer.get_progress() * 100)
+
+	# reports the files rewritten (and those which could not be) in a single message
+	def finish_replace(self, replacer):
+		if(replacer != self.replacer): return
+		self.replacer = None
+		self.show_load_progress()
+
+		rewritten = [ (filename, count) for filename, count, error in replacer.summary if error == None ]
+		failed = [ (filename, error) for filename, count, error in replacer.summary if error != None ]
+		msg = str(sum([ count for filename, count in rewritten ])) + " occurrences were replaced in " + str(len(rewritten)) + " file(s) on disk"
+		for filename, count in rewritten[0:MAX_REPORTED_ERRORS]:
+			msg += "\n" + get_file_title(filename) + ": " + str(count)
+		if(len(rewritten) > MAX_REPORTED_ERRORS): msg += "\n(and " + str(len(rewritten) - MAX_REPORTED_ERRORS) + " more)"
+		if(len(failed) > 0):
+			msg += "\n" + str(len(failed)) + " file(s) could not be rewritten:"
+			for filename, error in failed[0:MAX_REPORTED_ERRORS]:
+				msg += "\n" + get_file_title(filename) + ": " + error
+			if(len(failed) > MAX_REPORTED_ERRORS): msg += "\n(and " + str(len(failed) - MAX_REPORTED_ERRORS) + " more)"
+		self.app.show_error(msg, len(failed) > 0)
 
 	def get_persistent_data(self, project_dir):
 		pdata = list()
@@ -555,38 +1103,48 @@ class BufferManager:
 		for buffer_data in buffer_data_list:
 			filename = buffer_data.filename
 			buffer = self.get_buffer_by_filename(filename)
+			if(buffer == None):
+				# a file with no buffer is read only if it has an edit-history to restore
+				history = buffer_data.history
+				if(history == None or len(getattr(history, "undo_stack", [])) == 0): continue
+				bid, buffer = self.materialize(filename)
+				if(buffer == None): continue
 
 			last_mod_time = BufferManager.get_last_modified(filename)
 			if(last_mod_time > buffer_data.last_write_time): continue			# ignore undo history since file modified externally
 
 			buffer.backup_edit_count = buffer_data.backup_edit_count
 			buffer.undo_edit_count = buffer_data.undo_edit_count
-			buffer.history = buffer_data.history
+			if(buffer_data.history != None): buffer.history = buffer_data.history
 
-	# checks to see if a backup file for a given filename exists
-	# backup files start with a ".ash.b-" prefix and reside in the same directory as its
-	# parent file
+	# checks to see if a given file has unsaved edits which can be recovered from its journal
+	# (see EditJournal)
 	@staticmethod
 	def backup_exists(filename):
-		if(os.path.isfile(os.path.dirname(filename) + "/.ash.b-" + get_file_title(filename))):
-			return True
-		else:
-			return False
+		return EditJournal.exists(filename)
 
-	# checks to see if a specified file is a text file
+	# checks to see if a specified file is a text file; if sniff is False, files whose type
+	# cannot be told from their names are assumed to be text (without reading them)
 	@staticmethod
-	def is_binary(filename):
-		if(not os.path.isfile(filename)): return True
-		mt = str(mimetypes.guess_type(filename, strict=False)[0]).lower()
-		if(mt.startswith("text/")):
-			return False
-		elif(mt != "none"):
-			return True
-		else:
-			pf = predict_file_encoding(filename)
-			if(pf == None): return True
-			if(str(pf).lower() not in SUPPORTED_ENCODINGS): return True
-			return False
+	def is_binary(filename, sniff = True):
+		cache = ash.METADATA_CACHE
+		meta = (None if cache == None else cache.get(filename))
+		if(meta != None and meta.binary != None): return meta.binary
+
+		binary, encoding = classify_file(filename, sniff)
+		if(cache != None and sniff): cache.update(filename, binary, encoding)		# not sniffing may be inconclusive
+		return binary
+
+	# predicts the encoding of a file, from the metadata-cache if the file is unchanged
+	@staticmethod
+	def predict_encoding(filename):
+		cache = ash.METADATA_CACHE
+		meta = (None if cache == None else cache.get(filename))
+		if(meta != None and meta.encoding != None): return meta.encoding
+
+		encoding = predict_file_encoding(filename)
+		if(cache != None and encoding != None): cache.update(filename, encoding = encoding)
+		return encoding
 
 	# find the modified time of a file
 	@staticmethod
@@ -7,107 +7,129 @@
 
 from ash.core import *
 
-# define the maximum size of the history to be stored (in bytes)
-MAX_HISTORY_SIZE	=	65536
-
-# HistoricalData class: encapsulates an editor-state containing:
-# (1) data	(2) cursor-position
-class HistoricalData:
-	def __init__(self, data, curpos):
-		self.data = copy.copy(data)
-		self.curpos = copy.copy(curpos)
+# define the maximum size of the history to be stored (in characters of changed text)
+MAX_HISTORY_SIZE	=	4 * 1024 * 1024
+
+# EditOperation class: records a single line-range replacement: lines [start, start+len(old_lines))
+# were replaced by new_lines; undo/redo simply swap the two
+class EditOperation:
+	def __init__(self, start, old_lines, new_lines):
+		self.start = start
+		self.old_lines = old_lines
+		self.new_lines = new_lines
+
+	# applies the operation on a storage object
+	def apply(self, lines):
+		lines.replace_lines(self.start, self.start + len(self.old_lines), self.new_lines)
+
+	# reverts the operation on a storage object
+	def revert(self, lines):
+		lines.replace_lines(self.start, self.start + len(self.new_lines), self.old_lines)
+
+	# merges a following edit on the same single line into this one (used while typing)
+	def merge(self, start, old_lines, new_lines):
+		if(start != self.start or len(self.new_lines) != 1 or len(old_lines) != 1 or len(new_lines) != 1): return False
+		self.new_lines = new_lines
+		return True
 
 	def size(self):
-		return sys.getsizeof(self.data)
-
-# StackNode class: implements a node in a linked-stack
-class StackNode:
-	def __init__(self, data, link = None, parent = None):
-		self.data = data
-		self.link = link
-		self.parent = parent
-
-# Stack class: implements a standard linked-stack with drop feature (to drop one or more nodes)
-class Stack:
-	def __init__(self):
-		self.top = None
+		return sum([ len(x) for x in self.old_lines ]) + sum([ len(x) for x in self.new_lines ]) + 1
+
+# Transaction class: a group of edit operations which are undone/redone together, along with
+# the cursor-positions before and after the group
+class Transaction:
+	def __init__(self, curpos_before):
+		self.operations = list()
+		self.curpos_before = copy.copy(curpos_before)
+		self.curpos_after = copy.copy(curpos_before)
 		self.__size = 0
 
-	# pushes data onto the stack
-	def push(self, hdata):
-		temp = StackNode(hdata, self.top, None)
-		if(self.top != None): self.top.parent = temp
-		self.top = temp
-		self.__size += 1
-
-	# pops the most recently pushed data from the stack
-	def pop(self):
-		if(self.__size == 0):
-			return None
-		else:
-			data = self.top.data
-			self.top = self.top.link
-			if(self.top != None): self.top.parent = None
-			self.__size -= 1
-			return data
-
-	# returns the number of items in the stack
-	def length(self):
-		return self.__size
+	def add(self, start, old_lines, new_lines):
+		if(len(self.operations) > 0):
+			last = self.operations[-1]
+			old_size = last.size()
+			if(last.merge(start, old_lines, new_lines)):
+				self.__size += last.size() - old_size
+				return
+		op = EditOperation(start, old_lines, new_lines)
+		self.operations.append(op)
+		self.__size += op.size()
+
+	def is_empty(self):
+		return (len(self.operations) == 0)
+
+	def undo(self, lines):
+		for op in reversed(self.operations):
+			op.revert(lines)
+
+	def redo(self, lines):
+		for op in self.operations:
+			op.apply(lines)
 
-	# returns the total memory being used by the stack (in bytes)
 	def size(self):
-		temp = self.top
-		s = 0
-		while(temp != None):
-			s += temp.data.size()
-			temp = temp.link
-		return s
-
-	# removes the oldest 'count' items from the stack
-	def drop(self, count = 1):
-		if(count < 1): return
-		count = min([count, self.__size])
-		temp = self.top
-		for i in range(self.__size - count - 1):
-			temp = temp.link
-		temp.link = None
-		self.__size -= count
-
-# EditHistory class: emcapsulates an interface to implement undo-redo operations
+		return self.__size
+
+# EditHistory class: emcapsulates an interface to implement undo-redo operations;
+# edits are recorded as they happen (through record()) into an open transaction, which is
+# closed by add_change(); undo/redo replay only the changed lines
 class EditHistory:
-	def __init__(self, data, curpos):
-		self.stack = Stack()
-		self.stack.push(HistoricalData(data, curpos))
-		self.present = self.stack.top
-		self.depth_from_top = 0
-	
-	# records a change/edit
-	def add_change(self, data, curpos):
-		while(self.depth_from_top > 0):
-			self.stack.pop()
-			self.depth_from_top -= 1
-		
-		self.stack.push(HistoricalData(data, curpos))
-		self.present = self.stack.top
-
-		while(self.stack.size() > MAX_HISTORY_SIZE):
-			self.stack.drop()
-
-	# reverts to previous state and returns a copy of the last edit performed
-	def undo(self):
-		if(self.depth_from_top == self.stack.length() - 1):
-			return None
-		else:
-			self.present = self.present.link
-			self.depth_from_top += 1
-			return copy.copy(self.present.data)
-
-	# cancels the last undo() performed and returns a copy of the data after redo()
-	def redo(self):
-		if(self.depth_from_top == 0):
-			return None
-		else:
-			self.present = self.present.parent
-			self.depth_from_top -= 1
-			return copy.copy(self.present.data)
\ No newline at end of file
+	def __init__(self, curpos):
+		self.undo_stack = list()
+		self.redo_stack = list()
+		self.current = Transaction(curpos)
+		self.applying = False
+		self.__size = 0
+
+	# records an edit made to the buffer: called by the buffer's storage listener
+	def record(self, start, old_lines, new_lines):
+		if(self.applying): return
+		if(len(self.redo_stack) > 0): self.redo_stack = list()
+		self.current.add(start, old_lines, new_lines)
+
+	# closes the currently open transaction (if it has any edits) and opens a new one
+	def add_change(self, curpos):
+		self.current.curpos_after = copy.copy(curpos)
+		if(not self.current.is_empty()):
+			self.undo_stack.append(self.current)
+			self.__size += self.current.size()
+
+			# drop the oldest transactions, but always keep the latest one
+			while(self.__size > MAX_HISTORY_SIZE and len(self.undo_stack) > 1):
+				self.__size -= self.undo_stack.pop(0).size()
+
+		self.current = Transaction(curpos)
+
+	# checks if there are edits not yet closed into a transaction
+	def has_pending_changes(self):
+		return (not self.current.is_empty())
+
+	# reverts the last transaction on the given storage; returns the cursor-position to restore
+	def undo(self, lines):
+		if(len(self.undo_stack) == 0): return None
+		trans = self.undo_stack.pop()
+		self.__size -= trans.size()
+		self.__replay(trans.undo, lines)
+		self.redo_stack.append(trans)
+		self.current = Transaction(trans.curpos_before)
+		return copy.copy(trans.curpos_before)
+
+	# cancels the last undo() performed; returns the cursor-position to restore
+	def redo(self, lines):
+		if(len(self.redo_stack) == 0): return None
+		trans = self.redo_stack.pop()
+		self.__replay(trans.redo, lines)
+		self.undo_stack.append(trans)
+		self.__size += trans.size()
+		self.current = Transaction(trans.curpos_after)
+		return copy.copy(trans.curpos_after)
+
+	# returns the total size of the recorded history
+	def size(self):
+		return self.__size + self.current.size()
+
+	def __replay(self, action, lines):
+		self.applying = True
+		try:
+			action(lines)
+		finally:
+			self.applying = False
@@ -0,0 +1,225 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements the crash-recovery journal of a buffer: an append-only file holding the
+# edits made since the buffer was last saved, which can be replayed onto the file on disk
+
+from ash.core import *
+
+import json
+import threading
+
+JOURNAL_VERSION		= 1
+MIN_COMPACT_SIZE	= 1024 * 1024		# journals smaller than this (in bytes) are never compacted
+
+# EditJournal class: records line-range replacements (as given to a TextStorage listener) as
+# JSON lines; the first line is a header identifying the file-version the edits apply to,
+# and a torn last line (from a crash in the middle of a write) is dropped on replay;
+# once the journal outgrows the text, it is compacted in the background into a copy of the
+# whole text, so that the bytes written remain proportional to the size of the edits
+class EditJournal:
+	def __init__(self, filename, on_compacted):
+		self.filename = filename
+		self.journal_file = EditJournal.get_journal_filename(filename)
+		self.on_compacted = on_compacted		# on_compacted(journal, compactor, error) is called from the compactor thread
+		self.base = None						# [size, mtime] of the file the edits apply to
+		self.complete = False					# True if the journal holds the whole text (once compacted)
+		self.file = None						# opened when the first edit is flushed
+		self.pending = list()					# records not yet written
+		self.size = 0							# bytes in the journal file
+		self.compacted_size = 0					# size of the journal when it was last compacted
+		self.compactor = None
+		self.compact_records = None				# records written while compacting, to be appended to the compacted journal
+		self.applying = False
+		self.kept = False						# True while a journal left behind is kept in place: edits are then not recorded
+
+	# returns the name of the journal of a given file
+	@staticmethod
+	def get_journal_filename(filename):
+		return os.path.join(os.path.dirname(filename), JOURNAL_PREFIX + get_file_title(filename))
+
+	# checks if a file has a journal which can be replayed onto it
+	@staticmethod
+	def exists(filename):
+		header = EditJournal.read_header(EditJournal.get_journal_filename(filename))
+		if(header == None): return False
+		if(header.get("complete")): return True
+		return (header.get("base") != None and header.get("base") == get_file_version(filename))
+
+	# returns the header of a journal file, or None if it is missing or invalid
+	@staticmethod
+	def read_header(journal_file):
+		try:
+			with open(journal_file, "rb") as f:
+				header = json.loads(f.readline())
+			if(header.get("ash-journal") != JOURNAL_VERSION): return None
+			return header
+		except (OSError, ValueError, AttributeError):
+			return None
+
+	# discards the journal and starts a new one for the file as it is now on disk (after it is saved or reloaded)
+	def reset(self):
+		self.kept = False
+		self.discard()
+		self.base = get_file_version(self.filename)
+		self.complete = False
+
+	# starts a new journal for a file which has been read without recovering its edits; a journal left
+	# behind which can still be replayed onto the file is kept (and no edits are recorded until the file
+	# is saved), so that opening a file never deletes recoverable edits, while a stale one is discarded
+	def start(self):
+		if(not EditJournal.exists(self.filename)):
+			self.reset()
+			return
+		self.kept = True
+		self.discard()
+		self.base = None
+
+	# records an edit: called by the buffer's storage listener
+	def record(self, start, old_lines, new_lines):
+		if(self.applying or self.kept): return
+		self.pending.append(self.__encode(start, start + len(old_lines), new_lines))
+
+	# writes out the edits recorded so far; if sync is True, also flushes them to the disk
+	def flush(self, sync = False):
+		if(len(self.pending) == 0): return
+		data = "".join(self.pending).encode("ascii")
+		if(self.compact_records != None): self.compact_records.extend(self.pending)
+		self.pending = list()
+		try:
+			if(self.file == None): self.__open_new()
+			self.file.write(data)
+			self.file.flush()
+			if(sync): os.fsync(self.file.fileno())
+			self.size += len(data)
+		except OSError:
+			self.__close()				# the journal is only a safety-net: editing must go on without it
+
+	# checks if the journal is worth compacting: once it is twice the size of the text
+	def should_compact(self):
+		if(self.compactor != None or self.file == None): return False
+		if(self.complete):
+			text_size = self.compacted_size
+		else:
+			text_size = (0 if self.base == None else self.base[0])
+		return (self.size > max([MIN_COMPACT_SIZE, 2 * text_size]))
+
+	# starts rewriting the journal as a copy of the whole text, given as a list of blocks of lines
+	# (see TextStorage.snapshot()); edits made meanwhile are still added to the current journal
+	def compact(self, blocks):
+		self.flush()
+		self.compact_records = list()
+		self.compactor = threading.Thread(target=self.__write_compacted, args=(blocks,), daemon=True)
+		self.compactor.start()
+
+	# replaces the journal with the compacted one: must be called from the main thread once
+	# the compactor is done (see on_compacted)
+	def finish_compaction(self, compactor, error):
+		if(compactor != self.compactor): return			# discarded meanwhile
+		self.compactor = None
+		records = self.compact_records
+		self.compact_records = None
+		temp = self.journal_file + ".tmp"
+		if(error != None):
+			if(os.path.isfile(temp)): os.remove(temp)
+			return
+
+		try:
+			with open(temp, "ab") as f:
+				f.write("".join(records).encode("ascii"))
+			self.__close()
+			os.replace(temp, self.journal_file)
+			self.complete = True
+			self.file = open(self.journal_file, "ab")
+			self.size = self.file.tell()
+			self.compacted_size = self.size
+		except OSError:
+			self.__close()
+
+	# replays the journal onto a storage object; returns the number of edits applied
+	def replay(self, lines):
+		header = EditJournal.read_header(self.journal_file)
+		if(header == None): return 0
+
+		count = 0
+		valid_size = 0
+		self.applying = True
+		try:
+			with open(self.journal_file, "rb") as f:
+				valid_size = len(f.readline())
+				for data in f:
+					if(not data.endswith(b"\n")): break				# torn write
+					record = json.loads(data)
+					start = record["s"]
+					end = (len(lines) if record["e"] < 0 else record["e"])
+					if(start < 0 or start > end or end > len(lines)): break
+					lines.replace_lines(start, end, record["l"])
+					valid_size += len(data)
+					count += 1
+		except (OSError, ValueError, KeyError, TypeError):
+			pass
+		finally:
+			self.applying = False
+
+		# continue the journal after its last valid record
+		self.base = header.get("base")
+		self.complete = bool(header.get("complete"))
+		try:
+			self.file = open(self.journal_file, "r+b")
+			self.file.truncate(valid_size)
+			self.file.seek(valid_size)
+			self.size = valid_size
+			self.compacted_size = valid_size
+		except OSError:
+			self.__close()
+		return count
+
+	# deletes the journal (on save, or when the changes are deliberately discarded); a journal which
+	# was kept in place (see start()) holds none of the buffer's edits, so it is left on disk
+	def discard(self):
+		self.__close()
+		self.pending = list()
+		self.compactor = None
+		self.compact_records = None
+		if(self.kept): return
+		for name in [ self.journal_file, self.journal_file + ".tmp" ]:
+			if(os.path.isfile(name)): os.remove(name)
+
+	# <------------------- private functions ---------------------->
+
+	def __encode(self, start, end, lines):
+		return json.dumps({ "s": start, "e": end, "l": lines }) + "\n"
+
+	def __header(self, complete):
+		return json.dumps({ "ash-journal": JOURNAL_VERSION, "base": self.base, "complete": complete }) + "\n"
+
+	def __open_new(self):
+		self.file = open(self.journal_file, "wb")
+		header = self.__header(self.complete).encode("ascii")
+		self.file.write(header)
+		self.size = len(header)
+
+	def __close(self):
+		if(self.file != None): self.file.close()
+		self.file = None
+		self.size = 0
+
+	def __write_compacted(self, blocks):
+		compactor = threading.current_thread()
+		error = None
+		try:
+			with open(self.journal_file + ".tmp", "wb") as f:
+				f.write(self.__header(True).encode("ascii"))
+				start = 0
+				for i, block in enumerate(blocks):
+					block = list(block)
+					f.write(self.__encode(start, (-1 if i == 0 else start), block).encode("ascii"))
+					start += len(block)
+				if(len(blocks) == 0): f.write(self.__encode(0, -1, [""]).encode("ascii"))
+				f.flush()
+				os.fsync(f.fileno())
+		except Exception as e:
+			error = e
+		self.on_compacted(self, compactor, error)
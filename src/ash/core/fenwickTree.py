@@ -0,0 +1,74 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements a Fenwick tree (binary indexed tree) of non-negative integers,
+# used to answer prefix-sum and position lookups in O(log n)
+
+class FenwickTree:
+	def __init__(self, values = None):
+		self.rebuild(values)
+
+	# rebuilds the tree from a list of values in O(n)
+	def rebuild(self, values = None):
+		self.values = list() if values == None else list(values)
+		n = len(self.values)
+		self.tree = [0] + self.values
+		for i in range(1, n+1):
+			j = i + (i & (-i))
+			if(j <= n): self.tree[j] += self.tree[i]
+
+		# highest power of 2 not exceeding n: used by find()
+		self.top_bit = 1
+		while(self.top_bit * 2 <= n): self.top_bit *= 2
+
+	# returns the number of values stored
+	def __len__(self):
+		return len(self.values)
+
+	# returns the value at a given index
+	def __getitem__(self, index):
+		return self.values[index]
+
+	# sets the value at a given index
+	def __setitem__(self, index, value):
+		self.add(index, value - self.values[index])
+
+	# adds delta to the value at a given index
+	def add(self, index, delta):
+		if(delta == 0): return
+		self.values[index] += delta
+		n = len(self.values)
+		i = index + 1
+		while(i <= n):
+			self.tree[i] += delta
+			i += i & (-i)
+
+	# returns the sum of values in [0, index)
+	def prefix_sum(self, index):
+		s = 0
+		i = index
+		while(i > 0):
+			s += self.tree[i]
+			i -= i & (-i)
+		return s
+
+	# returns the sum of all values
+	def total(self):
+		return self.prefix_sum(len(self.values))
+
+	# returns tuple(index, offset) where index is the smallest index such that
+	# prefix_sum(index+1) > target, and offset = target - prefix_sum(index)
+	# returns (len, remainder) if target >= total()
+	def find(self, target):
+		pos = 0
+		bit = self.top_bit
+		n = len(self.values)
+		while(bit > 0):
+			nxt = pos + bit
+			if(nxt <= n and self.tree[nxt] <= target):
+				pos = nxt
+				target -= self.tree[nxt]
+			bit //= 2
+		return (pos, target)
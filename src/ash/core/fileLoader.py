@@ -0,0 +1,62 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements loading of files in a background thread
+
+from ash.core import *
+
+import threading
+
+LOAD_BLOCK_SIZE		= 256 * 1024		# bytes to read in each step
+
+# FileLoader class: reads and decodes a file in a worker thread, handing over complete lines in batches;
+# on_batch(loader, lines, bytes_read) is called for every block read, and on_finish(loader, last_line, error)
+# once at the end (last_line is the text after the last newline); both are called from the worker thread
+class FileLoader:
+	def __init__(self, filename, encoding, on_batch, on_finish):
+		self.filename = filename
+		self.encoding = encoding
+		self.on_batch = on_batch
+		self.on_finish = on_finish
+		self.total_size = int(os.stat(filename).st_size)
+		self.bytes_read = 0
+		self.newline = None					# line-ending: detected at the first newline
+		self.cancelled = False
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	# starts loading
+	def start(self):
+		self.thread.start()
+
+	# stops loading: no more callbacks are made once the current block is finished
+	def cancel(self):
+		self.cancelled = True
+
+	# returns the fraction of the file read so far
+	def get_progress(self):
+		if(self.total_size == 0): return 1.0
+		return min([1.0, self.bytes_read / self.total_size])
+
+	def run(self):
+		pending = ""
+		try:
+			decoder = codecs.getincrementaldecoder(self.encoding)()
+			with open(self.filename, "rb") as activeFile:
+				while(not self.cancelled):
+					data = activeFile.read(LOAD_BLOCK_SIZE)
+					final = (len(data) == 0)
+					lines = decoder.decode(data, final).split("\n")
+					lines[0] = pending + lines[0]
+					pending = lines.pop()
+					if(self.newline == None and len(lines) > 0): self.newline = ("\r\n" if lines[0].endswith("\r") else "\n")
+					if(self.newline == "\r\n"): lines = [ (line[:-1] if line.endswith("\r") else line) for line in lines ]
+					self.bytes_read += len(data)
+					if(len(lines) > 0 and not self.cancelled): self.on_batch(self, lines, self.bytes_read)
+					if(final): break
+		except Exception as e:
+			if(not self.cancelled): self.on_finish(self, pending, e)
+			return
+		if(self.newline == None): self.newline = "\n"
+		if(not self.cancelled): self.on_finish(self, pending, None)
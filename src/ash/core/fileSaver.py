@@ -0,0 +1,168 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements saving of files in background threads
+
+from ash.core import *
+from ash.core.mappedTextStorage import *
+
+import threading
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MAX_SAVE_WORKERS	= 8			# files written concurrently by a SaveBatch
+
+# returns the umask of the process: read from /proc where available, as reading it with os.umask()
+# means changing it for a moment, for all threads
+def read_umask():
+	try:
+		with open("/proc/self/status") as f:
+			for line in f:
+				if(line.startswith("Umask:")): return int(line.split()[1], 8)
+	except (OSError, ValueError, IndexError):
+		pass
+	umask = os.umask(0)
+	os.umask(umask)
+	return umask
+
+UMASK				= read_umask()		# read once, at import time (on the main thread)
+
+# FileSaver class: encodes a snapshot of a buffer (a list of blocks of lines, see TextStorage.snapshot())
+# into a temporary file next to the target, flushes it to disk and then renames it over the target,
+# so that the target is never left partially written; the save runs in a thread of its own (start())
+# or as part of a SaveBatch; on_finish(saver, error) is called once at the end, from a worker thread
+class FileSaver:
+	def __init__(self, filename, blocks, encoding, newline, on_finish):
+		self.filename = filename
+		self.target = os.path.realpath(filename)		# replace the file a symlink points to, not the link
+		self.blocks = blocks
+		self.encoding = encoding
+		self.newline = newline
+		self.on_finish = on_finish
+		self.version = None					# the buffer-version being saved (set by the caller)
+		self.batch = None					# the SaveBatch running this save, if any
+		self.error = None					# if set before the save starts, the save fails without writing
+		self.finished = threading.Event()
+
+	# starts saving in a thread of its own
+	def start(self):
+		threading.Thread(target=self.run, daemon=True).start()
+
+	# blocks until the file is saved (or has failed to)
+	def wait(self):
+		self.finished.wait()
+
+	def run(self):
+		self.write()
+		if(self.error == None): sync_directory(os.path.dirname(self.target))
+		self.finish()
+
+	# writes and renames the file; the directory is not synced, and on_finish() is not called
+	def write(self):
+		if(self.error != None): return
+		temp = None
+		try:
+			fd, temp = tempfile.mkstemp(prefix=SAVE_TEMP_PREFIX, dir=os.path.dirname(self.target))
+			with os.fdopen(fd, "wb") as tempFile:
+				self.__write_blocks(tempFile)
+				tempFile.flush()
+				os.fsync(tempFile.fileno())
+
+			self.__copy_attributes(self.target, temp)
+			os.replace(temp, self.target)
+			temp = None
+		except Exception as e:
+			if(temp != None and os.path.isfile(temp)): os.remove(temp)
+			self.error = e
+
+	# reports the result
+	def finish(self):
+		self.on_finish(self, self.error)
+		self.finished.set()
+
+	# <------------------- private functions ---------------------->
+
+	# encodes the blocks one at a time: a snapshot with a single block is joined and encoded in one go;
+	# untouched blocks of a memory-mapped file are copied byte for byte when the encoding is unchanged
+	def __write_blocks(self, tempFile):
+		encoder = codecs.getincrementalencoder(self.encoding)()		# emits a BOM (if any) only once
+		n = len(self.blocks)
+		for i, block in enumerate(self.blocks):
+			if(isinstance(block, MappedBlock)):
+				data = block.get_bytes(self.encoding, self.newline, i == n-1)
+				if(data != None):
+					tempFile.write(data)
+					continue
+				block = block.get_lines_strict()
+			text = self.newline.join(block)
+			if(i < n-1): text += self.newline
+			tempFile.write(encoder.encode(text, i == n-1))
+
+	# gives the new file the permissions (and if possible, the owner) of the file it replaces
+	def __copy_attributes(self, target, temp):
+		if(not os.path.exists(target)):
+			os.chmod(temp, 0o666 & ~UMASK)		# (mkstemp() always creates files as 0600)
+			return
+		shutil.copymode(target, temp)
+		st = os.stat(target)
+		try:
+			if(hasattr(os, "chown")): os.chown(temp, st.st_uid, st.st_gid)
+		except OSError:
+			pass			# only the owner (or root) can change it: the file becomes owned by the user saving it
+
+# SaveBatch class: runs several FileSavers on a bounded pool of worker threads; each directory is
+# synced once after all its files have been renamed (rather than once per file), and only then are
+# the savers' on_finish() called; on_progress(done, total) is called as files are written, and
+# on_finish(batch) once at the end, after all the savers have finished; all from a worker thread
+class SaveBatch:
+	def __init__(self, savers, on_progress, on_finish):
+		self.savers = savers
+		self.on_progress = on_progress
+		self.on_finish = on_finish
+		self.finished = threading.Event()
+		for saver in savers:
+			saver.batch = self
+
+	# starts saving
+	def start(self):
+		threading.Thread(target=self.run, daemon=True).start()
+
+	# blocks until all the files are saved (or have failed to)
+	def wait(self):
+		self.finished.wait()
+
+	# returns the savers which failed
+	def get_failed(self):
+		return [ saver for saver in self.savers if saver.error != None ]
+
+	def run(self):
+		total = len(self.savers)
+		done = 0
+		with ThreadPoolExecutor(max_workers=max([1, min([MAX_SAVE_WORKERS, total])])) as pool:
+			for future in as_completed([ pool.submit(saver.write) for saver in self.savers ]):
+				done += 1
+				self.on_progress(done, total)
+
+		for dirname in set([ os.path.dirname(saver.target) for saver in self.savers if saver.error == None ]):
+			sync_directory(dirname)
+		for saver in self.savers:
+			saver.finish()
+		self.on_finish(self)
+		self.finished.set()
+
+# makes the renames done in a directory durable
+def sync_directory(dirname):
+	if(not hasattr(os, "O_DIRECTORY")): return
+	try:
+		fd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+	except OSError:
+		return
+	try:
+		os.fsync(fd)
+	except OSError:
+		pass
+	finally:
+		os.close(fd)
@@ -0,0 +1,175 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements watching of open files for changes made outside the editor
+
+from ash.core import *
+
+import threading
+import select
+import struct
+import ctypes
+import ctypes.util
+
+POLL_INTERVAL		= 2.0				# seconds between two checks, when inotify is not available
+SELECT_TIMEOUT		= 0.5				# seconds the inotify thread waits for events before checking if it must stop
+
+# inotify flags (from <sys/inotify.h>)
+IN_MODIFY			= 0x00000002
+IN_ATTRIB			= 0x00000004
+IN_CLOSE_WRITE		= 0x00000008
+IN_MOVED_FROM		= 0x00000040
+IN_MOVED_TO			= 0x00000080
+IN_CREATE			= 0x00000100
+IN_DELETE			= 0x00000200
+IN_Q_OVERFLOW		= 0x00004000
+IN_IGNORED			= 0x00008000
+IN_NONBLOCK			= 0o00004000
+IN_CLOEXEC			= 0o02000000
+
+# files are replaced (not rewritten) by most editors, so their directories are watched instead
+WATCH_MASK			= IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER		= struct.Struct("iIII")		# wd, mask, cookie, len
+
+# FileWatcher class: watches a set of files in a background thread, using inotify where available
+# and polling otherwise; on_change(filename) is called from the watcher thread for every file that
+# may have changed (the caller decides whether it really has, e.g. by checking its mtime)
+class FileWatcher:
+	def __init__(self, on_change):
+		self.on_change = on_change
+		self.lock = threading.Lock()
+		self.files = dict()						# filename -> number of watch() calls
+		self.targets = dict()					# real path -> set of filenames pointing to it
+		self.directories = dict()				# directory -> inotify watch-descriptor
+		self.watched_dirs = dict()				# inotify watch-descriptor -> directory
+		self.versions = dict()					# filename -> last seen [size, mtime] (polling only)
+		self.stopped = threading.Event()
+
+		self.libc = None
+		self.fd = -1
+		self.__init_inotify()
+		self.thread = threading.Thread(target=(self.__watch_inotify if self.fd >= 0 else self.__watch_polling), daemon=True)
+		self.thread.start()
+
+	# checks if inotify is being used (instead of polling)
+	def is_event_driven(self):
+		return (self.fd >= 0)
+
+	# starts watching a file; calls can be nested (each needs a matching unwatch())
+	def watch(self, filename):
+		with self.lock:
+			count = self.files.get(filename, 0)
+			self.files[filename] = count + 1
+			if(count > 0): return
+
+			target = os.path.realpath(filename)
+			self.targets.setdefault(target, set()).add(filename)
+			if(self.fd >= 0):
+				self.__add_directory(os.path.dirname(target))
+			else:
+				self.versions[filename] = get_file_version(filename)
+
+	# stops watching a file
+	def unwatch(self, filename):
+		with self.lock:
+			count = self.files.get(filename, 0)
+			if(count == 0): return
+			if(count > 1):
+				self.files[filename] = count - 1
+				return
+
+			del self.files[filename]
+			self.versions.pop(filename, None)
+			target = os.path.realpath(filename)
+			names = self.targets.get(target)
+			if(names != None):
+				names.discard(filename)
+				if(len(names) == 0): del self.targets[target]
+			if(self.fd >= 0): self.__remove_directory_if_unused(os.path.dirname(target))
+
+	# stops the watcher thread
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+		if(self.fd >= 0):
+			os.close(self.fd)
+			self.fd = -1
+
+	# <------------------- private functions ---------------------->
+
+	def __init_inotify(self):
+		if(not sys.platform.startswith("linux")): return
+		try:
+			self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+			self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		except (OSError, AttributeError):
+			self.fd = -1
+
+	# must be called with the lock held
+	def __add_directory(self, dirname):
+		if(dirname in self.directories): return
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname), WATCH_MASK)
+		if(wd < 0): return					# e.g. out of watches: changes to this directory go unnoticed
+		self.directories[dirname] = wd
+		self.watched_dirs[wd] = dirname
+
+	# must be called with the lock held
+	def __remove_directory_if_unused(self, dirname):
+		wd = self.directories.get(dirname)
+		if(wd == None): return
+		for target in self.targets:
+			if(os.path.dirname(target) == dirname): return
+		self.libc.inotify_rm_watch(self.fd, wd)
+		del self.directories[dirname]
+		self.watched_dirs.pop(wd, None)
+
+	def __watch_inotify(self):
+		while(not self.stopped.is_set()):
+			try:
+				ready, _, _ = select.select([self.fd], [], [], SELECT_TIMEOUT)
+				if(len(ready) == 0): continue
+				data = os.read(self.fd, 64 * 1024)
+			except (OSError, ValueError):
+				if(self.stopped.is_set()): return
+				continue
+
+			changed = set()
+			pos = 0
+			with self.lock:
+				while(pos + EVENT_HEADER.size <= len(data)):
+					wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+					name = data[pos + EVENT_HEADER.size : pos + EVENT_HEADER.size + length].rstrip(b"\0")
+					pos += EVENT_HEADER.size + length
+
+					if(mask & IN_Q_OVERFLOW):
+						changed.update(self.files.keys())				# events were lost: check everything
+					elif(mask & IN_IGNORED):
+						dirname = self.watched_dirs.pop(wd, None)		# the directory was removed
+						if(dirname != None): self.directories.pop(dirname, None)
+					else:
+						dirname = self.watched_dirs.get(wd)
+						if(dirname == None or len(name) == 0): continue
+						changed.update(self.targets.get(os.path.join(dirname, os.fsdecode(name)), set()))
+
+			# a save produces several events: each file is reported once per batch
+			for filename in changed:
+				self.on_change(filename)
+
+	def __watch_polling(self):
+		while(not self.stopped.is_set()):
+			if(self.stopped.wait(POLL_INTERVAL)): return
+			with self.lock:
+				filenames = list(self.files.keys())
+
+			changed = list()
+			for filename in filenames:
+				version = get_file_version(filename)
+				with self.lock:
+					if(filename not in self.versions or self.versions[filename] == version): continue
+					self.versions[filename] = version
+				changed.append(filename)
+
+			for filename in changed:
+				self.on_change(filename)
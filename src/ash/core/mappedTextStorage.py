@@ -0,0 +1,272 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements a text-storage engine for very large files: the file is memory-mapped,
+# its line-offsets are indexed in a background thread, and lines are decoded only when read
+
+from ash.core.textStorage import *
+from ash.core.ashException import *
+from ash.utils.fileUtils import *
+
+import mmap
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+MAX_CACHED_CHUNKS		= 64				# decoded chunks kept in memory (LRU)
+INDEX_BLOCK_SIZE		= 4 * 1024 * 1024	# bytes scanned by the indexer between progress reports
+INITIAL_INDEX_SIZE		= 256 * 1024		# bytes indexed synchronously, so that the first screen is available at once
+INDEX_REPORT_INTERVAL	= 0.25				# minimum time (in seconds) between two progress reports
+
+# encodings in which a newline is always the single byte 0x0A, by their normalized codec names
+# (chardet reports ISO-8859-1 and Windows-1252 for single-byte files, never latin-1)
+MAPPABLE_ENCODINGS		= [ "utf-8", "ascii", "iso8859-1", "cp1252" ]
+
+# MappedChunk class: a read-only chunk of consecutive lines in the mapped file
+class MappedChunk:
+	def __init__(self, storage, first_line, count):
+		self.storage = storage
+		self.first_line = first_line
+		self.count = count
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, index):
+		return self.storage.decode_chunk(self)[index]
+
+	def __iter__(self):
+		return iter(self.storage.decode_chunk(self))
+
+	def __sizeof__(self):
+		return object.__sizeof__(self)
+
+# MappedBlock class: a detached copy of a mapped chunk, decoded (without the cache) only when read,
+# so that it can be read from a worker thread
+class MappedBlock:
+	def __init__(self, storage, start, end, count):
+		self.storage = storage
+		self.start = start
+		self.end = end
+		self.count = count
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		return iter(self.storage.decode_range(self.start, self.end, self.count))
+
+	# returns the bytes of the block as they are in the file (ending with a line-ending unless it is
+	# the last block), so that saving leaves invalid bytes untouched; returns None if the file is
+	# to be written with another encoding or line-ending
+	def get_bytes(self, encoding, newline, last):
+		if(not self.storage.has_format(encoding, newline)): return None
+		data = self.storage.map[self.start:self.end]
+		if(self.end < self.storage.file_size):
+			if(last): data = data[0:len(data) - (len(newline) if data.endswith(newline.encode(encoding)) else 1)]
+		elif(not last):
+			data += newline.encode(encoding)
+		return data
+
+	# returns the lines of the block; raises AshException if the file has bytes which are not
+	# valid in its encoding, as the replaced text must never be written back
+	def get_lines_strict(self):
+		try:
+			return self.storage.decode_range(self.start, self.end, self.count, "strict")
+		except UnicodeDecodeError as e:
+			raise AshException("the file has bytes which are not valid " + str(self.storage.encoding) + " (at offset " + str(self.start + e.start) + "): it can only be saved in the same encoding and line-ending")
+
+# MappedTextStorage class: a ChunkedTextStorage whose chunks initially refer to the mapped file;
+# a chunk is decoded (and cached) when read, and copied into memory only when edited, so
+# edits overlay the file until it is saved
+class MappedTextStorage(ChunkedTextStorage):
+	def __init__(self, filename, encoding = "utf-8"):
+		self.filename = filename
+		self.encoding = encoding
+		self.file = open(filename, "rb")
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		self.file_size = len(self.map)
+		self.cache = OrderedDict()
+
+		pos = self.map.find(b"\n", 0, INITIAL_INDEX_SIZE)
+		self.newline = ("\r\n" if pos > 0 and self.map[pos-1] == 13 else "\n")
+
+		# line-start offsets: appended to by the indexer thread, read by the main thread
+		self.offsets = array("q", [0])
+		self.lock = threading.Lock()
+		self.scanned = 0						# bytes scanned by the indexer
+		self.index_complete = False
+		self.indexer = None
+		self.closed = False
+		self.on_progress = None
+		self.mapped_lines = 0					# number of file-lines added as chunks
+		self.replaced_bytes = False				# True once an edited chunk had bytes not valid in the encoding
+
+		self.load()
+		self.__scan(INITIAL_INDEX_SIZE)
+		self.sync_index()
+
+	# checks if an encoding can be memory-mapped
+	@staticmethod
+	def supports_encoding(encoding):
+		if(encoding == None): return False
+		try:
+			return (codecs.lookup(str(encoding)).name in MAPPABLE_ENCODINGS)
+		except LookupError:
+			return False
+
+	def is_lazy(self):
+		return True
+
+	# starts indexing the rest of the file in the background;
+	# on_progress(fraction) is called from the indexer thread, never more often than INDEX_REPORT_INTERVAL
+	def start_indexing(self, on_progress = None):
+		self.on_progress = on_progress
+		if(self.index_complete or self.indexer != None): return
+		self.indexer = threading.Thread(target=self.__index_all, daemon=True)
+		self.indexer.start()
+
+	# returns the fraction of the file indexed so far
+	def get_index_progress(self):
+		if(self.file_size == 0): return 1.0
+		return min([1.0, self.scanned / self.file_size])
+
+	# adds the lines indexed so far as chunks; must be called from the main thread;
+	# returns True if any lines were added
+	def sync_index(self):
+		with self.lock:
+			known = len(self.offsets) - 1			# lines whose end is known
+			complete = (self.scanned >= self.file_size)
+		if(complete):
+			self.index_complete = True
+			known += 1								# the last line ends at EOF
+
+		if(known <= self.mapped_lines): return False
+
+		new_chunks = list()
+		first = self.mapped_lines
+		while(first < known):
+			count = min([LINES_PER_CHUNK, known - first])
+			new_chunks.append(MappedChunk(self, first, count))
+			first += count
+
+		if(self.count == 0 and len(self.chunks) == 1): self.chunks = list()
+		self.chunks.extend(new_chunks)
+		self.mapped_lines = known
+		self._rebuild_index()
+		return True
+
+	# blocks until the whole file is indexed
+	def wait_for_index(self):
+		if(self.index_complete): return
+		if(self.indexer == None):
+			self.__scan(self.file_size)
+		else:
+			self.indexer.join()
+		self.sync_index()
+
+	# returns the decoded lines of a mapped chunk
+	def decode_chunk(self, chunk):
+		lines = self.cache.get(chunk.first_line)
+		if(lines != None):
+			self.cache.move_to_end(chunk.first_line)
+			return lines
+
+		start, end = self.__get_byte_range(chunk)
+		lines = self.decode_range(start, end, chunk.count)
+
+		self.cache[chunk.first_line] = lines
+		while(len(self.cache) > MAX_CACHED_CHUNKS):
+			self.cache.popitem(False)
+		return lines
+
+	# decodes count lines from the bytes in [start, end) of the file
+	def decode_range(self, start, end, count, errors = "replace"):
+		# decoding errors cannot be reported while drawing, so they are replaced by default
+		return split_into_lines(self.map[start:end].decode(self.encoding, errors), self.newline)[0:count]
+
+	# checks if the file would be written with the same encoding and line-ending it was read with
+	def has_format(self, encoding, newline):
+		try:
+			return (newline == self.newline and codecs.lookup(encoding).name == codecs.lookup(self.encoding).name)
+		except LookupError:
+			return False
+
+	def snapshot(self):
+		self.wait_for_index()
+		blocks = list()
+		for chunk in self.chunks:
+			if(len(chunk) == 0): continue
+			if(isinstance(chunk, MappedChunk)):
+				start, end = self.__get_byte_range(chunk)
+				blocks.append(MappedBlock(self, start, end, chunk.count))
+			else:
+				blocks.append(list(chunk))
+		return blocks
+
+	def _replace_lines(self, start, end, new_lines):
+		# lines yet to be indexed always follow the indexed ones, so the index must be complete before editing
+		self.wait_for_index()
+
+		# copy the affected chunks into memory before they are modified
+		if(self.count > 0):
+			cid, _ = self._locate(start, True)
+			last_cid, _ = self._locate(max([start, end-1]), True)
+			for i in range(cid, min([last_cid + 1, len(self.chunks)])):
+				if(isinstance(self.chunks[i], MappedChunk)): self.chunks[i] = self.__copy_chunk(self.chunks[i])
+
+		super()._replace_lines(start, end, new_lines)
+
+	# releases the mapping
+	def close(self):
+		if(self.closed): return
+		self.closed = True
+		if(self.indexer != None): self.indexer.join()
+		self.cache = OrderedDict()
+		self.map.close()
+		self.file.close()
+
+	# <------------------- private functions ---------------------->
+
+	# returns tuple(start, end) of the bytes holding the lines of a mapped chunk
+	def __get_byte_range(self, chunk):
+		start = self.offsets[chunk.first_line]
+		end = (self.offsets[chunk.first_line + chunk.count] if chunk.first_line + chunk.count < len(self.offsets) else self.file_size)
+		return (start, end)
+
+	# returns the lines of a mapped chunk as a list; invalid bytes cannot be kept in the copy, so
+	# they are replaced and the storage is marked as no longer able to write them back
+	def __copy_chunk(self, chunk):
+		start, end = self.__get_byte_range(chunk)
+		try:
+			return self.decode_range(start, end, chunk.count, "strict")
+		except UnicodeDecodeError:
+			self.replaced_bytes = True
+			return list(chunk)
+
+	# records line-offsets up to a byte-limit (relative to what has been scanned)
+	def __scan(self, nbytes):
+		pos = self.scanned
+		limit = min([self.file_size, pos + nbytes])
+		found = array("q")
+		while(pos < limit):
+			pos = self.map.find(b"\n", pos, limit)
+			if(pos < 0): break
+			pos += 1
+			found.append(pos)
+
+		with self.lock:
+			self.offsets.extend(found)
+			self.scanned = limit
+
+	def __index_all(self):
+		last_report = time.time()
+		while(self.scanned < self.file_size and not self.closed):
+			self.__scan(INDEX_BLOCK_SIZE)
+			now = time.time()
+			if(self.on_progress != None and (now - last_report >= INDEX_REPORT_INTERVAL or self.scanned >= self.file_size)):
+				last_report = now
+				self.on_progress(self.get_index_progress())
@@ -0,0 +1,105 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements the persistent cache of file-metadata (binary or text, encoding,
+# line-count and line-ending), so that unchanged files need not be sniffed again
+
+from ash.core import *
+
+import pickle
+from collections import OrderedDict
+
+METADATA_CACHE_VERSION	= 1
+MAX_METADATA_ENTRIES	= 20000			# least recently used entries are evicted beyond this
+
+# FileMetadata class: what is known about a file at a given version (size and mtime);
+# fields which have not been determined yet are None
+class FileMetadata:
+	def __init__(self, size, mtime):
+		self.size = size
+		self.mtime = mtime					# in nanoseconds
+		self.binary = None
+		self.encoding = None
+		self.line_count = None
+		self.newline = None
+
+# MetadataCache class: maps filenames to FileMetadata, kept in least-recently-used order and
+# stored in a file under APP_DATA_DIR; an entry is valid only as long as the size and mtime of
+# its file remain unchanged; it is meant to be used from the main thread only (except for peek())
+class MetadataCache:
+	def __init__(self, filename, max_entries = MAX_METADATA_ENTRIES):
+		self.filename = filename
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.modified = False
+		self.load()
+
+	# returns the metadata of a file if it is still valid, None otherwise
+	def get(self, filename):
+		entry = self.entries.get(filename)
+		if(entry == None): return None
+		version = get_file_version(filename)
+		if(version == None or version[0] != entry.size or version[1] != entry.mtime):
+			del self.entries[filename]
+			self.modified = True
+			return None
+		self.entries.move_to_end(filename)
+		return entry
+
+	# returns the metadata of a file if it is valid for the given [size, mtime], None otherwise; unlike
+	# get(), the cache is left unchanged, so that it can be read from a worker thread
+	def peek(self, filename, version):
+		entry = self.entries.get(filename)
+		if(entry == None or version == None or version[0] != entry.size or version[1] != entry.mtime): return None
+		return entry
+
+	# records what is known about a file (as it is now on disk); fields given as None are left unchanged
+	def update(self, filename, binary = None, encoding = None, line_count = None, newline = None):
+		version = get_file_version(filename)
+		if(version == None): return None
+		entry = self.entries.get(filename)
+		if(entry == None or entry.size != version[0] or entry.mtime != version[1]):
+			entry = FileMetadata(version[0], version[1])
+			self.entries[filename] = entry
+		self.entries.move_to_end(filename)
+
+		if(binary != None): entry.binary = binary
+		if(encoding != None): entry.encoding = encoding
+		if(line_count != None): entry.line_count = line_count
+		if(newline != None): entry.newline = newline
+		self.modified = True
+
+		while(len(self.entries) > self.max_entries):
+			self.entries.popitem(last = False)
+		return entry
+
+	# reads the cache from its file: a missing or unreadable file leaves the cache empty
+	def load(self):
+		self.entries = OrderedDict()
+		if(not os.path.isfile(self.filename)): return
+		try:
+			with open(self.filename, "rb") as f:
+				data = pickle.load(f)
+			if(data.get("version") != METADATA_CACHE_VERSION): return
+			for filename, fields in data["entries"]:
+				entry = FileMetadata(fields[0], fields[1])
+				entry.binary, entry.encoding, entry.line_count, entry.newline = fields[2:6]
+				self.entries[filename] = entry
+		except Exception:
+			self.entries = OrderedDict()		# written by an incompatible version, or corrupt
+		self.modified = False
+
+	# writes the cache to its file, if it has changed since it was read
+	def save(self):
+		if(not self.modified): return
+		entries = [ (filename, [ e.size, e.mtime, e.binary, e.encoding, e.line_count, e.newline ]) for filename, e in self.entries.items() ]
+		temp = self.filename + ".tmp"
+		try:
+			with open(temp, "wb") as f:
+				pickle.dump({ "version": METADATA_CACHE_VERSION, "entries": entries }, f, pickle.HIGHEST_PROTOCOL)
+			os.replace(temp, self.filename)			# another instance of ash may be reading it
+			self.modified = False
+		except OSError:
+			if(os.path.isfile(temp)): os.remove(temp)
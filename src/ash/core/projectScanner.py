@@ -0,0 +1,141 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements the classification of the files of a project (binary or text, and
+# their encodings), and other scans of its files, on a pool of worker processes
+
+from ash.core import *
+
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor
+
+SCAN_CHUNK_SIZE			= 64			# files handed to a worker at a time
+SCAN_REPORT_INTERVAL	= 0.25			# minimum time (in seconds) between two batches of results
+MAX_PENDING_CHUNKS		= 2				# chunks handed to the pool ahead of the results, per worker
+
+# classifies a single file: returns tuple(is-binary, predicted-encoding); runs in a worker process
+def scan_file(filename):
+	try:
+		binary, encoding = classify_file(filename)
+		if(not binary and encoding == None): encoding = predict_file_encoding(filename)
+		return (binary, encoding)
+	except Exception:
+		return (True, None)
+
+# runs a worker function over a chunk of items: the unit of work handed to a pool
+def run_chunk(worker, items):
+	return [ worker(item) for item in items ]
+
+# WorkerPool class: a process pool (chardet is pure Python, so threads would not run it in parallel)
+# created when first needed and kept until shut down, so that its worker processes, which have to
+# import ash on startup, are started once rather than for every scan; a thread pool is used instead
+# if processes cannot be started (or die)
+class WorkerPool:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.executor = None
+
+	# returns the executor, creating it if needed
+	def get_executor(self):
+		with self.lock:
+			if(self.executor == None):
+				try:
+					self.executor = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+				except (OSError, ValueError, ImportError, RuntimeError):
+					self.executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+			return self.executor
+
+	# replaces an executor which has failed with a thread pool; returns the executor to be used
+	def fall_back(self, executor):
+		with self.lock:
+			if(self.executor is executor and not isinstance(executor, ThreadPoolExecutor)):
+				executor.shutdown(wait=False, cancel_futures=True)
+				self.executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+			return self.executor
+
+	# stops the workers: those busy finish their current chunk; the pool is created anew if used again
+	def shutdown(self):
+		with self.lock:
+			if(self.executor != None): self.executor.shutdown(wait=False, cancel_futures=True)
+			self.executor = None
+
+# ProjectScanner class: runs a worker function (scan_file() by default) over a list of items
+# (usually filenames) on a WorkerPool (one of its own, shut down once done, unless one is given);
+# the worker must be a top-level function; the items are handed to the pool in chunks, only a few
+# chunks ahead of the results, so that a cancelled scan leaves the pool free once the chunks being
+# worked on are done; results are handed over in the order of the items, in batches:
+# on_results(scanner, list of tuple(item, result), count-done) and on_finish(scanner) are
+# called from the scanner thread
+class ProjectScanner:
+	def __init__(self, items, on_results, on_finish, worker = scan_file, pool = None):
+		self.items = items
+		self.on_results = on_results
+		self.on_finish = on_finish
+		self.worker = worker
+		self.own_pool = (pool == None)
+		self.pool = (WorkerPool() if pool == None else pool)
+		self.cancelled = False
+		self.done = 0
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	# starts scanning
+	def start(self):
+		self.thread.start()
+
+	# stops scanning: no more callbacks are made once the current batch is done
+	def cancel(self):
+		self.cancelled = True
+
+	# returns the fraction of items scanned so far
+	def get_progress(self):
+		if(len(self.items) == 0): return 1.0
+		return self.done / len(self.items)
+
+	def run(self):
+		executor = self.pool.get_executor()
+		try:
+			self.__scan(executor)
+		except (OSError, ValueError, ImportError, RuntimeError, BrokenExecutor):
+			# worker processes could not be started (or died): scan the rest on threads
+			self.__scan(self.pool.fall_back(executor))
+		if(self.own_pool): self.pool.shutdown()
+		if(not self.cancelled): self.on_finish(self)
+
+	# <------------------- private functions ---------------------->
+
+	# scans the items not yet done on a given executor
+	def __scan(self, executor):
+		chunks = [ self.items[i:i + SCAN_CHUNK_SIZE] for i in range(self.done, len(self.items), SCAN_CHUNK_SIZE) ]
+		max_pending = MAX_PENDING_CHUNKS * max([1, os.cpu_count() or 1])
+		pending = deque()
+		next_chunk = 0
+		try:
+			batch = list()
+			last_report = time.time()
+			while(not self.cancelled):
+				while(next_chunk < len(chunks) and len(pending) < max_pending):
+					pending.append( (chunks[next_chunk], executor.submit(run_chunk, self.worker, chunks[next_chunk])) )
+					next_chunk += 1
+				if(len(pending) == 0): break
+				chunk, future = pending.popleft()
+				results = future.result()
+				if(self.cancelled): break
+				batch.extend(zip(chunk, results))
+				now = time.time()
+				if(now - last_report >= SCAN_REPORT_INTERVAL):
+					last_report = now
+					self.__report(batch)
+					batch = list()
+			if(not self.cancelled and len(batch) > 0): self.__report(batch)
+		finally:
+			for chunk, future in pending:
+				future.cancel()
+
+	def __report(self, batch):
+		self.done += len(batch)
+		self.on_results(self, batch, self.done)
@@ -8,8 +8,116 @@
 from ash.formatting.colors import *
 from ash.gui.cursorPosition import *
 from ash.utils.utils import *
+from ash.core.searchEngine import *
+from ash.core.fenwickTree import *
+from array import array
 import datetime
 
+LAYOUT_CHUNK_SIZE		= 256				# target number of real lines in a chunk of the LineLayout
+MAX_LAYOUT_CHUNK_SIZE	= 2 * LAYOUT_CHUNK_SIZE	# chunks larger than this are split
+
+# col-spans of the lines of a lazily-loaded buffer when wrapping is OFF: computed on demand,
+# so that only the lines actually displayed are ever read
+class UnwrappedColSpans:
+	def __init__(self, lines, tab_size):
+		self.lines = lines
+		self.tab_size = tab_size
+
+	def __getitem__(self, index):
+		w = len(self.lines[index].expandtabs(self.tab_size))
+		return ([] if w == 0 else [ (0, w-1) ])
+
+# when wrapping is OFF for a lazily-loaded buffer, each real line maps to exactly one rendered line
+class UnwrappedLineLayout:
+	def __init__(self, lines):
+		self.lines = lines
+
+	def get_total_rows(self):
+		return len(self.lines)
+
+	def get_first_row(self, line_index):
+		return line_index
+
+	def get_line_at_row(self, row):
+		return (row, 0)
+
+# LineLayout class: the number of rendered lines taken by each real line, stored in small chunks
+# (as ChunkedTextStorage stores lines), with Fenwick trees over the number of real lines and of
+# rendered lines in each chunk; mapping a real line to its first rendered line and back is
+# O(log n + LAYOUT_CHUNK_SIZE), and so is patching the layout after an edit
+class LineLayout:
+	def __init__(self, heights):
+		self.chunks = [ heights[i:i+LAYOUT_CHUNK_SIZE] for i in range(0, len(heights), LAYOUT_CHUNK_SIZE) ]
+		if(len(self.chunks) == 0): self.chunks.append(list())
+		self._rebuild_index()
+
+	# replaces the heights of the real lines in [start, end) with those of the lines replacing them
+	def replace(self, start, end, heights):
+		cid, offset = self._locate(start)
+		chunk = self.chunks[cid]
+		if(end - start <= len(chunk) - offset):
+			# fast path: the replaced range lies inside a single chunk
+			old_rows = sum(chunk[offset:offset + end - start])
+			chunk[offset:offset + end - start] = heights
+			if(len(chunk) > MAX_LAYOUT_CHUNK_SIZE or (len(chunk) == 0 and len(self.chunks) > 1)):
+				self._rebalance(cid, cid+1, chunk)
+			else:
+				self.line_index.add(cid, len(heights) - (end - start))
+				self.row_index.add(cid, sum(heights) - old_rows)
+				self.count += len(heights) - (end - start)
+				self.total += sum(heights) - old_rows
+			return
+
+		# general case: splice across chunks [cid, last_cid]
+		last_cid, last_offset = self._locate(end)
+		self._rebalance(cid, last_cid+1, chunk[0:offset] + heights + self.chunks[last_cid][last_offset:])
+
+	def get_total_rows(self):
+		return self.total
+
+	# returns the first rendered line of a real line
+	def get_first_row(self, line_index):
+		cdef int cid, offset, row, i
+		cid, offset = self._locate(line_index)
+		chunk = self.chunks[cid]
+		row = self.row_index.prefix_sum(cid)
+		for i in range(offset):
+			row += chunk[i]
+		return row
+
+	# returns tuple(real_line_index, subline_offset) of a rendered line (clamped to the rendered lines present)
+	def get_line_at_row(self, row):
+		cdef int cid, offset, i, h
+		row = max([0, min([row, self.total - 1])])
+		cid, offset = self.row_index.find(row)
+		chunk = self.chunks[cid]
+		for i in range(len(chunk)):
+			h = chunk[i]
+			if(offset < h): break
+			offset -= h
+		return (self.line_index.prefix_sum(cid) + i, offset)
+
+	# <------------------- private functions ---------------------->
+
+	# returns tuple(chunk-index, offset-in-chunk) of a real line; index == count maps to the end of the last chunk
+	def _locate(self, index):
+		if(index >= self.count):
+			cid = len(self.chunks) - 1
+			return (cid, len(self.chunks[cid]))
+		return self.line_index.find(index)
+
+	# replaces chunks [from_cid, to_cid) with the given heights, split into fresh chunks
+	def _rebalance(self, from_cid, to_cid, heights):
+		self.chunks[from_cid:to_cid] = [ heights[i:i+LAYOUT_CHUNK_SIZE] for i in range(0, len(heights), LAYOUT_CHUNK_SIZE) ]
+		if(len(self.chunks) == 0): self.chunks.append(list())
+		self._rebuild_index()
+
+	def _rebuild_index(self):
+		self.line_index = FenwickTree([ len(c) for c in self.chunks ])
+		self.row_index = FenwickTree([ sum(c) for c in self.chunks ])
+		self.count = self.line_index.total()
+		self.total = self.row_index.total()
+
 cdef class Screen:
 	cdef bint show_line_numbers, show_scrollbars
 	cdef int total_rendered_lines
@@ -18,19 +126,30 @@ cdef class Screen:
 	cdef int col_start, col_end
 	cdef buffer
 	cdef win
-	cdef dict all_col_spans
-	cdef dict mapping_real_line_to_rendered_line
-	cdef dict mapping_rendered_line_to_real_line
+	cdef all_col_spans
+	cdef layout
+	cdef layout_lines
+	cdef int dirty_start, dirty_end, dirty_old_end
 	cdef list screen_buffer
-	cdef list style_buffer
+	cdef style_array						# array("l") of the styles of all cells, row after row: reused across frames
+	cdef long[:] style_buffer				# (a view of style_array)
+	cdef list last_screen_buffer			# the frame last drawn (None if it has to be drawn in full)
+	cdef last_style_array
+	cdef int last_offset_y, last_offset_x
 	cdef int real_line_start_index_visible, real_line_end_index_visible
 	cdef int last_gutter_width
 	cdef int last_tab_size, last_text_area_width
+	cdef dict column_maps
 	cdef bint last_word_wrap, last_hard_wrap
 
 	# initialize the screen buffer
 	def __init__(self, win, buffer, int height, int width, show_line_numbers, show_scrollbars):
 		self.all_col_spans = None
+		self.style_array = None
+		self.last_style_array = None
+		self.last_screen_buffer = None
+		self.dirty_start = -1
+		self.column_maps = dict()
 		self.show_line_numbers = show_line_numbers
 		self.show_scrollbars = show_scrollbars
 		self.update(win, buffer)
@@ -51,16 +170,27 @@ cdef class Screen:
 		self.col_end = self.width - self._get_gutter_width(self.line_end)
 		self.last_gutter_width = self._get_gutter_width(self.line_end)
 		self.clear()
+		self.invalidate()
 
 	# update the window and buffer
 	def update(self, win, buffer):
 		self.win = win
 		self.buffer = buffer
+		self.all_col_spans = None
+		self.invalidate()
 
-	# clear the screen buffer
+	# forgets the frame last drawn, so that the next one is drawn in full: called when the window
+	# may no longer hold it (e.g. when something else has been drawn over it)
+	def invalidate(self):
+		self.last_screen_buffer = None
+
+	# clear the screen buffer: the style buffer is only reallocated when the size changes
 	cdef clear(self):
-		self.screen_buffer = [ " " * self.width for y in range(self.height) ]
-		self.style_buffer = [ [ gc("editor-background") for x in range(self.width) ] for y in range(self.height) ]
+		self.screen_buffer = [ " " * self.width ] * self.height
+		if(self.style_array == None or len(self.style_array) != self.height * self.width):
+			self.style_array = array("l", [ 0 ]) * (self.height * self.width)
+			self.style_buffer = self.style_array
+		self.style_buffer[:] = gc("editor-background")
 
 	# put a string in a position
 	cdef putstr(self, int y, int x, s):
@@ -73,10 +203,7 @@ cdef class Screen:
 
 	# show the fake cursor in the specified location
 	cdef put_cursor(self, int y, int x):
-		try:
-			self.style_buffer[y][x] = gc("cursor")
-		except:
-			pass
+		if(y >= 0 and y < self.height and x >= 0 and x < self.width): self.style_buffer[y * self.width + x] = gc("cursor")
 
 	# highlight a line
 	cdef highlight_line(self, int y, int gutter_width):
@@ -84,20 +211,16 @@ cdef class Screen:
 
 	# set the style of the gutter
 	cdef set_gutter_style(self, int gutter_width):
+		style = gc("line-number")
 		for y in range(self.height):
-			self.set_style(y, 0, gutter_width, gc("line-number"))
+			self.set_style(y, 0, gutter_width, style)
 
 	# set the style of a portion in the screen buffer from [x_start = inclusive, x_end = exclusive)
-	cdef set_style(self, int y, int x_start, int x_end, style):
-		for x in range(x_start, x_end):
-			self.style_buffer[y][x] = style
-
-	cdef set_style_single(self, pos, style):
-		try:
-			self.style_buffer[pos.y][pos.x] = style
-			return True
-		except:
-			return False
+	cdef set_style(self, int y, int x_start, int x_end, long style):
+		if(y < 0 or y >= self.height): return
+		x_start = max(x_start, 0)
+		x_end = min(x_end, self.width)
+		if(x_end > x_start): self.style_buffer[y * self.width + x_start : y * self.width + x_end] = style
 
 	# determine the space to be reserved for the gutter (left, to show line number) = 1 space on either side and linenumber in middle
 	cdef _get_gutter_width(self, int line_end):
@@ -119,27 +242,53 @@ cdef class Screen:
 		return sorted(pos)
 
 	def reflow_all(self, width, lines, tab_size, word_wrap, hard_wrap):
-		self.all_col_spans = dict()
-		self.mapping_real_line_to_rendered_line = dict()		# only the 1st rendered line
-		self.mapping_rendered_line_to_real_line = dict()		# contains tuple(real_line_index, subline_offset)
+		self.layout_lines = lines
+		self.dirty_start = -1
+		if(lines.is_lazy() and not word_wrap):
+			self.all_col_spans = UnwrappedColSpans(lines, tab_size)
+			self.layout = UnwrappedLineLayout(lines)
+			self.total_rendered_lines = len(lines)
+			return
+
+		self.all_col_spans = [ self.reflow(width, line, tab_size, word_wrap, hard_wrap) for line in lines ]
+		self.layout = LineLayout([ len(col_spans) or 1 for col_spans in self.all_col_spans ])		# (an empty line takes 1 rendered line)
+		self.total_rendered_lines = self.layout.get_total_rows()
+
+	# records an edit notice: lines [start, start + old_count) of the buffer have been replaced by new_count lines;
+	# notices are merged into a single range of lines to be reflowed by reflow_dirty_lines()
+	def notify_lines_changed(self, int start, int old_count, int new_count):
+		cdef int first, last
+		if(self.all_col_spans == None): return
+		if(self.dirty_start < 0):
+			self.dirty_start = self.dirty_end = self.dirty_old_end = start
 		
-		self.total_rendered_lines = 0
-		rendered_counter = 0
-		for i, line in enumerate(lines):
-			self.all_col_spans[i] = self.reflow(width, line, tab_size, word_wrap, hard_wrap)
-			self.mapping_real_line_to_rendered_line[i] = rendered_counter
-			
-			k = len(self.all_col_spans[i])
-			for j in range(k):
-				self.mapping_rendered_line_to_real_line[rendered_counter+j] = (i,j)
-
-			if(k == 0):
-				self.total_rendered_lines += 1
-				self.mapping_rendered_line_to_real_line[rendered_counter] = (i,0)
-				rendered_counter += 1
-			else:
-				self.total_rendered_lines += k
-				rendered_counter += k
+		# lines in [dirty_start, dirty_end) now stand in place of lines in [dirty_start, dirty_old_end) of the layout
+		first = min([self.dirty_start, start])
+		last = max([self.dirty_end, start + old_count])
+		self.dirty_old_end = last + self.dirty_old_end - self.dirty_end
+		self.dirty_end = last + new_count - old_count
+		self.dirty_start = first
+
+	# reflows only the lines changed since the layout was last computed, and patches the layout in place;
+	# reflows all lines if the changes are not accounted for by the edit notices received
+	def reflow_dirty_lines(self, width, lines, tab_size, word_wrap, hard_wrap):
+		cdef int start, end, old_end
+		if(self.layout_lines is not lines or isinstance(self.all_col_spans, UnwrappedColSpans)):
+			self.reflow_all(width, lines, tab_size, word_wrap, hard_wrap)
+			return
+
+		if(self.dirty_start >= 0):
+			start, end, old_end = self.dirty_start, self.dirty_end, self.dirty_old_end
+			self.dirty_start = -1
+			if(len(lines) != len(self.all_col_spans) + end - old_end):
+				self.reflow_all(width, lines, tab_size, word_wrap, hard_wrap)
+				return
+			col_spans = [ self.reflow(width, line, tab_size, word_wrap, hard_wrap) for line in lines[start:end] ]
+			self.all_col_spans[start:old_end] = col_spans
+			self.layout.replace(start, old_end, [ len(cs) or 1 for cs in col_spans ])
+			self.total_rendered_lines = self.layout.get_total_rows()
+		elif(len(lines) != len(self.all_col_spans)):
+			self.reflow_all(width, lines, tab_size, word_wrap, hard_wrap)
 
 	# reflow a line of text (depending on wrap settings and tab-size) and return a list of column-spans (after tab-expansion)
 	cdef reflow(self, int width, line, int tab_size, bint word_wrap, bint hard_wrap):
@@ -196,59 +345,29 @@ cdef class Screen:
 		return col_spans
 
 	cdef _get_line_start(self, int gutter_width, int nlines, lines, int tab_size, bint word_wrap, bint hard_wrap):
-		cdef int rendered_line_index = -1
-		cdef int i, real_line_start, line_start_offset, j
-
-		for i in range(nlines):
-			col_spans = self.all_col_spans[i]
-			if(len(col_spans) == 0): 
-				rendered_line_index += 1
-				if(rendered_line_index == self.line_start):
-					real_line_start = i
-					line_start_col_spans = col_spans			# col positions are AFTER tab expansion
-					line_start_offset = 0
-					return (real_line_start, line_start_col_spans, line_start_offset)
-			else:
-				for j in range(len(col_spans)):
-					rendered_line_index += 1
-					if(rendered_line_index == self.line_start):
-						real_line_start = i
-						line_start_col_spans = col_spans			# col positions are AFTER tab expansion
-						line_start_offset = j
-						return (real_line_start, line_start_col_spans, line_start_offset)
+		cdef int real_line_start, line_start_offset
+		real_line_start, line_start_offset = self.layout.get_line_at_row(self.line_start)
+		line_start_col_spans = self.all_col_spans[real_line_start]			# col positions are AFTER tab expansion
+		return (real_line_start, line_start_col_spans, line_start_offset)
 	
 	cdef perform_syntax_highlighting(self, lines, int text_area_width, real_curpos, int tab_size, bint word_wrap, bint hard_wrap):
 		cdef int start_line_index, end_line_index
 		start_line_index, end_line_index = self.real_line_start_index_visible, self.real_line_end_index_visible
 		cdef int gutter_width = self.width - text_area_width
-		cdef int line_index, visible_line_index
+		cdef int line_index, start_index
 
 		if(self.buffer.formatter.lexer == None): return
 
 		# cannot use join as it will mess up the lexer indices with the insertion of newline characters
 		for line_index in range(start_line_index, end_line_index):
-			temp = CursorPosition(line_index, 0)
-			visible_line_index = self.mapping_real_line_to_rendered_line[line_index] - 1
-
 			data = lines[line_index]
+			column_map = self.get_column_map(line_index, data, tab_size)
+			
 			# lex-data contains a list of tuples(index, style, text)
 			lex_data = self.buffer.format_code(data)
 			for style_info in lex_data:
 				start_index = style_info[0]
-				style = style_info[1]
-				text = style_info[2]
-				temp.x = start_index
-				
-				rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				if(rendered_pos.x >= self.col_end): break
-
-				for index in range(len(text)):
-					temp.x = start_index + index
-					rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-					if(rendered_pos.x >= self.col_end): continue
-
-					visual_pos = self.translate_rendered_to_visual_pos(rendered_pos, gutter_width)
-					self.set_style_single(visual_pos, style)
+				self.paint_span(line_index, column_map, start_index, start_index + len(style_info[2]), style_info[1], gutter_width, True)
 
 	cdef is_start_before_end(self, start, end):
 		if(start.y == end.y and start.x < end.x): return True
@@ -257,42 +376,16 @@ cdef class Screen:
 
 	cdef perform_selection_highlighting(self, lines, int text_area_width, real_curpos, rendered_curpos, int tab_size, bint word_wrap, bint hard_wrap, selection_info):
 		sel_start, sel_end = self.get_selection_endpoints(selection_info["start"], selection_info["end"])
-		cdef int max_start_x = len(lines[sel_start.y])
-		temp = copy.copy(sel_start)
 		cdef int gutter_width = self.width - text_area_width
-		cdef int y, x
-		cdef int visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-		if(sel_start.y != sel_end.y):
-			for x in range(sel_start.x, max_start_x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection"))
-		else:
-			for x in range(sel_start.x, sel_end.x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection"))
-
-		for y in range(sel_start.y + 1, sel_end.y):
-			temp.y = y
-			visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-			max_start_x = len(lines[y])
-			for x in range(max_start_x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection"))
-		
-		if(sel_start.y != sel_end.y):
-			temp.y = sel_end.y
-			visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-			for x in range(sel_end.x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection"))
+		cdef int y, x_start, x_end
+		style = gc("selection")
+
+		# only the lines on screen are painted
+		for y in range(max([sel_start.y, self.real_line_start_index_visible]), min([sel_end.y + 1, self.real_line_end_index_visible])):
+			line = lines[y]
+			x_start = (sel_start.x if y == sel_start.y else 0)
+			x_end = (sel_end.x if y == sel_end.y else len(line))
+			self.paint_span(y, self.get_column_map(y, line, tab_size), x_start, x_end, style, gutter_width, False)
 
 	cdef translate_rendered_to_visual_pos(self, rendered_pos, int gutter_width):
 		if(self.line_start > rendered_pos.y or self.col_start > rendered_pos.x):
@@ -312,48 +405,19 @@ cdef class Screen:
 
 	cdef perform_search_highlighting(self, lines, int text_area_width, real_curpos, int tab_size, bint word_wrap, bint hard_wrap, highlight_info):
 		search_text = highlight_info["text"]
-		cdef bint match_case = highlight_info["match_case"]
-		cdef bint whole_words = highlight_info["whole_words"]
-		cdef bint is_regex = highlight_info["is_regex"]
-
 		if(search_text == None): return
+
+		pattern = get_search_pattern(search_text, highlight_info["match_case"], highlight_info["whole_words"], highlight_info["is_regex"])
+		if(not pattern.is_valid()): return
 		
 		cdef int gutter_width = self.width - text_area_width
-		lower_stext = search_text.lower()
-		cdef int n = len(search_text)
 		cdef int start_line_index, end_line_index
 		start_line_index, end_line_index = self.real_line_start_index_visible, self.real_line_end_index_visible
-		cdef int y, i, pos, visible_line_index
-
-		for y in range(start_line_index, end_line_index):
-			vtext = lines[y]
-			lower_vtext = vtext.lower()			
+		cdef int y, pos, length
+		style = gc("highlight")
 
-			corpus = (vtext if match_case else lower_vtext)
-			if(is_regex or match_case):
-				search = search_text
-			else:
-				search = lower_stext
-
-			pos = -1
-			real_pos = CursorPosition(y, pos)
-			visible_line_index = self.get_pre_translation_parameters(lines, real_pos, text_area_width, tab_size, word_wrap, hard_wrap)
-			
-			while(True):
-				if(is_regex):
-					pos = find_regex(corpus[pos+1:], search)
-				elif(whole_words):
-					pos = find_whole_word(corpus[pos+1:], search)
-				else:
-					pos = corpus.find(search, pos+1)
-				
-				if(pos < 0): break
-
-				for i in range(n):
-					real_pos.x = pos + i
-					rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, real_pos, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-					visual_pos = self.translate_rendered_to_visual_pos(rendered_pos, gutter_width)
-					self.set_style_single(visual_pos, gc("highlight"))
+		for y, pos, length in pattern.find_all(lines, start_line_index, end_line_index):
+			self.paint_span(y, self.get_column_map(y, lines[y], tab_size), pos, pos + length, style, gutter_width, False)
 
 	# returns a dict() with key=rendered_curpos(sub_line_offset_y, col) and value = real_curpos.x
 	cdef get_correspondence(self, line, int width, int tab_size, bint word_wrap, bint hard_wrap):
@@ -384,7 +448,7 @@ cdef class Screen:
 		cdef int i, j, sub_line_offset, real_line_index
 		cdef int max_col
 
-		real_line_index, sub_line_offset = self.mapping_rendered_line_to_real_line[rendered_curpos.y]
+		real_line_index, sub_line_offset = self.layout.get_line_at_row(rendered_curpos.y)
 		correspondence = self.get_correspondence(lines[real_line_index], width, tab_size, word_wrap, hard_wrap)
 
 		real_col = correspondence.get((sub_line_offset, rendered_curpos.x))
@@ -411,6 +475,48 @@ cdef class Screen:
 			if(real_curpos.x >= cs[0] and real_curpos.x <= cs[1]): return (y,col_spans)
 		return (len(col_spans)-1, col_spans)
 
+	# returns the rendered column (after tab-expansion) of each real column of a line, and of the end of the line;
+	# built once per frame for each line painted (see paint_span())
+	cdef get_column_map(self, int line_index, line, int tab_size):
+		cdef int x = 0
+		column_map = self.column_maps.get(line_index)
+		if(column_map != None): return column_map
+		if("\t" not in line):
+			column_map = range(len(line) + 1)
+		else:
+			column_map = [ 0 ]
+			for c in line:
+				x += ((tab_size - (x % tab_size)) if c == "\t" else 1)
+				column_map.append(x)
+		self.column_maps[line_index] = column_map
+		return column_map
+
+	# sets the style of the cells rendered from real columns [x_start, x_end) of a line, a wrapped segment at a time;
+	# if clip is True, columns beyond col_end are left unstyled
+	cdef paint_span(self, int line_index, column_map, int x_start, int x_end, style, int gutter_width, bint clip):
+		cdef int rx_start, rx_end, first_row, i, y, cs_start, cs_end, start, end
+		if(x_end <= x_start): return
+		rx_start = column_map[x_start]
+		rx_end = column_map[x_end]
+		first_row = self.layout.get_first_row(line_index)
+		col_spans = self.all_col_spans[line_index]
+		for i in range(len(col_spans)):
+			cs_start, cs_end = col_spans[i]
+			cs_end += 1
+			if(cs_end <= rx_start): continue
+			if(cs_start >= rx_end): break
+			y = first_row + i - self.line_start
+			if(y < 0): continue
+			if(y >= self.height): break
+			
+			# columns within the wrapped segment, then on screen
+			start = max([rx_start, cs_start]) - cs_start
+			end = min([rx_end, cs_end]) - cs_start
+			if(clip): end = min([end, self.col_end])
+			start = max([start, self.col_start]) - self.col_start + gutter_width
+			end = min([end - self.col_start + gutter_width, self.width])
+			self.set_style(y, start, end, style)
+
 	cdef translate_real_curpos_col_to_rendered_curpos_col(self, line, int tab_size, int real_col):
 		cdef int x = 0, i
 		for i in range(real_col):
@@ -420,22 +526,11 @@ cdef class Screen:
 				x += 1
 		return x
 
-	# returns the visible-line-index for a line after reflowing: for optimizing translation from real to rendered-curpos (during selection highlighting)
-	cdef get_pre_translation_parameters(self, lines, real_curpos, int text_area_width, int tab_size, bint word_wrap, bint hard_wrap):
-		cdef int visible_line_index = -1, y
-		for y in range(real_curpos.y):
-			if(self.all_col_spans == None):
-				col_spans = self.reflow(text_area_width, lines[y], tab_size, word_wrap, hard_wrap)
-			else:
-				col_spans = self.all_col_spans[y]
-			visible_line_index += (len(col_spans) if len(col_spans) > 0 else 1)
-		return visible_line_index
-		
 	cdef translate_real_curpos_to_rendered_curpos(self, lines, real_curpos, int text_area_width, int tab_size, bint word_wrap, bint hard_wrap, int visible_line_index = -1):
 		cdef int y, i, n, rendered_x, rendered_line_col, current_line_length
 
 		if(visible_line_index < 0):
-			visible_line_index = self.mapping_real_line_to_rendered_line[real_curpos.y] - 1
+			visible_line_index = self.layout.get_first_row(real_curpos.y) - 1
 			
 		if(self.all_col_spans == None):
 			col_spans = self.reflow(text_area_width, lines[real_curpos.y], tab_size, word_wrap, hard_wrap)
@@ -493,6 +588,8 @@ cdef class Screen:
 
 	# <--------- called externally: do not Cythonize() ---------------------->
 
+	# brings the layout up to date: all lines are reflowed if forced, or if the settings have changed;
+	# otherwise only the lines changed since (as reported by notify_lines_changed()) are
 	def recompute(self, real_curpos, tab_size, word_wrap, hard_wrap, forced=True):
 		if(self.buffer == None): return
 
@@ -500,12 +597,14 @@ cdef class Screen:
 		self.last_gutter_width = gutter_width
 		text_area_width = self.width - gutter_width
 
-		if(forced or self.last_text_area_width != text_area_width or self.last_tab_size != tab_size or self.last_word_wrap != word_wrap or self.last_hard_wrap != hard_wrap):
+		if(forced or self.all_col_spans == None or self.last_text_area_width != text_area_width or self.last_tab_size != tab_size or self.last_word_wrap != word_wrap or self.last_hard_wrap != hard_wrap):
 			self.reflow_all(text_area_width, self.buffer.lines, tab_size, word_wrap, hard_wrap)
 			self.last_text_area_width = text_area_width
 			self.last_tab_size = tab_size
 			self.last_word_wrap = word_wrap
 			self.last_hard_wrap = hard_wrap
+		else:
+			self.reflow_dirty_lines(text_area_width, self.buffer.lines, tab_size, word_wrap, hard_wrap)
 
 	# render text data to screen buffer
 	def render(self, real_curpos, tab_size, word_wrap, hard_wrap, selection_info, highlight_info, is_in_focus, slave_cursors, stylize = True):
@@ -516,6 +615,7 @@ cdef class Screen:
 
 		# initialize
 		self.clear()
+		self.column_maps = dict()
 		y = 0
 
 		# determine line(start,end) and col(start,end): and return rendered_curpos
@@ -523,6 +623,7 @@ cdef class Screen:
 		# won't be a problem if you allow line numbers to start from screen-edge: that space will be taken up if user scrolls so much that 1/2 digits are added in the next scroll()
 		
 		#t1 = datetime.datetime.now()
+		if(self.all_col_spans != None): self.reflow_dirty_lines(self.last_text_area_width, self.buffer.lines, self.last_tab_size, self.last_word_wrap, self.last_hard_wrap)
 		rendered_curpos = self.scroll(self.buffer.lines, real_curpos, self.width - self._get_gutter_width(self.line_end), tab_size, word_wrap, hard_wrap)
 
 		# set up lines
@@ -680,19 +781,49 @@ cdef class Screen:
 			sel_start, sel_end = sel_end, sel_start
 		return(sel_start, sel_end)
 
-	# draw the screen-buffer on screen
+	# draw the screen-buffer on screen: only the part of each row between the first and the last cell
+	# changed since the last frame drawn is written (rows which have not changed are skipped)
 	def draw(self, offset_y, offset_x):
 		# optimized drawing routine: call addstr() only if style changes
-		cdef int x, y, last_style_x
+		cdef int x, y, last_style_x, row_start, first_x, last_x
+		cdef long last_style
+		cdef long[:] styles = self.style_buffer
+		cdef long[:] last_styles
+		cdef str text, last_text
+		
+		last_rows = self.last_screen_buffer
+		if(last_rows != None and (len(last_rows) != self.height or len(self.last_style_array) != len(self.style_array) or self.last_offset_y != offset_y or self.last_offset_x != offset_x)): last_rows = None
+		if(last_rows != None): last_styles = self.last_style_array
+
 		for y in range(self.height):
-			last_style = self.style_buffer[y][0]
-			last_style_x = 0
-			for x in range(1, self.width):
-				if(self.style_buffer[y][x] == last_style): continue
-				self.win.addstr(offset_y + y, offset_x + last_style_x, self.screen_buffer[y][last_style_x:x], last_style)
-				last_style = self.style_buffer[y][x]
+			row_start = y * self.width
+			text = self.screen_buffer[y]
+			first_x = 0
+			last_x = self.width - 1
+			if(last_rows != None):
+				# find the changed part of the row
+				last_text = last_rows[y]
+				while(first_x <= last_x and text[first_x] == last_text[first_x] and styles[row_start + first_x] == last_styles[row_start + first_x]): first_x += 1
+				if(first_x > last_x): continue
+				while(text[last_x] == last_text[last_x] and styles[row_start + last_x] == last_styles[row_start + last_x]): last_x -= 1
+
+			last_style = styles[row_start + first_x]
+			last_style_x = first_x
+			for x in range(first_x + 1, last_x + 1):
+				if(styles[row_start + x] == last_style): continue
+				self.win.addstr(offset_y + y, offset_x + last_style_x, text[last_style_x:x], last_style)
+				last_style = styles[row_start + x]
 				last_style_x = x
-			self.win.addstr(offset_y + y, offset_x + last_style_x, self.screen_buffer[y][last_style_x:self.width], last_style)
+			self.win.addstr(offset_y + y, offset_x + last_style_x, text[last_style_x:last_x + 1], last_style)
+
+		# keep the frame drawn, to compare the next one with
+		self.last_screen_buffer = list(self.screen_buffer)
+		if(self.last_style_array == None or len(self.last_style_array) != len(self.style_array)):
+			self.last_style_array = array("l", self.style_array)
+		else:
+			self.last_style_array[:] = self.style_array
+		self.last_offset_y = offset_y
+		self.last_offset_x = offset_x
 
 	# <------------------------------- mouse handling functions ----------------------------------->
 	def get_curpos_after_click(self, y, x, lines, width, tab_size, word_wrap, hard_wrap):
@@ -0,0 +1,163 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements searching of text: plain, whole-word and regular-expression searches
+# over lists of lines (or TextStorage objects), with results as tuples(line, col, length), and
+# the replacement of the matches found
+
+import re
+import functools
+from bisect import bisect_right
+from itertools import accumulate, groupby
+from operator import itemgetter
+
+SEARCH_CHUNK_LINES	= 4096			# lines joined into a single text to be searched in one go
+WORD_SEPARATORS		= "[]{}()+-*/%=<>.,/?;:'\"!|&^ "
+MAX_CACHED_PATTERNS	= 32
+
+# SearchPattern class: a search compiled once into a regular expression (case folding and word
+# boundaries included); lines are searched a chunk at a time, joined by newlines, and the offsets
+# of matches are mapped back to (line, col) using the prefix-sums of the lengths of the lines;
+# matches are never reported across lines, and empty matches (e.g. of "^") are not reported
+class SearchPattern:
+	def __init__(self, search_text, match_case, whole_words, is_regex):
+		self.search_text = search_text
+		self.match_case = match_case
+		self.whole_words = whole_words
+		self.is_regex = is_regex
+		self.error = None			# set if search_text is not a valid regular expression
+		self.pattern = None
+
+		flags = re.MULTILINE | (0 if match_case else re.IGNORECASE)
+		if(is_regex):
+			regex = search_text
+		elif(whole_words):
+			# a word must be preceded and followed by a separator (or the start/end of the line)
+			separators = re.escape(WORD_SEPARATORS) + "\\n"
+			regex = "(?<![^" + separators + "])" + re.escape(search_text) + "(?![^" + separators + "])"
+		else:
+			regex = re.escape(search_text)
+
+		try:
+			if(len(search_text) > 0): self.pattern = re.compile(regex, flags)
+		except re.error as e:
+			self.error = e
+
+	# checks if the pattern can match anything (it cannot if it is empty or invalid)
+	def is_valid(self):
+		return (self.pattern != None)
+
+	# returns all matches in lines [start, end) as a list of tuples(line, col, length)
+	def find_all(self, lines, start = 0, end = None):
+		results = list()
+		if(self.pattern == None): return results
+		if(end == None): end = len(lines)
+		for chunk_start in range(start, end, SEARCH_CHUNK_LINES):
+			chunk_end = min([end, chunk_start + SEARCH_CHUNK_LINES])
+			self.__find_in_chunk(lines[chunk_start:chunk_end], chunk_start, results)
+		return results
+
+	# returns the length of the match starting exactly at col in a line, or -1 if there is none
+	def match_at(self, line, col):
+		if(self.pattern == None): return -1
+		m = self.pattern.match(line, col)
+		if(m == None or m.end() == col): return -1
+		return m.end() - col
+
+	# returns the text to replace a match at (col, length) in a line with: for regular expressions,
+	# replace_text with its group-references (e.g. \1 or \g<name>) expanded; raises re.error if
+	# they are invalid, and returns None if the match cannot be found again
+	def expand(self, line, col, length, replace_text):
+		if(not self.is_regex or replace_text.find("\\") < 0): return replace_text
+		m = self.pattern.match(line, col)
+		if(m == None or m.end() != col + length): m = self.pattern.match(line, col, col + length)
+		return (None if m == None else m.expand(replace_text))
+
+	# raises re.error if the group-references in replace_text are invalid (checked before replacing anything)
+	def check_replacement(self, replace_text):
+		if(self.is_regex and self.pattern != None and replace_text.find("\\") > -1): self.pattern.sub(replace_text, "")
+
+	# returns all matches in a single line as a list of tuples(col, length)
+	def find_in_line(self, line):
+		return [ (col, length) for _, col, length in self.find_all([line]) ]
+
+	# returns the first match after (y, x), wrapping around to the start; returns tuple(line, col, length) or None
+	def find_next(self, lines, y, x):
+		if(self.pattern == None): return None
+		n = len(lines)
+		for start in range(y, n, SEARCH_CHUNK_LINES):
+			for result in self.find_all(lines, start, min([n, start + SEARCH_CHUNK_LINES])):
+				if(result[0] > y or result[1] > x): return result
+		for start in range(0, y + 1, SEARCH_CHUNK_LINES):
+			results = self.find_all(lines, start, min([y + 1, start + SEARCH_CHUNK_LINES]))
+			if(len(results) > 0): return results[0]
+		return None
+
+	# returns the last match before (y, x), wrapping around to the end; returns tuple(line, col, length) or None
+	def find_previous(self, lines, y, x):
+		if(self.pattern == None): return None
+		n = len(lines)
+		for end in range(y + 1, 0, -SEARCH_CHUNK_LINES):
+			for result in reversed(self.find_all(lines, max([0, end - SEARCH_CHUNK_LINES]), end)):
+				if(result[0] < y or result[1] < x): return result
+		for end in range(n, y, -SEARCH_CHUNK_LINES):
+			results = self.find_all(lines, max([y, end - SEARCH_CHUNK_LINES]), end)
+			if(len(results) > 0): return results[-1]
+		return None
+
+	# <------------------- private functions ---------------------->
+
+	def __find_in_chunk(self, chunk, first_line, results):
+		text = "\n".join(chunk)
+		starts = list(accumulate([ len(line) + 1 for line in chunk ], initial=0))		# offset of each line in text
+		pos = 0
+		while(True):
+			restart = None
+			for m in self.pattern.finditer(text, pos):
+				mstart, mend = m.span()
+				line = bisect_right(starts, mstart) - 1
+				line_end = starts[line + 1] - 1
+				if(mend > line_end):
+					# the match runs into the next line: look for one within the line instead
+					m = self.pattern.search(text, mstart, line_end)
+					if(m == None):
+						restart = line_end + 1
+						break
+					mstart, mend = m.span()
+					restart = max([mend, mstart + 1])
+				if(mend > mstart): results.append( (first_line + line, mstart - starts[line], mend - mstart) )
+				if(restart != None): break
+			if(restart == None or restart > len(text)): return
+			pos = restart
+
+# returns a compiled SearchPattern, reusing one compiled earlier for the same search
+@functools.lru_cache(maxsize=MAX_CACHED_PATTERNS)
+def get_search_pattern(search_text, match_case, whole_words, is_regex):
+	return SearchPattern(search_text, bool(match_case), bool(whole_words), bool(is_regex))
+
+# replaces matches (tuples(line, col, length), as found by SearchPattern.find_all()) in lines, building
+# each affected line only once; group-references in replace_text are expanded if a regular-expression
+# pattern is given; returns tuple(list of tuples(line_index, new_line) in the order of the lines, count
+# of matches replaced); new lines contain newlines if the replacements do; raises re.error if the
+# group-references are invalid
+def replace_matches(lines, matches, replace_text, pattern = None):
+	changed = list()
+	count = 0
+	for line_index, group in groupby(sorted(matches), key=itemgetter(0)):
+		line = lines[line_index]
+		parts = list()
+		pos = 0
+		for _, col, length in group:
+			if(col < pos): continue					# (overlaps the previous match)
+			text = (replace_text if pattern == None else pattern.expand(line, col, length, replace_text))
+			if(text == None): continue
+			parts.append(line[pos:col])
+			parts.append(text)
+			pos = col + length
+			count += 1
+		if(len(parts) == 0): continue
+		parts.append(line[pos:])
+		changed.append( (line_index, "".join(parts)) )
+	return (changed, count)
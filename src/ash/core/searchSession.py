@@ -0,0 +1,434 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements live searches across all the buffers and stubbed files of a project,
+# and the replacement of matches in files on disk
+
+from ash.core.searchEngine import *
+from ash.core.trigramIndex import *
+from ash.core.projectScanner import *
+from ash.core.fileSaver import *
+
+SEARCH_REPORT_INTERVAL	= 0.05			# minimum time (in seconds) between two batches of results of a ProjectSearch
+MAX_SEARCH_HITS			= 10000			# a ProjectSearch stops once it has found this many hits
+GREP_CONTEXT_LENGTH		= 80			# characters kept on either side of a match found by grep_file()
+
+# reads a file to be searched, classifying it first if its encoding is not known; returns tuple(lines,
+# line-ending, encoding), or None if it is binary or cannot be read; the metadata-cache is not used,
+# as this runs in the search thread or in a worker process
+def read_file_for_search(filename, encoding):
+	try:
+		if(encoding == None):
+			binary, encoding = scan_file(filename)
+			if(binary): return None
+		lines, newline = read_text_file(filename, encoding)
+		return (lines, newline, encoding)
+	except (OSError, UnicodeError, LookupError):
+		return None
+
+# searches a file on disk: returns a list of tuples(line_index, col, length)
+def search_file(filename, encoding, pattern):
+	data = read_file_for_search(filename, encoding)
+	return (list() if data == None else pattern.find_all(data[0]))
+
+# searches a file on disk, grep-style (see ProjectSearch): task is tuple("g", filename, encoding, query);
+# returns a list of tuples(line_index, col, length, context-start, context), the context being the part
+# of the line around the match (so that the file need not be read again to show it); runs in a worker process
+def grep_file(task):
+	data = read_file_for_search(task[1], task[2])
+	if(data == None): return list()
+	lines = data[0]
+	hits = list()
+	for line_index, col, length in get_search_pattern(*task[3]).find_all(lines):
+		start = max([0, col - GREP_CONTEXT_LENGTH])
+		hits.append( (line_index, col, length, start, lines[line_index][start:col + length + GREP_CONTEXT_LENGTH]) )
+	return hits
+
+# replaces all matches in a file on disk: task is tuple("r", filename, encoding, query, replace_text);
+# a file with matches is written anew through a FileSaver (a temporary file renamed over it), with its
+# encoding and line-endings unchanged; returns tuple(count of matches replaced, error message or None);
+# runs in a worker process, one file at a time (so that memory-use is bounded by the largest file)
+def replace_in_file(task):
+	kind, filename, encoding, query, replace_text = task
+	data = read_file_for_search(filename, encoding)
+	if(data == None): return (0, None)
+	lines, newline, encoding = data
+	pattern = get_search_pattern(*query)
+	try:
+		changed, count = replace_matches(lines, pattern.find_all(lines), replace_text, pattern)
+	except re.error as e:
+		return (0, str(e))
+	if(count == 0): return (0, None)
+
+	new_lines = list()
+	pos = 0
+	for line_index, new_line in changed:
+		new_lines.extend(lines[pos:line_index])
+		new_lines.extend(new_line.split("\n"))
+		pos = line_index + 1
+	new_lines.extend(lines[pos:])
+
+	saver = FileSaver(filename, [ new_lines ], encoding, newline, None)
+	saver.write()
+	if(saver.error != None): return (0, str(saver.error))
+	sync_directory(os.path.dirname(saver.target))
+	return (count, None)
+
+# ProjectSearch class: searches a list of tasks on a thread of its own; a task is either
+# tuple("b", buffer-ID, buffer-version, snapshot of the lines), tuple("f", filename, encoding, [size, mtime]) or,
+# for files searched grep-style, tuple("g", filename, encoding, query); the tasks of files may also be
+# listed on the search thread, by get_file_tasks(search), as that takes a stat() per file; "g" tasks
+# are searched last, on the given WorkerPool (see ProjectScanner and grep_file()); results are handed over
+# as they are found, in batches: on_results(search, list of tuple(task, hits)) and on_finish(search)
+# are called from the search thread; the first batch with hits is handed over at once, and later ones
+# at most every SEARCH_REPORT_INTERVAL seconds; the search stops once max_hits hits have been found
+# (the hits of the task it stops in are then cut short)
+class ProjectSearch:
+	def __init__(self, query, pattern, tasks, on_results, on_finish, max_hits = MAX_SEARCH_HITS, get_file_tasks = None, pool = None):
+		self.query = query
+		self.pattern = pattern
+		self.tasks = tasks
+		self.get_file_tasks = get_file_tasks
+		self.on_results = on_results
+		self.on_finish = on_finish
+		self.max_hits = max_hits
+		self.cancelled = False
+		self.done = 0
+		self.hit_count = 0
+		self.truncated = False				# set if the search was stopped at max_hits
+		self.partial = None					# the task whose hits were cut short
+		self.scanner = None					# set while the "g" tasks are being searched
+		self.pool = pool
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	# starts searching
+	def start(self):
+		self.thread.start()
+
+	# stops searching: no more callbacks are made once the current task is done
+	def cancel(self):
+		self.cancelled = True
+		scanner = self.scanner
+		if(scanner != None): scanner.cancel()
+
+	# returns the fraction of tasks searched so far
+	def get_progress(self):
+		if(len(self.tasks) == 0): return 1.0
+		return self.done / len(self.tasks)
+
+	def run(self):
+		self.batch = list()
+		self.reported_hits = False
+		self.last_report = time.time()
+		self.__search_tasks(self.tasks)
+		if(self.get_file_tasks != None and not self.truncated and not self.cancelled):
+			file_tasks = self.get_file_tasks(self)			# (listed once the buffers are searched)
+			self.tasks = self.tasks + file_tasks
+			self.__search_tasks(file_tasks)
+		if(self.cancelled): return
+
+		grep_tasks = [ task for task in self.tasks if task[0] == "g" ]
+		if(len(grep_tasks) > 0 and not self.truncated):
+			self.scanner = ProjectScanner(grep_tasks, self.on_grep_results, lambda scanner: None, grep_file, self.pool)
+			if(not self.cancelled): self.scanner.run()
+			self.scanner = None
+		if(self.cancelled): return
+		if(len(self.batch) > 0): self.__report()
+		self.on_finish(self)
+
+	# called from the ProjectScanner (on this thread)
+	def on_grep_results(self, scanner, results, done):
+		for task, hits in results:
+			if(self.cancelled): return
+			if(self.hit_count >= self.max_hits):
+				self.truncated = True
+				scanner.cancel()
+				return
+			self.__add_hits(task, hits)
+
+	# <------------------- private functions ---------------------->
+
+	# searches the tasks other than "g" ones, until the search is cancelled or has found max_hits hits
+	def __search_tasks(self, tasks):
+		for task in tasks:
+			if(task[0] == "g"): continue
+			if(self.cancelled): return
+			if(self.hit_count >= self.max_hits):
+				self.truncated = True
+				return
+			self.__add_hits(task, (self.__search_snapshot(task[3]) if task[0] == "b" else search_file(task[1], task[2], self.pattern)))
+
+	# searches the blocks of lines of a snapshot (see TextStorage.snapshot())
+	def __search_snapshot(self, blocks):
+		hits = list()
+		first_line = 0
+		for block in blocks:
+			if(self.cancelled): break
+			lines = (block if isinstance(block, list) else list(block))
+			hits.extend([ (first_line + line_index, col, length) for line_index, col, length in self.pattern.find_all(lines) ])
+			first_line += len(lines)
+		return hits
+
+	# adds the hits of a task to the batch, cutting them short at max_hits; hands the batch over if it is due
+	def __add_hits(self, task, hits):
+		if(self.hit_count + len(hits) > self.max_hits):
+			hits = hits[0:self.max_hits - self.hit_count]
+			self.truncated = True
+			self.partial = task
+		self.hit_count += len(hits)
+		self.batch.append( (task, hits) )
+
+		now = time.time()
+		if((not self.reported_hits and len(hits) > 0) or now - self.last_report >= SEARCH_REPORT_INTERVAL):
+			if(self.cancelled): return
+			self.reported_hits = (self.hit_count > 0)
+			self.last_report = now
+			self.__report()
+
+	def __report(self):
+		batch = self.batch
+		self.batch = list()
+		self.done += len(batch)
+		self.on_results(self, batch)
+
+# SearchSession class: runs the successive searches of a live search (e.g. as a query is typed)
+# over the buffers and stubbed files of a BufferManager, remembering the hits in each of them:
+# a buffer is searched again only if it has been edited or the query has changed, and when a
+# plain-text query is extended, only its previous hits are checked again; buffers and files
+# ruled out by the trigram index (see TrigramIndex) are not searched at all; searches are made
+# either at once (find_all()) or in the background (start()), one at a time
+class SearchSession:
+	def __init__(self, buffers):
+		self.buffers = buffers
+		self.buffer_hits = dict()			# buffer-ID -> tuple(query, buffer-version, hits)
+		self.stub_hits = dict()				# filename -> tuple(query, hits, [size, mtime] of the file searched), for stubbed files
+		self.search = None					# the ProjectSearch running in the background, if any
+		self.disk_files = None				# the files of the project on disk, listed when first searched
+		self.on_results = None
+		self.on_finish = None
+
+	# searches everything, reading stubbed files into buffers only if they match; returns a dict of
+	# buffer-ID -> list of tuples(line_index, col, length)
+	def find_all(self, search_text, match_case, whole_words, is_regex):
+		query = (search_text, bool(match_case), bool(whole_words), bool(is_regex))
+		pattern = get_search_pattern(*query)
+		trigrams = (TrigramQuery.create(*query) if pattern.is_valid() else None)
+		results = dict()
+		for bid, buffer in list(self.buffers.buffers.items()):
+			if(buffer == None): continue
+			hits = self.__get_buffer_hits(bid, buffer, query, pattern, trigrams)
+			if(hits == None):
+				hits = pattern.find_all(buffer.lines)
+				self.buffer_hits[bid] = (query, buffer.version, hits)
+			results[bid] = hits
+
+		for filename, stub in list(self.buffers.stubs.items()):
+			hits = self.__get_stub_hits(stub, query, trigrams)
+			if(hits == None):
+				version = get_file_version(filename)
+				hits = stub.find_all(*query)
+				self.stub_hits[filename] = (query, hits, version)
+			if(len(hits) == 0): continue
+			bid = self.__materialize(filename, query, hits)
+			if(bid != None): results[bid] = hits
+		return results
+
+	# starts searching everything in the background (see ProjectSearch), cancelling the previous search:
+	# on_results(dict of buffer-ID -> list of tuples(line_index, col, length)) is called with the hits
+	# known without searching at once, and then with each batch of hits found; on_finish(search) is
+	# called when the search is complete; both are called from the main thread, the search thread
+	# posting them as events (see App.post_event()); returns the ProjectSearch
+	# if project_dir is given, the files under it which have no buffers are searched grep-style instead
+	# of the stubbed files: straight from disk, on a process pool, without being read into buffers; their
+	# hits are keyed by filename, as tuples(line_index, col, length, context-start, context) (see grep_file())
+	def start(self, search_text, match_case, whole_words, is_regex, on_results, on_finish, project_dir = None):
+		self.cancel()
+		query = (search_text, bool(match_case), bool(whole_words), bool(is_regex))
+		pattern = get_search_pattern(*query)
+		trigrams = (TrigramQuery.create(*query) if pattern.is_valid() else None)
+		results = dict()
+		tasks = list()
+		if(pattern.is_valid()):
+			for bid, buffer in list(self.buffers.buffers.items()):
+				if(buffer == None): continue
+				hits = self.__get_buffer_hits(bid, buffer, query, pattern, trigrams, False)
+				if(hits == None):
+					tasks.append( ("b", bid, buffer.version, buffer.lines.snapshot()) )
+				elif(len(hits) > 0):
+					results[bid] = hits
+
+		# the files are checked on the search thread: only the lists to be checked are copied here
+		get_file_tasks = None
+		if(pattern.is_valid() and project_dir != None):
+			if(self.disk_files == None): self.disk_files = list_project_files(project_dir)
+			opened = set([ buffer.filename for buffer in self.buffers.buffers.values() if buffer != None ])
+			get_file_tasks = lambda search: self.__get_grep_tasks(search, self.disk_files, opened, trigrams)
+		elif(pattern.is_valid()):
+			filenames = list(self.buffers.stubs)
+			get_file_tasks = lambda search: self.__get_stub_tasks(search, filenames, trigrams)
+
+		known = sum([ len(hits) for hits in results.values() ])
+		self.search = ProjectSearch(query, pattern, tasks, self.on_search_results, self.on_search_finish, max([0, MAX_SEARCH_HITS - known]), get_file_tasks, self.buffers.workers)
+		self.on_results = on_results
+		self.on_finish = on_finish
+		if(len(results) > 0): on_results(results)
+		self.search.start()
+		return self.search
+
+	# cancels the search running in the background, if any
+	def cancel(self):
+		if(self.search == None): return
+		self.search.cancel()
+		self.search = None
+
+	# called from the search thread
+	def on_search_results(self, search, batch):
+		self.buffers.app.post_event(self.apply_search_results, search, batch)
+
+	def on_search_finish(self, search):
+		self.buffers.app.post_event(self.finish_search, search)
+
+	# remembers a batch of hits found by the search, reading the stubbed files with hits into
+	# buffers, and hands the hits over to on_results(); hits cut short are not remembered
+	def apply_search_results(self, search, batch):
+		if(search != self.search): return
+		results = dict()
+		for task, hits in batch:
+			complete = (task is not search.partial)
+			if(task[0] == "b"):
+				bid = task[1]
+				buffer = self.buffers.buffers.get(bid)
+				if(buffer == None): continue
+				if(complete and buffer.version == task[2]): self.buffer_hits[bid] = (search.query, task[2], hits)
+			elif(task[0] == "g"):
+				bid = task[1]					# (files searched grep-style are not read into buffers)
+			elif(len(hits) == 0):
+				if(complete): self.stub_hits[task[1]] = (search.query, hits, task[3])
+				continue
+			else:
+				bid = self.__materialize(task[1], (search.query if complete else None), hits)
+				if(bid == None): continue
+			if(len(hits) > 0): results[bid] = hits
+		if(len(results) > 0): self.on_results(results)
+
+	def finish_search(self, search):
+		if(search != self.search): return
+		self.search = None
+		self.on_finish(search)
+
+	# checks if the hits of a query include all the hits of a new one (at the same positions):
+	# true only of plain-text searches, when the new query extends the old one, and the old one
+	# cannot overlap itself (no proper prefix of it is also a suffix of it): else its hits, which
+	# never overlap, need not include every place it occurs in (e.g. "aa" in "aaab" is found at 0,
+	# while "aab" is at 1)
+	@staticmethod
+	def can_narrow(old_query, new_query):
+		if(old_query[2] or old_query[3] or old_query[1:] != new_query[1:]): return False
+		if(len(old_query[0]) == 0 or not new_query[0].startswith(old_query[0])): return False
+		text = (old_query[0] if old_query[1] else fold_case(old_query[0]))
+		for n in range(1, len(text)):
+			if(text[0:n] == text[-n:]): return False
+		return True
+
+	# returns tuples(filename, encoding) of the files of a project to be searched on disk: the files
+	# with buffers (searched in memory, so that unsaved changes are searched) and those known to be
+	# binary are left out; the encoding is the one predicted earlier, or None if not known
+	def get_disk_files(self, project_dir):
+		if(self.disk_files == None): self.disk_files = list_project_files(project_dir)
+		opened = set([ buffer.filename for buffer in self.buffers.buffers.values() if buffer != None ])
+		files = list()
+		for filename in self.disk_files:
+			if(filename in opened): continue
+			stub = self.buffers.get_stub(filename)
+			if(stub != None):
+				files.append( (filename, stub.encoding) )
+				continue
+			meta = (None if ash.METADATA_CACHE == None else ash.METADATA_CACHE.get(filename))
+			if(meta != None and meta.binary): continue
+			files.append( (filename, (None if meta == None else meta.encoding)) )
+		return files
+
+	# <------------------- private functions ---------------------->
+
+	# returns the hits in a buffer if they can be had without searching it all, else None; the buffer
+	# is indexed first if it has changed only if index is True (indexing it takes about as long as searching it)
+	def __get_buffer_hits(self, bid, buffer, query, pattern, trigrams, index = True):
+		entry = self.buffer_hits.get(bid)
+		if(entry != None and entry[1] == buffer.version and entry[0] == query): return entry[2]
+
+		if(entry != None and entry[1] == buffer.version and SearchSession.can_narrow(entry[0], query)):
+			hits = list()
+			last_line, last_end = -1, 0
+			for line_index, col, length in entry[2]:
+				if(line_index == last_line and col < last_end): continue		# (hits never overlap, as in find_all())
+				length = pattern.match_at(buffer.lines[line_index], col)
+				if(length > 0):
+					hits.append( (line_index, col, length) )
+					last_line, last_end = line_index, col + length
+		elif(trigrams != None and not self.buffers.index.may_contain_buffer(buffer, trigrams, index)):
+			hits = list()
+		else:
+			return None
+		self.buffer_hits[bid] = (query, buffer.version, hits)
+		return hits
+
+	# returns the hits in a stubbed file if they can be had without searching it, else None: a
+	# stubbed file has no hits (else it would have been read into a buffer), so a narrowed query
+	# cannot have any either (unless the file has changed since it was searched)
+	def __get_stub_hits(self, stub, query, trigrams):
+		entry = self.stub_hits.get(stub.filename)
+		version = get_file_version(stub.filename)
+		if(entry != None and entry[2] == version and (entry[0] == query or SearchSession.can_narrow(entry[0], query))): return entry[1]
+		if(trigrams != None and not self.buffers.index.may_contain_file(stub.filename, trigrams)):
+			self.stub_hits[stub.filename] = (query, list(), version)
+			return list()
+		return None
+
+	# returns the tasks of the stubbed files which must be searched (see ProjectSearch): those which
+	# have changed since they were last found to have no hits for a query the current one narrows, and
+	# which the trigram index does not rule out; runs on the search thread (so it only reads the caches)
+	def __get_stub_tasks(self, search, filenames, trigrams):
+		tasks = list()
+		for filename in filenames:
+			if(search.cancelled): break
+			stub = self.buffers.stubs.get(filename)
+			if(stub == None): continue						# (read into a buffer meanwhile)
+			version = get_file_version(filename)
+			entry = self.stub_hits.get(filename)
+			if(entry != None and entry[2] == version and (entry[0] == search.query or SearchSession.can_narrow(entry[0], search.query))): continue
+			if(trigrams != None and not self.buffers.index.may_contain_version(filename, version, trigrams)): continue
+			tasks.append( ("f", filename, stub.encoding, version) )
+		return tasks
+
+	# returns the tasks of the files on disk to be searched grep-style (see get_disk_files()), leaving out
+	# those the trigram index rules out; runs on the search thread (so it only reads the caches)
+	def __get_grep_tasks(self, search, filenames, opened, trigrams):
+		cache = ash.METADATA_CACHE
+		tasks = list()
+		for filename in filenames:
+			if(search.cancelled): break
+			if(filename in opened): continue
+			version = get_file_version(filename)
+			if(version == None): continue
+			stub = self.buffers.stubs.get(filename)
+			if(stub != None):
+				encoding = stub.encoding
+			else:
+				meta = (None if cache == None else cache.peek(filename, version))
+				if(meta != None and meta.binary): continue
+				encoding = (None if meta == None else meta.encoding)
+			if(trigrams != None and not self.buffers.index.may_contain_version(filename, version, trigrams)): continue
+			tasks.append( ("g", filename, encoding, search.query) )
+		return tasks
+
+	# reads a stubbed file with hits into a buffer, remembering its hits (unless query is None);
+	# returns the buffer-ID, or None if the file could not be read
+	def __materialize(self, filename, query, hits):
+		if(filename not in self.buffers.stubs): return None
+		self.stub_hits.pop(filename, None)
+		bid, buffer = self.buffers.materialize(filename)
+		if(buffer == None): return None
+		if(query != None): self.buffer_hits[bid] = (query, buffer.version, hits)
+		return bid
@@ -131,8 +131,12 @@ class SessionStorage:
 		if(not os.path.isfile(ash.SESSION_FILE)): return None
 
 		sfp = open(ash.SESSION_FILE, "rb")
-		session_data = pickle.load(sfp)
-		sfp.close()
+		try:
+			session_data = pickle.load(sfp)
+		except:
+			return None				# written by an incompatible version
+		finally:
+			sfp.close()
 
 		if(session_data.version != ash.__version__): return None
 		return session_data
\ No newline at end of file
@@ -0,0 +1,293 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements the text-storage engines used by Buffer to hold its lines
+
+from ash.core.fenwickTree import *
+
+LINES_PER_CHUNK		= 512				# target number of lines in a chunk
+MAX_CHUNK_SIZE		= 2 * LINES_PER_CHUNK	# chunks larger than this are split
+
+# TextStorage class: the interface common to all storage engines;
+# every mutation is routed through replace_lines(), so engines only need to implement
+# __len__(), get_lines() and _replace_lines() to behave like a list of lines
+class TextStorage:
+	listeners = None
+
+	# returns the number of lines
+	def __len__(self):
+		raise(NotImplementedError)
+
+	# returns lines in [start, end) as a list
+	def get_lines(self, start, end):
+		raise(NotImplementedError)
+
+	# replaces lines in [start, end) with new_lines and notifies the listeners
+	# with (start, old_lines, new_lines)
+	def replace_lines(self, start, end, new_lines):
+		new_lines = list(new_lines)
+		listeners = self.listeners
+		if(listeners == None or len(listeners) == 0):
+			self._replace_lines(start, end, new_lines)
+			return
+		old_lines = self.get_lines(start, end)
+		self._replace_lines(start, end, new_lines)
+		for listener in listeners:
+			listener(start, old_lines, new_lines)
+
+	# engine-specific implementation of replace_lines()
+	def _replace_lines(self, start, end, new_lines):
+		raise(NotImplementedError)
+
+	# registers a function to be called after every change
+	def add_listener(self, listener):
+		if(self.listeners == None): self.listeners = list()
+		if(listener not in self.listeners): self.listeners.append(listener)
+
+	# unregisters a function added by add_listener()
+	def remove_listener(self, listener):
+		if(self.listeners != None and listener in self.listeners): self.listeners.remove(listener)
+
+	# listeners are bound to live objects and are never pickled
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		state.pop("listeners", None)
+		return state
+
+	# releases any resources held by the storage
+	def close(self):
+		pass
+
+	# checks if lines are loaded on demand (in which case, whole-buffer scans should be avoided)
+	def is_lazy(self):
+		return False
+
+	# returns the content as a list of blocks of lines, unaffected by later edits and safe to read
+	# from another thread (used to save the buffer in the background)
+	def snapshot(self):
+		return [ self.get_lines(0, len(self)) ]
+
+	# <------------------- list compatibility ---------------------->
+
+	def __getitem__(self, index):
+		if(isinstance(index, slice)):
+			start, stop, step = index.indices(len(self))
+			if(step == 1): return self.get_lines(start, max([start, stop]))
+			return [ self[i] for i in range(start, stop, step) ]
+		return self.get_line(self.__normalize_index(index))
+
+	def __setitem__(self, index, value):
+		if(isinstance(index, slice)):
+			start, stop, step = index.indices(len(self))
+			if(step != 1): raise(ValueError("extended slices are not supported"))
+			self.replace_lines(start, max([start, stop]), list(value))
+		else:
+			index = self.__normalize_index(index)
+			self.replace_lines(index, index+1, [value])
+
+	def __delitem__(self, index):
+		if(isinstance(index, slice)):
+			start, stop, step = index.indices(len(self))
+			if(step != 1): raise(ValueError("extended slices are not supported"))
+			self.replace_lines(start, max([start, stop]), [])
+		else:
+			index = self.__normalize_index(index)
+			self.replace_lines(index, index+1, [])
+
+	def __iter__(self):
+		n = len(self)
+		start = 0
+		while(start < n):
+			end = min([n, start + LINES_PER_CHUNK])
+			for line in self.get_lines(start, end):
+				yield line
+			start = end
+
+	def __eq__(self, other):
+		if(isinstance(other, (list, TextStorage))):
+			return len(self) == len(other) and list(self) == list(other)
+		return NotImplemented
+
+	def __repr__(self):
+		return self.__class__.__name__ + "(" + str(len(self)) + " lines)"
+
+	# returns a single line
+	def get_line(self, index):
+		return self.get_lines(index, index+1)[0]
+
+	def insert(self, index, line):
+		n = len(self)
+		if(index < 0): index = max([0, n + index])
+		index = min([index, n])
+		self.replace_lines(index, index, [line])
+
+	def append(self, line):
+		n = len(self)
+		self.replace_lines(n, n, [line])
+
+	def extend(self, lines):
+		n = len(self)
+		self.replace_lines(n, n, list(lines))
+
+	def pop(self, index = -1):
+		index = self.__normalize_index(index)
+		line = self.get_line(index)
+		self.replace_lines(index, index+1, [])
+		return line
+
+	def __normalize_index(self, index):
+		n = len(self)
+		if(index < 0): index += n
+		if(index < 0 or index >= n): raise(IndexError("line index out of range"))
+		return index
+
+# ListTextStorage class: stores lines in a plain Python list (the legacy engine)
+class ListTextStorage(TextStorage):
+	def __init__(self, lines = None):
+		self.lines = list() if lines == None else list(lines)
+
+	def __len__(self):
+		return len(self.lines)
+
+	def get_line(self, index):
+		return self.lines[index]
+
+	def get_lines(self, start, end):
+		return self.lines[start:end]
+
+	def _replace_lines(self, start, end, new_lines):
+		self.lines[start:end] = new_lines
+
+	def __iter__(self):
+		return iter(self.lines)
+
+	def __copy__(self):
+		return ListTextStorage(self.lines)
+
+	def snapshot(self):
+		return [ list(self.lines) ]
+
+	def __sizeof__(self):
+		return object.__sizeof__(self) + self.lines.__sizeof__()
+
+# ChunkedTextStorage class: stores lines in a list of small chunks, with a Fenwick tree over
+# the chunk sizes acting as the line-start index; locating a line is O(log n) and an edit
+# only shifts the lines inside the affected chunk instead of the whole buffer
+class ChunkedTextStorage(TextStorage):
+	def __init__(self, lines = None):
+		self.load(lines)
+
+	# replaces the entire content of the storage
+	def load(self, lines = None):
+		lines = list() if lines == None else list(lines)
+		self.chunks = [ lines[i:i+LINES_PER_CHUNK] for i in range(0, len(lines), LINES_PER_CHUNK) ]
+		if(len(self.chunks) == 0): self.chunks.append(list())
+		self._rebuild_index()
+
+	def __len__(self):
+		return self.count
+
+	def get_line(self, index):
+		if(index < 0 or index >= self.count): raise(IndexError("line index out of range"))
+		cid, offset = self._locate(index)
+		return self.chunks[cid][offset]
+
+	def get_lines(self, start, end):
+		start = max([0, start])
+		end = min([end, self.count])
+		if(start >= end): return list()
+		cid, offset = self._locate(start)
+		result = list()
+		needed = end - start
+		while(needed > 0):
+			part = self.chunks[cid][offset:offset+needed]
+			result.extend(part)
+			needed -= len(part)
+			cid += 1
+			offset = 0
+		return result
+
+	def _replace_lines(self, start, end, new_lines):
+		if(start < 0 or end > self.count or start > end): raise(IndexError("line range out of bounds"))
+		cid, offset = self._locate(start, True)
+		chunk = self.chunks[cid]
+
+		if(end - start <= len(chunk) - offset):
+			# fast path: the replaced range lies inside a single chunk
+			chunk[offset:offset + end - start] = new_lines
+			delta = len(new_lines) - (end - start)
+			self.count += delta
+			self.last_located = None
+			if(len(chunk) > MAX_CHUNK_SIZE or (len(chunk) == 0 and len(self.chunks) > 1)):
+				self._rebalance(cid, cid+1, chunk)
+			else:
+				self.index.add(cid, delta)
+			return
+
+		# general case: splice across chunks [cid, last_cid]
+		last_cid, last_offset = self._locate(end, True)
+		merged = chunk[0:offset] + new_lines + self.chunks[last_cid][last_offset:]
+		self.count += len(new_lines) - (end - start)
+		self._rebalance(cid, last_cid+1, merged)
+
+	def __iter__(self):
+		for chunk in self.chunks:
+			for line in chunk:
+				yield line
+
+	def snapshot(self):
+		return [ list(chunk) for chunk in self.chunks if len(chunk) > 0 ]
+
+	def __copy__(self):
+		storage = ChunkedTextStorage.__new__(ChunkedTextStorage)
+		storage.chunks = [ list(chunk) for chunk in self.chunks ]
+		storage._rebuild_index()
+		return storage
+
+	def __sizeof__(self):
+		return object.__sizeof__(self) + self.chunks.__sizeof__() + sum([ c.__sizeof__() for c in self.chunks ])
+
+	# <------------------- private functions ---------------------->
+
+	# returns tuple(chunk-index, offset-in-chunk) of a given line;
+	# if for_insert is True, index == len() maps to the end of the last chunk
+	def _locate(self, index, for_insert = False):
+		last = self.last_located
+		if(last != None and last[1] <= index < last[2]): return (last[0], index - last[1])
+
+		if(for_insert and index >= self.count):
+			cid = len(self.chunks) - 1
+			return (cid, len(self.chunks[cid]))
+
+		cid, offset = self.index.find(index)
+		self.last_located = (cid, index - offset, index - offset + len(self.chunks[cid]))
+		return (cid, offset)
+
+	# replaces chunks [from_cid, to_cid) with the given lines, split into fresh chunks
+	def _rebalance(self, from_cid, to_cid, lines):
+		new_chunks = [ lines[i:i+LINES_PER_CHUNK] for i in range(0, len(lines), LINES_PER_CHUNK) ]
+		self.chunks[from_cid:to_cid] = new_chunks
+		if(len(self.chunks) == 0): self.chunks.append(list())
+		self._rebuild_index()
+
+	def _rebuild_index(self):
+		self.index = FenwickTree([ len(c) for c in self.chunks ])
+		self.count = self.index.total()
+		self.last_located = None
+
+	def __getstate__(self):
+		return { "chunks": self.chunks }
+
+	def __setstate__(self, state):
+		self.chunks = state["chunks"]
+		self._rebuild_index()
+
+# the storage engine used for new buffers
+DEFAULT_STORAGE_ENGINE = ChunkedTextStorage
+
+# creates a new storage object holding the given lines
+def create_text_storage(lines = None, engine = None):
+	if(engine == None): engine = DEFAULT_STORAGE_ENGINE
+	return engine(lines)
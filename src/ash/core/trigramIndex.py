@@ -0,0 +1,209 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# This module implements the trigram index used to narrow project-wide searches down to the
+# buffers and files which may contain a match
+
+from ash.core import *
+
+try:
+	from re import _parser as sre_parse
+except ImportError:
+	import sre_parse
+
+# characters which re.IGNORECASE holds equal although their lowercase forms differ: lowercase
+# character -> tuple of its equivalents
+try:
+	from re._casefix import _EXTRA_CASES as CASE_EQUIVALENTS
+except ImportError:
+	from sre_compile import _ignorecase_fixes as CASE_EQUIVALENTS
+
+MIN_INDEX_BITS		= 256				# size limits of the bitmap of a document
+MAX_INDEX_BITS		= 1 << 20
+HASH_MULTIPLIER		= 0x9E3779B1		# (Fibonacci hashing)
+
+# U+0130 (capital I with dot above) is the only character whose lowercase form is two characters long,
+# while re.IGNORECASE compares its simple lowercase form (i); each set of equivalent characters (see
+# CASE_EQUIVALENTS) is folded onto its lowest member
+FOLD_BEFORE_LOWER	= { 0x130: "i" }
+FOLD_AFTER_LOWER	= { c: chr(min((c,) + others)) for c, others in CASE_EQUIVALENTS.items() if min((c,) + others) != c }
+
+# folds the case of a text one character to one character, so that any two strings which match each
+# other under re.IGNORECASE fold to the same string (str.casefold() does not: it turns U+0130 into
+# two characters and ß into ss, for instance, which would rule out files holding real matches)
+def fold_case(text):
+	if(text.isascii()): return text.lower()
+	return text.translate(FOLD_BEFORE_LOWER).lower().translate(FOLD_AFTER_LOWER)
+
+# returns the set of trigrams in a text: case-folded (so that they also cover case-insensitive searches)
+# and UTF-8 encoded, each as the integer b0 | b1 << 8 | b2 << 16 of its bytes; the bytes are laid out
+# as 32-bit integers (with a zero high byte), so that the set is built without a loop in Python
+def get_trigrams(text):
+	data = fold_case(text).encode("utf-8", "surrogatepass")
+	n = len(data) - 2
+	if(n <= 0): return set()
+	words = bytearray(4 * n)
+	words[0::4] = data[0:n]
+	words[1::4] = data[1:n+1]
+	words[2::4] = data[2:n+2]
+	if(sys.byteorder == "big"): words.reverse()		# (which reverses the order of the words too)
+	return set(memoryview(words).cast("I"))
+
+# returns the bit (in a bitmap of nbits bits) standing for a trigram; must be the same in all
+# processes, so the built-in (randomized) hash() is not used
+def get_trigram_bit(trigram, nbits):
+	return ((trigram * HASH_MULTIPLIER) >> 12) & (nbits - 1)
+
+# returns the bitmap (a Bloom filter with a single hash) of a set of trigrams, as tuple(nbits, bits);
+# unless given, nbits is chosen to keep roughly a third of the bits unset
+def make_bitmap(trigrams, nbits = None):
+	if(nbits == None):
+		nbits = MIN_INDEX_BITS
+		while(nbits < 2 * len(trigrams) and nbits < MAX_INDEX_BITS): nbits *= 2
+	bitmap = bytearray(nbits >> 3)
+	for t in trigrams:
+		bit = get_trigram_bit(t, nbits)
+		bitmap[bit >> 3] |= 1 << (bit & 7)
+	return (nbits, int.from_bytes(bitmap, "little"))
+
+# indexes a file: item is tuple(filename, encoding, [size, mtime] when it was last indexed, or None);
+# returns tuple(size, mtime, nbits, bits), with nbits and bits None if the file is unchanged, or None
+# if the file cannot be read; runs in a worker process (see ProjectScanner)
+def index_file(item):
+	filename, encoding, version = item
+	try:
+		st = os.stat(filename)
+		if(version != None and version == [ st.st_size, st.st_mtime_ns ]): return (st.st_size, st.st_mtime_ns, None, None)
+		with open(filename, "rb") as f:
+			text = f.read().decode(encoding)
+		nbits, bits = make_bitmap(get_trigrams(text))
+		return (st.st_size, st.st_mtime_ns, nbits, bits)
+	except Exception:
+		return None
+
+# TrigramQuery class: the trigrams every match of a search must contain, and the bitmaps they
+# map to (for each bitmap size)
+class TrigramQuery:
+	def __init__(self, trigrams):
+		self.trigrams = trigrams
+		self.masks = dict()					# nbits -> bits
+
+	# returns a query for a search, or None if no trigram is certain to occur in its matches
+	@staticmethod
+	def create(search_text, match_case, whole_words, is_regex):
+		literals = (TrigramQuery.get_regex_literals(search_text) if is_regex else [ search_text ])
+		trigrams = set()
+		for literal in literals:
+			trigrams.update(get_trigrams(literal))
+		return (None if len(trigrams) == 0 else TrigramQuery(trigrams))
+
+	# returns the literal strings which occur in every match of a regular expression (or an
+	# empty list if they cannot be found): runs of literal characters outside of alternations,
+	# repetitions and look-arounds
+	@staticmethod
+	def get_regex_literals(regex):
+		try:
+			parsed = sre_parse.parse(regex)
+		except Exception:
+			return list()
+		literals = list()
+		run = TrigramQuery.__collect_literals(parsed, literals, "")
+		if(len(run) > 0): literals.append(run)
+		return literals
+
+	# checks if a document's bitmap has the bits of all the trigrams set
+	def matches(self, nbits, bits):
+		mask = self.masks.get(nbits)
+		if(mask == None):
+			mask = make_bitmap(self.trigrams, nbits)[1]
+			self.masks[nbits] = mask
+		return ((bits & mask) == mask)
+
+	# <------------------- private functions ---------------------->
+
+	# appends the runs of literals in a parsed pattern to literals; returns the run still open at its end
+	@staticmethod
+	def __collect_literals(parsed, literals, run):
+		for op, av in parsed:
+			if(op == sre_parse.LITERAL and av != 10):			# (matches never span lines)
+				run += chr(av)
+			elif(op == sre_parse.SUBPATTERN):
+				run = TrigramQuery.__collect_literals(av[-1], literals, run)
+			else:
+				if(len(run) > 0): literals.append(run)
+				run = ""
+		return run
+
+# TrigramIndex class: holds a bitmap of the trigrams of each project file not yet read into a buffer
+# (built in the background, see index_file()) and of each buffer (built when first searched, and
+# then updated as lines are changed); trigrams which are deleted remain set, so the bitmaps may
+# only give false positives (which the search itself then rules out)
+class TrigramIndex:
+	def __init__(self):
+		self.files = dict()					# filename -> tuple(size, mtime, nbits, bits)
+		self.buffers = dict()				# buffer-ID -> list[buffer-version, nbits, bits, trigrams added since]
+
+	# returns [size, mtime] of an indexed file as it was when indexed, or None if it is not indexed
+	def get_file_version(self, filename):
+		entry = self.files.get(filename)
+		return (None if entry == None else [ entry[0], entry[1] ])
+
+	# stores the result of index_file()
+	def set_file(self, filename, result):
+		if(result == None):
+			self.files.pop(filename, None)
+		elif(result[2] != None):
+			self.files[filename] = result
+
+	def remove_file(self, filename):
+		self.files.pop(filename, None)
+
+	def remove_buffer(self, bid):
+		self.buffers.pop(bid, None)
+
+	# checks if a file may contain a match; files not (yet) indexed always may, and so do files which
+	# have changed since they were indexed (their bitmaps are dropped, to be rebuilt by the next refresh)
+	def may_contain_file(self, filename, query):
+		entry = self.files.get(filename)
+		if(entry == None): return True
+		if(get_file_version(filename) != [ entry[0], entry[1] ]):
+			del self.files[filename]
+			return True
+		return query.matches(entry[2], entry[3])
+
+	# checks if a file, whose current [size, mtime] is given, may contain a match (as may_contain_file());
+	# the index is only read, so that it can be called from the search thread
+	def may_contain_version(self, filename, version, query):
+		entry = self.files.get(filename)
+		return (entry == None or version != [ entry[0], entry[1] ] or query.matches(entry[2], entry[3]))
+
+	# checks if a buffer may contain a match, indexing it first if it has changed (a buffer not
+	# indexed always may, unless build is True)
+	def may_contain_buffer(self, buffer, query, build = True):
+		if(buffer.lines.is_lazy()): return True			# too large to be indexed in memory
+		entry = self.buffers.get(buffer.id)
+		if(entry == None or entry[0] != buffer.version):
+			if(not build): return True
+			nbits, bits = make_bitmap(get_trigrams("\n".join(buffer.lines)))
+			entry = [ buffer.version, nbits, bits, 0 ]
+			self.buffers[buffer.id] = entry
+		return query.matches(entry[1], entry[2])
+
+	# adds the trigrams of changed lines to a buffer's bitmap: called after every change to the
+	# buffer (see Buffer.on_lines_changed()); a bitmap which has missed a change, or has grown too
+	# dense, is dropped, to be rebuilt when next needed
+	def update_buffer(self, buffer, new_lines):
+		entry = self.buffers.get(buffer.id)
+		if(entry == None): return
+		if(entry[0] != buffer.version - 1):
+			del self.buffers[buffer.id]
+			return
+		trigrams = get_trigrams("\n".join(new_lines))
+		entry[3] += len(trigrams)
+		if(entry[3] > entry[1] // 2):
+			del self.buffers[buffer.id]
+			return
+		entry[0] = buffer.version
+		entry[2] |= make_bitmap(trigrams, entry[1])[1]
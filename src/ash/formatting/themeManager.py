@@ -137,6 +137,7 @@ class ThemeManager:
 			return
 		colors, element_colors = self.load_theme_from_file(sel_theme_file)
 		set_colors(colors, element_colors)
+		self.app.main_window.request_full_redraw()
 
 	def write_out_installed_themes(self, installed_themes):
 		fp = open(ash.INSTALLED_THEMES_FILE, "wt")
@@ -154,6 +154,7 @@ class DialogHandler:
 	# <----------------------------------- Close Editor/App --------------------------------->
 
 	def invoke_forced_quit(self):
+		self.app.buffers.wait_for_saves()			# saves already started are always completed
 		self.app.session_storage.destroy()
 		self.app.main_window.hide()
 
@@ -179,7 +180,9 @@ class DialogHandler:
 			
 			response = self.app.ask_question("SAVE/DISCARD ALL", "One or more unsaved files exist, choose:\nYes: save all filed-changes and quit\nNo: discard all unsaved changes and quit\nCancel: don't quit", True)
 			if(response == None): return
-			if(response): self.app.buffers.write_all_wherever_possible()
+			if(response):
+				self.app.buffers.write_all_wherever_possible()
+				if(self.app.buffers.wait_for_saves() > 0): return		# stay open so that the unsaved changes are not lost
 			
 			self.invoke_forced_quit()
 			
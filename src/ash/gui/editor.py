@@ -74,7 +74,7 @@ class Editor(Widget):
 		self.curpos.x = 0
 		self.curpos.y = 0
 		self.slave_cursors = list()
-		self.recompute()
+		self.recompute(True)
 
 	def set_buffer(self, bid, buffer):
 		self.bid = bid
@@ -131,6 +131,10 @@ class Editor(Widget):
 		if(ch == -1): return None
 		if(not self.is_in_focus): self.focus()
 
+		if(self.buffer.is_loading() and self.is_editing_key(ch)):
+			beep()				# read-only till the file is loaded completely
+			return None
+
 		edit_made = False
 
 		if(KeyBindings.is_key(ch, "RIGHT_CLICK")):
@@ -165,15 +169,26 @@ class Editor(Widget):
 			edit_made = self.keyHandler.handle_keys(ch)
 		
 		if(edit_made): self.buffer.update(self.curpos, self)
-		self.recompute(edit_made)
+		self.recompute()
 			
+	# checks if a key can modify the buffer
+	def is_editing_key(self, ch):
+		for key in [ "DELETE_CHARACTER_LEFT", "DELETE_CHARACTER_RIGHT", "INSERT_TAB", "DECREASE_INDENT", "NEWLINE", "PASTE", "CUT", "UNDO", "REDO", "DECODE_UNICODE", "SAVE", "SAVE_AND_CLOSE_EDITOR", "SHOW_FIND_AND_REPLACE" ]:
+			if(KeyBindings.is_key(ch, key)): return True
+		return (str(chr(ch)) in self.charset)
+
 	# <---------------------------- Calls Screen.recompute ---------------------
 
-	def recompute(self, forced=True):
+	# edits are patched into the layout as they are notified (see notify_lines_changed()): all lines are reflowed only if forced
+	def recompute(self, forced=False):
 		if(self.screen != None): self.screen.recompute(self.curpos, self.tab_size, self.word_wrap, self.hard_wrap, forced)
 
 	# <------------------- Functions called from BufferManager --------------------->
 
+	# called after every change to the buffer: lines [start, start + old_count) have been replaced by new_count lines
+	def notify_lines_changed(self, start, old_count, new_count):
+		if(self.screen != None): self.screen.notify_lines_changed(start, old_count, new_count)
+
 	def notify_update(self):
 		if(self.curpos.y >= len(self.buffer.lines) or self.curpos.x > len(self.buffer.lines[self.curpos.y])):
 			self.curpos.x = 0
@@ -182,8 +197,13 @@ class Editor(Widget):
 			if(self.sel_start.y >= len(self.buffer.lines) or self.sel_start.x > len(self.buffer.lines[self.sel_start.y]) or self.sel_end.y >= len(self.buffer.lines) or self.sel_end.x > len(self.buffer.lines[self.sel_end.y])):
 				self.selection_mode = False
 		
+		self.recompute()
 		self.repaint()
 
+	# makes the next repaint draw the editor in full (called when something else has been drawn over it)
+	def invalidate(self):
+		if(self.screen != None): self.screen.invalidate()
+
 	def notify_merge(self, new_bid, new_buffer):
 		self.bid = new_bid
 		self.buffer = new_buffer
@@ -352,16 +372,17 @@ class Editor(Widget):
 		else:
 			y, x = visual_curpos.y + self.y + 1, visual_curpos.x + self.x + 1
 		
+		editable = not self.buffer.is_loading()
 		popup_menu_items = [
-			("Undo", True, self.keyHandler.handle_undo),
-			("Redo", True, self.keyHandler.handle_redo),
+			("Undo", editable, self.keyHandler.handle_undo),
+			("Redo", editable, self.keyHandler.handle_redo),
 			("---", False, None),
-			("Cut", self.selection_mode, self.keyHandler.handle_cut),
+			("Cut", editable and self.selection_mode, self.keyHandler.handle_cut),
 			("Copy", self.selection_mode, self.keyHandler.handle_copy),
-			("Paste", True, self.keyHandler.handle_paste),
+			("Paste", editable, self.keyHandler.handle_paste),
 			("---", False, None),
 			("Find...", True, app_dh.invoke_find),
-			("Find & Replace...", True, app_dh.invoke_find_and_replace),
+			("Find & Replace...", editable, app_dh.invoke_find_and_replace),
 			("---", False, None),
 			("Preferences...", True, app_dh.invoke_set_preferences)
 		]
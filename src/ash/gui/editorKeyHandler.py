@@ -59,9 +59,13 @@ class EditorKeyHandler:
 
 		return False
 
+	# the save runs in the background: it is waited for (as on quitting) so that the buffer counts as
+	# saved when closing; if it fails, the error is shown and the editor is left open
 	def save_and_close(self):
 		self.handle_save()
-		if(self.ed.buffer.filename != None): self.ed.parent.win.app.dialog_handler.invoke_quit()
+		if(self.ed.buffer.filename == None): return
+		self.ed.buffer.wait_for_save()
+		if(self.ed.buffer.save_status): self.ed.parent.win.app.dialog_handler.invoke_quit()
 
 	# handle the 4 arrow keys
 	def handle_arrow_keys(self, ch):
@@ -146,21 +150,13 @@ class EditorKeyHandler:
 		
 		if(col == clen):
 			self.cancel_multiple_cursors()
-			ntext = self.ed.buffer.lines[self.ed.curpos.y + 1]
-			self.ed.buffer.lines.pop(self.ed.curpos.y + 1)
-			self.ed.buffer.lines[self.ed.curpos.y] += ntext
+			self.ed.buffer.delete_text(self.ed.curpos, CursorPosition(self.ed.curpos.y + 1, 0))
 		else:
-			left = text[0:col] if col > 0 else ""
-			right = text[col+1:] if col < clen-1 else ""
-			self.ed.buffer.lines[self.ed.curpos.y] = left + right
+			self.ed.buffer.delete_text(self.ed.curpos, CursorPosition(self.ed.curpos.y, col + 1))
 
 			for sc in self.ed.slave_cursors:
-				text = self.ed.buffer.lines[sc.y]
-				clen = len(text)
-				col = sc.x
-				left = text[0:col] if col > 0 else ""
-				right = text[col+1:] if col < clen-1 else ""
-				self.ed.buffer.lines[sc.y] = left + right
+				if(sc.x < len(self.ed.buffer.lines[sc.y])):
+					self.ed.buffer.delete_text(sc, CursorPosition(sc.y, sc.x + 1))
 				
 		return True
 	
@@ -181,23 +177,16 @@ class EditorKeyHandler:
 
 		if(col == 0):
 			self.cancel_multiple_cursors()
-			self.ed.buffer.lines.pop(self.ed.curpos.y)
-			temp = len(self.ed.buffer.lines[self.ed.curpos.y-1])
-			self.ed.buffer.lines[self.ed.curpos.y - 1] += text
-			self.ed.curpos.x = temp
-			self.ed.curpos.y -= 1
+			prev_end = CursorPosition(self.ed.curpos.y - 1, len(self.ed.buffer.lines[self.ed.curpos.y - 1]))
+			self.ed.buffer.delete_text(prev_end, self.ed.curpos)
+			self.ed.curpos = prev_end
 		else:
-			left = text[0:col-1] if col > 1 else ""
-			right = text[col:] if col < len(text) else ""
-			self.ed.buffer.lines[self.ed.curpos.y] = left + right
+			self.ed.buffer.delete_text(CursorPosition(self.ed.curpos.y, col - 1), self.ed.curpos)
 			self.ed.curpos.x -= 1
 
 			for sc in self.ed.slave_cursors:
-				text = self.ed.buffer.lines[sc.y]
-				col = sc.x
-				left = text[0:col-1] if col > 1 else ""
-				right = text[col:] if col < len(text) else ""
-				self.ed.buffer.lines[sc.y] = left + right
+				if(sc.x == 0): continue
+				self.ed.buffer.delete_text(CursorPosition(sc.y, sc.x - 1), sc)
 				sc.x -= 1
 		
 		return True
@@ -307,21 +296,11 @@ class EditorKeyHandler:
 
 		if(self.ed.selection_mode): del_text = self.ed.utility.delete_selected_text()
 
-		text = self.ed.buffer.lines[self.ed.curpos.y]
-		col = self.ed.curpos.x
-		left = text[0:col] if col > 0 else ""
-		right = text[col:] if len(text) > 0 else ""
-		
-		self.ed.buffer.lines[self.ed.curpos.y] = left + sch + right
+		self.ed.buffer.insert_text(self.ed.curpos, sch)
 		self.ed.curpos.x += 1
 
 		for sc in self.ed.slave_cursors:
-			text = self.ed.buffer.lines[sc.y]
-			col = sc.x
-			left = text[0:col] if col > 0 else ""
-			right = text[col:] if len(text) > 0 else ""
-
-			self.ed.buffer.lines[sc.y] = left + sch + right
+			self.ed.buffer.insert_text(sc, sch)
 			sc.x += 1
 
 		return True
@@ -466,27 +445,9 @@ class EditorKeyHandler:
 
 		data = whole.splitlines()
 		if(self.ed.selection_mode): self.ed.utility.delete_selected_text()
-		
-		n = len(data)
-		row = self.ed.curpos.y
-		text = self.ed.buffer.lines[row]
-		col = self.ed.curpos.x
-		left = text[0:col] if col > 0 else ""
-		right = text[col:] if len(text) > 0 else ""
-			
-		if(n == 1):
-			self.ed.buffer.lines[row] = left + data[0] + right
-			self.ed.curpos.x += len(data[0])
-		elif(n == 2):
-			self.ed.buffer.lines[row] = left + data[0]
-			self.ed.buffer.lines.insert(row+1, data[1] + right)
-			self.ed.curpos.y += 1
-			self.ed.curpos.x = len(data[1])
-		elif(n > 2):
-			self.ed.buffer.lines[row] = left + data[0]
-			self.ed.buffer.lines.insert(row+1, data[n-1] + right)
-			for i in range(n-2, 0, -1):
-				self.ed.buffer.lines.insert(row+1, data[i])
+		if(len(data) == 0): return False
+
+		self.ed.curpos = self.ed.buffer.insert_text(self.ed.curpos, "\n".join(data))
 
 		self.ed.recompute()
 		return True
@@ -7,6 +7,7 @@
 
 from ash.gui import *
 from ash.gui.cursorPosition import *
+from ash.core.searchEngine import *
 
 class EditorUtility:
 	def __init__(self, ed):
@@ -16,40 +17,10 @@ class EditorUtility:
 	def delete_selected_text(self):
 		if(not self.ed.selection_mode): return
 		start, end = self.ed.screen.get_selection_endpoints(self.ed.sel_start, self.ed.sel_end)
-		del_text = ""
-
-		if(start.y == end.y):
-			sel_len = end.x - start.x
-			del_text = self.ed.buffer.lines[start.y][start.x:end.x]
-			if(len(del_text) > 0): self.ed.buffer.add_change(self.ed.curpos)
-			self.ed.buffer.lines[start.y] = self.ed.buffer.lines[start.y][0:start.x] + self.ed.buffer.lines[start.y][end.x:]
-			self.ed.curpos = copy.copy(start)
-		else:
-			del_text = self.ed.buffer.lines[start.y][start.x:] + "\n"
-			if(len(del_text) > 0): self.ed.buffer.add_change(self.ed.curpos)
-			
-			# delete entire lines between selection start and end
-			lc = end.y - start.y - 1
-			while(lc > 0):
-				del_text += self.ed.buffer.lines[start.y+1] + "\n"
-				self.ed.buffer.lines.pop(start.y + 1)
-				self.ed.curpos.y -= 1
-				end.y -= 1
-				lc -= 1
-
-			# delete a portion of the selection start line
-			self.ed.buffer.lines[start.y] = self.ed.buffer.lines[start.y][0:start.x]
-
-			# delete a portion of the selection end line
-			del_text += self.ed.buffer.lines[end.y][0:end.x]
-			self.ed.buffer.lines[end.y] = self.ed.buffer.lines[end.y][end.x:]
-
-			# bring the selection end line up towards the end of the selection start line
-			text = self.ed.buffer.lines[end.y]
-			self.ed.buffer.lines.pop(end.y)
-			self.ed.curpos.y = start.y
-			self.ed.curpos.x = len(self.ed.buffer.lines[start.y])
-			self.ed.buffer.lines[start.y] += text
+		del_text = self.ed.buffer.get_text(start, end)
+		if(len(del_text) > 0): self.ed.buffer.add_change(self.ed.curpos)
+		self.ed.buffer.delete_text(start, end)
+		self.ed.curpos = copy.copy(start)
 
 		self.ed.curpos.x = max([0, self.ed.curpos.x])
 		
@@ -61,17 +32,7 @@ class EditorUtility:
 	def get_selected_text(self):
 		if(not self.ed.selection_mode): return ""
 		start, end = self.ed.screen.get_selection_endpoints(self.ed.sel_start, self.ed.sel_end)
-		sel_text = ""
-
-		if(start.y == end.y):
-			sel_len = end.x - start.x
-			sel_text = self.ed.buffer.lines[start.y][start.x:end.x]
-		else:
-			sel_text = self.ed.buffer.lines[start.y][start.x:] + "\n"
-			for row in range(start.y+1, end.y):
-				sel_text += self.ed.buffer.lines[row] + "\n"
-			sel_text += self.ed.buffer.lines[end.y][0:end.x]
-
+		sel_text = self.ed.buffer.get_text(start, end)
 		return sel_text
 
 	# returns the length of the selection (for showing in status bar)
@@ -149,99 +110,53 @@ class EditorUtility:
 			self.ed.highlighted_text = None
 			self.ed.repaint()
 
-	# moves cursor to next match
+	# moves cursor to next match (see SearchPattern)
 	def find_next(self, s, match_case, whole_words, regex):
 		if(len(s) == 0): return
-
-		lower_s = s.lower()
 		self.find_all(s, match_case, whole_words, regex)
-		n = len(s)
-		
-		for y in range(self.ed.curpos.y, len(self.ed.buffer.lines)):
-			start = 0
-			if(y == self.ed.curpos.y): start = self.ed.curpos.x + 1
-			if(match_case):
-				x = self.ed.buffer.lines[y].find(s, start)
-			else:
-				x = self.ed.buffer.lines[y].lower().find(lower_s, start)
-			if(x > -1):
-				self.ed.curpos.y = y
-				self.ed.curpos.x = x
-				return
-
-		for y in range(0, self.ed.curpos.y + 1):
-			if(match_case):
-				x = self.ed.buffer.lines[y].find(s)
-			else:
-				x = self.ed.buffer.lines[y].lower().find(lower_s)
-			if(x > -1):
-				self.ed.curpos.y = y
-				self.ed.curpos.x = x
-				return
+		result = get_search_pattern(s, match_case, whole_words, regex).find_next(self.ed.buffer.lines, self.ed.curpos.y, self.ed.curpos.x)
+		if(result != None):
+			self.ed.curpos.y = result[0]
+			self.ed.curpos.x = result[1]
 
 	# moves cursor to previous match
 	def find_previous(self, s, match_case, whole_words, regex):
 		if(len(s) == 0): return
-		
-		lower_s = s.lower()
 		self.find_all(s, match_case, whole_words, regex)
-		n = len(s)
+		result = get_search_pattern(s, match_case, whole_words, regex).find_previous(self.ed.buffer.lines, self.ed.curpos.y, self.ed.curpos.x)
+		if(result != None):
+			self.ed.curpos.y = result[0]
+			self.ed.curpos.x = result[1]
 		
-		for y in range(self.ed.curpos.y, -1, -1):
-			if(y == self.ed.curpos.y):
-				portion = self.ed.buffer.lines[y][0:self.ed.curpos.x]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-			else:
-				portion = self.ed.buffer.lines[y]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-
-			if(x > -1):
-				self.ed.curpos.y = y
-				self.ed.curpos.x = x
-				return
-
-		for y in range(len(self.ed.buffer.lines) - 1, self.ed.curpos.y - 1, -1):
-			if(y == self.ed.curpos.y):
-				portion = self.ed.buffer.lines[y][0:self.ed.curpos.x]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-			else:
-				portion = self.ed.buffer.lines[y]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-
-			if(x > -1):
-				self.ed.curpos.y = y
-				self.ed.curpos.x = x
-				return
-		
-	# replaces the first occurrence (after last find/replace operation)
+	# replaces the match at the cursor (left there by the last find/replace operation), and moves to the next one
 	def replace_next(self, sfind, srep, match_case, whole_words, regex):
-		n = len(sfind)
-		line = self.ed.buffer.lines[self.ed.curpos.y]
-		if(line[self.ed.curpos.x:self.ed.curpos.x+n] == sfind):
-			prev = line[0:self.ed.curpos.x]
-			next = line[self.ed.curpos.x+n:]
-			self.ed.buffer.lines[self.ed.curpos.y] = prev + srep + next
-			self.ed.buffer.major_update(self.ed.curpos, self.ed)
-			self.find_next(sfind, match_case)
-			return True
-		
-		return False
+		pattern = get_search_pattern(sfind, match_case, whole_words, regex)
+		y = self.ed.curpos.y
+		x = self.ed.curpos.x
+		length = pattern.match_at(self.ed.buffer.lines[y], x)
+		if(length <= 0): return False
+		line_length = len(self.ed.buffer.lines[y])
+		try:
+			count = self.ed.buffer.replace_all([ (y, x, length) ], srep, pattern)
+		except re.error:
+			beep()
+			return False
+		if(count == 0): return False
+
+		# the next match is looked for after the replacement (which may contain the searched text)
+		self.ed.curpos.x = max([0, x + len(self.ed.buffer.lines[y]) - line_length + length - 1])
+		self.find_next(sfind, match_case, whole_words, regex)
+		return True
 
+	# replaces all matches as a single undoable edit
 	def replace_all(self, sfind, srep, match_case, whole_words, regex):
-		self.find_next(sfind, match_case)
-		count = 0
-		while(self.replace_next(sfind, srep, match_case)):
-			count += 1		
-		if(count > 0): self.ed.buffer.major_update(self.ed.curpos, self.ed, True)
\ No newline at end of file
+		pattern = get_search_pattern(sfind, match_case, whole_words, regex)
+		try:
+			count = self.ed.buffer.replace_all(pattern.find_all(self.ed.buffer.lines), srep, pattern)
+		except re.error:
+			beep()
+			return 0
+		if(count > 0):
+			self.ed.curpos.y = min([self.ed.curpos.y, len(self.ed.buffer.lines) - 1])
+			self.ed.curpos.x = min([self.ed.curpos.x, len(self.ed.buffer.lines[self.ed.curpos.y])])
+		return count
\ No newline at end of file
@@ -9,18 +9,49 @@ from ash.gui import *
 from ash.gui.cursorPosition import *
 from ash.utils.keyUtils import *
 
+from bisect import bisect_right
+
+# GroupedListItem class: a file and its matches; the text of a match is made from the line of its
+# buffer (or, for a file searched on disk, from the context kept with the match) only when it is first drawn
 class GroupedListItem:
-	def __init__(self, text, filename):
+	def __init__(self, text, filename, buffer = None):
 		self.collapsed = False
 		self.text = text
 		self.filename = filename
-		self.children = list()
+		self.buffer = buffer
+		self.children = list()				# None for a match whose text is yet to be made
 		self.positions = list()
+		self.contexts = dict()				# child-index -> tuple(context-start, context), for files without buffers
 
 	def add_child(self, text, line_index, col_pos):
 		self.children.append(text)
 		self.positions.append(CursorPosition(line_index, col_pos))
 
+	# adds a match in the buffer, or in the file with the part of its line given as context
+	def add_match(self, line_index, col_pos, context_start = 0, context = None):
+		if(context != None): self.contexts[len(self.children)] = (context_start, context)
+		self.add_child(None, line_index, col_pos)
+
+	# returns the text of a child, showing up to width characters on either side of a match
+	def get_child(self, index, width):
+		text = self.children[index]
+		if(text != None): return text
+		pos = self.positions[index]
+		line_start = 0
+		if(index in self.contexts):
+			line_start, line = self.contexts[index]
+		else:
+			try:
+				line = self.buffer.lines[pos.y]
+			except IndexError:
+				line = ""					# (the buffer has been changed since it was searched)
+		x = pos.x - line_start
+		context = line[ max(0, x - width) : min(len(line), x + width) ]
+		context = context.replace("\t", " ").replace("\n", " ").replace("\r","")
+		text = f"Line {pos.y+1}, Col {pos.x+1}: {context}"
+		self.children[index] = text
+		return text
+
 	def __len__(self):
 		if(self.collapsed):
 			return 1
@@ -39,6 +70,9 @@ class GroupedListItem:
 		else:
 			return self.children
 
+# GroupedListBox class: the rows (items and their children, as shown) are not built up front, but
+# located from the prefix-sums of the row-counts of the items, and the text of each made only when
+# it is drawn; so only the visible rows cost anything, however many results are added
 class GroupedListBox(Widget):
 	def __init__(self, parent, y, x, width, row_count, placeholder_text = None, callback = None):
 		super().__init__(WIDGET_TYPE_LISTBOX)
@@ -51,9 +85,8 @@ class GroupedListBox(Widget):
 		self.placeholder_text = placeholder_text
 		self.callback = callback
 		self.items = list()
-		self.tags = list()
-		self.disp_items = list()
-		self.should_highlight = list()
+		self.row_items = list()				# indices of the items shown (those with children)
+		self.row_starts = [0]				# row of each item shown, and the row-count at the end
 		self.theme = gc("global-default")
 		self.focus_theme = gc("formfield-focussed")
 		self.sel_blur_theme = gc("formfield-selection-blurred")
@@ -85,14 +118,23 @@ class GroupedListBox(Widget):
 		if(self.sel_index < 0):
 			return None
 		else:
-			return self.items[self.sel_index]
+			return self.get_row_text(self.sel_index)
 
-	# returns the tag of the selected item
+	# returns the tag of the selected item: "p={item-index}" or "c={child-index};p={item-index}"
 	def get_sel_tag(self):
-		if(self.sel_index < 0):
-			return None
-		else:
-			return self.tags[self.sel_index]
+		if(self.sel_index < 0): return None
+		i, j = self.get_row(self.sel_index)
+		return (f"p={i}" if j < 0 else f"c={j};p={i}")
+
+	# returns tuple(item-index, child-index) of a row, the child-index being -1 for an item's own row
+	def get_row(self, index):
+		k = bisect_right(self.row_starts, index) - 1
+		return (self.row_items[k], index - self.row_starts[k] - 1)
+
+	# returns the text of a row
+	def get_row_text(self, index):
+		i, j = self.get_row(index)
+		return (str(self.items[i]) if j < 0 else self.items[i].get_child(j, self.width))
 
 	# draw the listbox
 	def repaint(self):
@@ -109,32 +151,38 @@ class GroupedListBox(Widget):
 			self.list_start = max([0, self.sel_index - self.row_count + 1])
 			
 		for i in range(self.list_start, self.list_end):
-			n = 2 + len(str(self.disp_items[i]))
+			row_text = self.get_row_text(i)
+			should_highlight = (self.get_row(i)[1] < 0)
+			n = 2 + len(row_text)
 			if(n > self.width):
-				text = " " + str(self.disp_items[i])[0:self.width-2] + " "
+				text = " " + row_text[0:self.width-2] + " "
 			else:
-				text = " " + str(self.disp_items[i]) + (" " * (self.width-n+1))
+				text = " " + row_text + (" " * (self.width-n+1))
 
 			if(i == self.sel_index):
 				if(self.is_in_focus):
 					style = self.focus_theme
-					if(self.should_highlight[i]): style |= curses.A_BOLD
+					if(should_highlight): style |= curses.A_BOLD
 					self.parent.addstr(self.y + i - self.list_start, self.x, text, style)
 				else:
 					style = self.sel_blur_theme
-					if(self.should_highlight[i]): style |= curses.A_BOLD
+					if(should_highlight): style |= curses.A_BOLD
 					self.parent.addstr(self.y + i - self.list_start, self.x, text, style)
 			else:
 				style = self.theme
-				if(self.should_highlight[i]): style = curses.A_BOLD | gc("global-highlighted")
+				if(should_highlight): style = curses.A_BOLD | gc("global-highlighted")
 				self.parent.addstr(self.y + i - self.list_start, self.x, text, style)
 
+		# rows below the last one are blanked, as results may be added without the window being cleared
+		for i in range(self.list_end - self.list_start, self.row_count):
+			self.parent.addstr(self.y + i, self.x, " " * self.width, self.theme)
+
 		if(self.count == 0): self.parent.addstr(self.y + (self.row_count // 2), self.x, ("" if self.placeholder_text == None else self.placeholder_text).center(self.width), gc("disabled"))
 	
 	# handle key presses
 	def perform_action(self, ch):
 		self.focus()
-		n = len(self.disp_items)
+		n = self.count
 
 		if(n == 0):
 			self.sel_index = -1
@@ -153,14 +201,14 @@ class GroupedListBox(Widget):
 			else:
 				self.sel_index = 0
 		elif(KeyBindings.is_key(ch, "LIST_MOVE_TO_NEXT_PAGE")):
-			if(self.sel_index < len(self.items) - self.row_count):
-				self.sel_index += min([self.row_count, len(self.items)-1])
+			if(self.sel_index < n - self.row_count):
+				self.sel_index += min([self.row_count, n-1])
 			else:
-				self.sel_index = len(self.items)-1
+				self.sel_index = n-1
 		elif(KeyBindings.is_key(ch, "FIND_NEXT")):
 			self.handle_selected_file_open()
-		elif(self.sel_index > -1 and self.tags[self.sel_index].startswith("p=")):
-			i = int(self.tags[self.sel_index][2:])
+		elif(self.sel_index > -1 and self.get_row(self.sel_index)[1] < 0):
+			i = self.get_row(self.sel_index)[0]
 			if(self.items[i].collapsed and KeyBindings.is_key(ch, "EXPAND_DIRECTORY")):
 				self.items[i].collapsed = False
 				self.render()
@@ -177,19 +225,29 @@ class GroupedListBox(Widget):
 		if(self.callback != None): self.callback(self.sel_index)
 		self.repaint()
 
+	# shows the results of a search, replacing those shown
 	def display(self, search_results, buffers):
-		# data must be a dictionary indexed by buffer-IDs
-		# each item contains a list of tuples(line_index, col_pos)
-		app = self.parent.parent.app
 		self.items = list()
+		self.sel_index = -1
+		self.add_results(search_results, buffers)
+
+	# removes all results
+	def clear(self):
+		self.display(None, None)
+
+	# adds results to those shown (e.g. as they are found)
+	def add_results(self, search_results, buffers):
+		# data must be a dictionary indexed by buffer-IDs (or filenames, for files searched on disk)
+		# each item contains a list of tuples(line_index, col_pos, length[, context_start, context])
+		app = self.parent.parent.app
 		if(search_results == None):
 			self.render()
 			self.repaint()
 			return
 
 		for bid, data in search_results.items():
-			buffer = buffers.get_buffer_by_id(bid)
-			name = buffer.get_name()
+			buffer = (None if isinstance(bid, str) else buffers.get_buffer_by_id(bid))
+			name = (bid if buffer == None else buffer.get_name())
 			if(app.app_mode == APP_MODE_PROJECT):
 				disp_name = get_relative_file_title(app.project_dir, name)
 				if(disp_name == name): disp_name = get_file_title(name)
@@ -197,69 +255,41 @@ class GroupedListBox(Widget):
 				disp_name = get_file_title(name)
 
 			disp_name += " (" + str(len(data)) + " occurrences)"
-			gli = GroupedListItem(disp_name, name)
+			gli = GroupedListItem(disp_name, name, buffer)
 			for d in data:
-				line_index = d[0]
-				col_pos = d[1]
-
-				line_length = len(buffer.lines[line_index])
-				context = buffer.lines[line_index][ max(0,col_pos-self.width) : min(line_length, col_pos+self.width) ]
-				context = context.replace("\t", " ").replace("\n", " ").replace("\r","")
-				disp_child = f"Line {line_index+1}, Col {col_pos+1}: {context}"
-				gli.add_child(disp_child, line_index, col_pos)
+				gli.add_match(d[0], d[1], *d[3:5])
 			self.items.append(gli)
 
 		self.render()
 		self.repaint()
 	
 	def render(self):
-		self.tags = list()
-		self.should_highlight = list()
-		self.disp_items = list()
-		self.count = 0
+		self.row_items = list()
+		self.row_starts = [0]
 		for i, item in enumerate(self.items):
 			if(len(item) == 1 and not item.collapsed): continue
-			self.count += len(item)
-			self.disp_items.append(str(item))
-			self.tags.append(f"p={i}")
-			self.should_highlight.append(True)
-			sublist = item.get_sublist()
-			if(sublist == None): continue
-			for j, child in enumerate(sublist):
-				self.disp_items.append(str(child))
-				self.tags.append(f"c={j};p={i}")
-				self.should_highlight.append(False)
+			self.row_items.append(i)
+			self.row_starts.append(self.row_starts[-1] + len(item))
+		self.count = self.row_starts[-1]
 		
-		if(self.sel_index < 0): 
-			if(len(self.disp_items) > 0):
+		if(self.sel_index < 0 or self.sel_index >= self.count): 
+			if(self.count > 0):
 				self.sel_index = 0
 				self.focussable = True
 			else:
 				self.sel_index = -1
 				self.focussable = False
 		
-		self.list_start = 0
-		self.list_end = min([self.row_count, len(self.disp_items)])
+		# the rows in view stay in view as results are added
+		if(self.list_start >= self.count): self.list_start = 0
+		self.list_end = min([self.list_start + self.row_count, self.count])
 		
 	def handle_selected_file_open(self):
 		if(self.sel_index < 0): return
-		mw = self.parent.parent
-		app = mw.app
-		tag = self.tags[self.sel_index]
-		filename = None
-		curpos = None
-		if(tag.startswith("p=")):
-			pli = int(tag[2:])
-			gli = self.items[pli]
-			filename = gli.filename
-		elif(tag.startswith("c=")):
-			temp = tag.split(";")
-			pli = int(temp[1][2:])
-			cli = int(temp[0][2:])
-			gli = self.items[pli]
-			filename = gli.filename
-			curpos = gli.positions[cli]
-
+		pli, cli = self.get_row(self.sel_index)
+		gli = self.items[pli]
+		filename = gli.filename
+		curpos = (None if cli < 0 else gli.positions[cli])
 		self.parent.handle_fileopen(filename, curpos)
 
 	# returns the text of the selected item
@@ -267,11 +297,10 @@ class GroupedListBox(Widget):
 		return self.get_sel_text()
 
 	def on_click(self, y, x):
-		if(len(self.items) > y + self.list_start):
+		if(self.count > y + self.list_start):
 			self.sel_index = y + self.list_start
-			tag = self.tags[self.sel_index]
-			if(x == 1 and tag.startswith("p=")):
-				i = int(tag[2:])
+			i, j = self.get_row(self.sel_index)
+			if(x == 1 and j < 0):
 				self.items[i].collapsed = not self.items[i].collapsed
 				self.render()
-			self.repaint()
\ No newline at end of file
+			self.repaint()
@@ -10,6 +10,7 @@ from ash.gui.window import *
 from ash.gui.groupedListbox import *
 from ash.gui.textfield import *
 from ash.gui.checkbox import *
+from ash.core.searchSession import *
 
 class ProjectFindReplaceDialog(Window):
 	def __init__(self, parent, y, x, buffers, replace = False):
@@ -19,6 +20,8 @@ class ProjectFindReplaceDialog(Window):
 		self.theme = gc("outer-border")
 		self.win = None
 		self.replace = replace
+		self.search_session = None			# caches the results of the searches made while the dialog is shown
+		self.search = None					# the search running in the background, or the last one made
 		
 		self.txtFind = TextField(self, 4, 2, 66)
 		if(self.replace): self.txtReplace = TextField(self, 6, 2, 66)
@@ -26,6 +29,7 @@ class ProjectFindReplaceDialog(Window):
 		self.chkMatchCase = CheckBox(self, (7 if self.replace else 5), 2, "Match case")
 		self.chkWholeWords = CheckBox(self, (7 if self.replace else 5), 18, "Whole words")
 		self.chkRegex = CheckBox(self, (7 if self.replace else 5), 35, "Regex")
+		self.chkOnDisk = CheckBox(self, (7 if self.replace else 5), 46, "Files on disk")
 		self.lstResults = GroupedListBox(self, (8 if self.replace else 6), 2, 66, (11 if self.replace else 13), "No results")
 		
 		self.add_widget("txtFind", self.txtFind)
@@ -33,6 +37,7 @@ class ProjectFindReplaceDialog(Window):
 		self.add_widget("chkMatchCase", self.chkMatchCase)
 		self.add_widget("chkWholeWords", self.chkWholeWords)
 		self.add_widget("chkRegex", self.chkRegex)
+		self.add_widget("chkOnDisk", self.chkOnDisk)
 		self.add_widget("lstResults", self.lstResults)
 
 	# show the window and start the event-loop
@@ -42,13 +47,20 @@ class ProjectFindReplaceDialog(Window):
 		curses.curs_set(False)
 		self.win.keypad(True)
 		self.win.timeout(0)
+		self.search_session = SearchSession(self.buffers)
+		self.buffers.refresh_index()
 		
 		self.repaint()
 
 		# start of the event loop	
 		while(self.win != None):
 			ch = self.win.getch()
-			if(ch == -1): continue
+			if(ch == -1):
+				# results are handed over as events; other events may have drawn over the window
+				if(self.parent.app.process_events() > 0 and self.win != None):
+					self.win.touchwin()
+					self.win.refresh()
+				continue
 			
 			if(self.active_widget_index < 0 or not self.get_active_widget().does_handle_tab()):
 				if(KeyBindings.is_key(ch, "FOCUS_NEXT") or KeyBindings.is_key(ch, "FOCUS_PREVIOUS")):
@@ -121,16 +133,61 @@ class ProjectFindReplaceDialog(Window):
 
 			if(aw != None): aw.repaint()
 	
+	# starts searching in the background (cancelling the search for the previous text); the results
+	# are added to the list as they are found
 	def handle_find_all(self, search_text):
-		if(len(search_text.strip()) == 0):
-			search_results = None
-		else:
-			search_results = self.buffers.find_all(search_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
-		self.lstResults.display(search_results, self.parent.app.buffers)
+		self.search_session.cancel()
+		self.search = None
+		self.lstResults.placeholder_text = "No results"
+		self.lstResults.clear()
+		if(len(search_text.strip()) > 0):
+			self.lstResults.placeholder_text = "Searching..."
+			self.lstResults.repaint()
+			self.search = self.search_session.start(search_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked(), self.on_search_results, self.on_search_finish, self.get_search_dir())
+		self.repaint_status()
+
+	# returns the directory whose files are to be searched on disk (grep-style, without reading them
+	# into buffers), or None if the files of the project are to be read into buffers when they match
+	def get_search_dir(self):
+		app = self.parent.app
+		if(app.app_mode != APP_MODE_PROJECT or not self.chkOnDisk.is_checked()): return None
+		return app.project_dir
+
+	# called (from the main thread) with each batch of results
+	def on_search_results(self, search_results):
+		if(self.win == None): return
+		self.lstResults.add_results(search_results, self.parent.app.buffers)
+		self.repaint_status()
+		self.win.refresh()
+
+	def on_search_finish(self, search):
+		if(self.win == None): return
+		self.lstResults.placeholder_text = "No results"
+		self.lstResults.repaint()
+		self.repaint_status()
+		self.win.refresh()
+
+	# stops the search in the background when the window is closed
+	def hide(self):
+		if(self.search_session != None): self.search_session.cancel()
+		super().hide()
 		
+	# replaces in the buffers at once, and in the files on disk (those searched) in the background
 	def handle_replace_all(self, search_text, replace_text):
-		c, fc = self.buffers.replace_all(search_text, replace_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
-		self.parent.app.show_error(f"{c} occurrences were replaced in {fc} buffers", False)
+		search_dir = self.get_search_dir()
+		files = (None if search_dir == None else self.search_session.get_disk_files(search_dir))
+		try:
+			c, fc = self.buffers.replace_all(search_text, replace_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked(), files)
+		except re.error as e:
+			self.parent.app.show_error("Invalid replacement: " + str(e))
+			return
+
+		# the hits remembered for the files on disk are no longer valid
+		self.search_session.cancel()
+		self.search_session = SearchSession(self.buffers)
+		msg = f"{c} occurrences were replaced in {fc} buffers"
+		if(self.buffers.replacer != None): msg += f"\n{len(self.buffers.replacer.items)} file(s) on disk are being searched and rewritten in the background"
+		self.parent.app.show_error(msg, False)
 
 	def handle_fileopen(self, filename, curpos):			# called from groupedlistbox
 		highlight_info = {
@@ -168,4 +225,18 @@ class ProjectFindReplaceDialog(Window):
 			if(w != aw): w.repaint()
 
 		if(aw != None): aw.repaint()
-		self.win.refresh()
\ No newline at end of file
+		self.repaint_status()
+		self.win.refresh()
+
+	# shows the progress of the search on the bottom border
+	def repaint_status(self):
+		if(self.win == None): return
+		self.win.addstr(self.height-1, 2, BORDER_HORIZONTAL * (self.width-4), self.theme)
+		if(self.search == None): return
+		if(self.search_session.search == self.search):
+			status = f" Searching... {int(self.search.get_progress() * 100)}% "
+		elif(self.search.truncated):
+			status = f" Showing the first {MAX_SEARCH_HITS} results "
+		else:
+			return
+		self.win.addstr(self.height-1, 2, status, self.theme)
\ No newline at end of file
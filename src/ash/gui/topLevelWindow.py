@@ -31,6 +31,8 @@ class TopLevelWindow(Window):
 
 		self.status = None
 		self.show_statusbar = False
+		self.full_redraw = True				# set when the whole screen has to be redrawn (see repaint())
+		self.last_layout = None				# the layout of the editors when last repainted
 		self.toggle_statusbar_visibility()
 
 	def toggle_statusbar_visibility(self):
@@ -56,7 +58,7 @@ class TopLevelWindow(Window):
 
 		if(aed != None):
 			lines, sloc = aed.buffer.get_loc()
-			loc_count = str(lines) + " lines (" + str(sloc) + " sloc)"
+			loc_count = str(lines) + " lines" + ("" if sloc == None else " (" + str(sloc) + " sloc)")
 			
 			if(aed.buffer.filename != None):
 				if(os.path.isfile(aed.buffer.filename)): file_size = aed.buffer.get_file_size()
@@ -104,7 +106,9 @@ class TopLevelWindow(Window):
 		
 		while(self.win != None):
 			ch = self.win.getch()
-			if(ch == -1): continue
+			if(ch == -1):
+				self.app.process_events()
+				continue
 			
 			# send Ctrl/Fn keypresses to main handler first
 			if(self.handler_func != None):
@@ -140,13 +144,18 @@ class TopLevelWindow(Window):
 			
 			self.repaint()
 	
-	# repaint background
-	def repaint_background(self):
+	# repaint background: the area between the title-bar and the status-bar only if full is True
+	def repaint_background(self, full = True):
 		self.win.addstr(0, 0, " " * self.width, gc("titlebar"))
-		for i in range(1, self.height-1):
-			self.win.addstr(i, 0, " " * self.width, gc("background"))
+		if(full):
+			for i in range(1, self.height-1):
+				self.win.addstr(i, 0, " " * self.width, gc("background"))
 		self.win.addstr(self.height-1, 0, " " * (self.width - 1), gc("background"))
 
+	# makes the next repaint redraw the whole screen (e.g. after the colors have changed)
+	def request_full_redraw(self):
+		self.full_redraw = True
+
 	# draws the window
 	def repaint(self, error_msg = None, caller=None):
 		curses.curs_set(False)
@@ -154,8 +163,22 @@ class TopLevelWindow(Window):
 		
 		self.update_status()
 		self.readjust()
-		self.win.clear()
-		self.repaint_background()
+
+		# the screen is cleared only when it has to be redrawn in full; otherwise curses sends only the cells
+		# which have changed, and the area of the editors is painted over only if their layout has changed
+		# (if not, each editor draws only what has changed since it was last drawn)
+		layout = self.window_manager.get_layout()
+		full = (self.full_redraw or layout != self.last_layout)
+		if(self.full_redraw):
+			self.win.clear()
+			self.full_redraw = False
+		else:
+			self.win.touchwin()				# restores whatever dialogs and menus had covered
+		self.last_layout = layout
+		self.repaint_background(full)
+		if(full):
+			for ed in self.window_manager.get_editors_in_active_tab():
+				ed.invalidate()
 
 		if(error_msg == None):
 			if(self.status != None): self.status.repaint(self.win, self.width-1, self.height-1, 0)
@@ -196,6 +219,7 @@ class TopLevelWindow(Window):
 	def readjust(self):							# called from AshEditorApp
 		if( (not self.show_statusbar or self.status != None) and self.height == self.app.screen_height and self.width == self.app.screen_width): return
 		self.height, self.width = self.app.screen_height, self.app.screen_width
+		self.full_redraw = True
 		
 		# status-bar sections: total=101+1 (min) = 102
 		# *status (8), *file-type (11), encoding(7), sloc (20), file-size (10), 
@@ -232,14 +256,15 @@ class TopLevelWindow(Window):
 		adh = self.app.dialog_handler
 		self.menu_bar = MenuBar(self, self.win, 0, 0)
 		has_editor = (True if aed != None else False)
+		can_edit = (has_editor and not aed.buffer.is_loading())
 
 		file_menu_items = [
 			("New File...", True, adh.invoke_file_new),
 			("Open File/Project...", True, adh.invoke_file_open),
 			("---", True, None),
-			("Save", has_editor, self.save_active_editor),
+			("Save", can_edit, self.save_active_editor),
 			("Save As...", has_editor, (adh.invoke_file_save_as, aed_buffer) if has_editor else None),
-			("Save & Close", has_editor, self.save_and_close_active_editor),
+			("Save & Close", can_edit, self.save_and_close_active_editor),
 			("Save All", True, adh.handle_save_all),
 			("---", True, None),
 			("Close All", True, self.close_all_tabs),
@@ -247,18 +272,18 @@ class TopLevelWindow(Window):
 		]
 
 		edit_menu_items = [
-			("Undo", has_editor, (aedkh.handle_undo if has_editor else None)),
-			("Redo", has_editor, (aedkh.handle_redo if has_editor else None)),
+			("Undo", can_edit, (aedkh.handle_undo if has_editor else None)),
+			("Redo", can_edit, (aedkh.handle_redo if has_editor else None)),
 			("---", True, None),
-			("Cut", has_editor and aed.selection_mode, (aedkh.handle_cut if has_editor else None)),
+			("Cut", can_edit and aed.selection_mode, (aedkh.handle_cut if has_editor else None)),
 			("Copy", has_editor and aed.selection_mode, (aedkh.handle_copy if has_editor else None)),
-			("Paste", has_editor, (aedkh.handle_paste if has_editor else None)),
+			("Paste", can_edit, (aedkh.handle_paste if has_editor else None)),
 			("---", True, None),
 			("Select All", has_editor, (aedkh.handle_select_all if has_editor else None)),
 			("Select Line", has_editor, (aedkh.handle_select_line if has_editor else None)),
 			("---", True, None),
 			("Find", has_editor, adh.invoke_find),
-			("Find & Replace", has_editor, adh.invoke_find_and_replace),
+			("Find & Replace", can_edit, adh.invoke_find_and_replace),
 			("Find in all files", True, adh.invoke_project_find),
 			("Find & Replace in all files", True, adh.invoke_project_find_and_replace)
 		]
@@ -434,7 +434,7 @@ class WindowTab:
 				else:
 					buffer = self.manager.app.buffers.get_buffer_by_filename(editor_data.filename)
 					if(buffer == None):
-						bid, buffer = self.manager.app.buffers.create_new_buffer(editor_data.filename)
+						bid, buffer = self.manager.app.buffers.create_new_buffer(editor_data.filename, has_backup=BufferManager.backup_exists(editor_data.filename))
 					else:
 						bid = buffer.id
 				node.editor = node.create_new_editor(bid, buffer)
@@ -620,6 +620,12 @@ class WindowManager:
 		if(self.active_tab_index < 0): return list()
 		return self.tabs[self.active_tab_index].get_list_of_editors()
 
+	# returns what determines the parts of the screen covered by the editors of the active tab, and what is
+	# drawn over them (see TopLevelWindow.repaint())
+	def get_layout(self):
+		editors = tuple([ (ed, ed.get_bounds(), ed.buffer) for ed in self.get_editors_in_active_tab() ])
+		return (self.screen_height, self.screen_width, self.active_tab_index, self.show_filenames, self.get_active_editor(), editors)
+
 	def set_as_active_editor(self, ed):
 		if(self.active_tab_index < 0): return
 		self.tabs[self.active_tab_index].set_as_active_editor(ed)
\ No newline at end of file
@@ -9,6 +9,7 @@ from ash import *
 
 import time
 import signal
+import queue
 
 from ash.core.bufferManager import *
 from ash.core.logger import *
@@ -28,7 +29,8 @@ from ash.gui.topLevelWindow import *
 from ash.gui.msgBox import *
 from ash.gui.inputBox import *
 from ash.gui.dialogHandler import *
-from ash.gui.fileLoader import *
+
+PROGRESS_REPORT_STEP	= 256			# files registered between two progress updates while opening a project
 
 class AshEditorApp:
 	def __init__(self, ash_dir, args):
@@ -36,6 +38,7 @@ class AshEditorApp:
 		self.args = args
 		self.argc = len(args)
 		self.dialog_handler = DialogHandler(self)
+		self.events = queue.Queue()			# callbacks posted by background threads, run on the main thread
 
 		# create the application data directory
 		if(not os.path.exists(APP_DATA_DIR)): os.mkdir(APP_DATA_DIR)
@@ -44,6 +47,7 @@ class AshEditorApp:
 		if(not os.path.exists(APP_THEMES_DIR)): os.mkdir(APP_THEMES_DIR)
 
 		log_init()
+		ash.METADATA_CACHE = MetadataCache(METADATA_CACHE_FILE)
 		
 	
 	def open_project(self, progress_handler = None, ask_to_restore_session = True):
@@ -53,17 +57,15 @@ class AshEditorApp:
 		# find all files
 		all_files = glob.glob(self.project_dir + "/**/*", recursive=True)
 
-		# create buffers for each file
+		# register each file: its contents are read only when it is opened, searched or restored from the session
 		for i, f in enumerate(all_files):
 			if(not os.path.isfile(f)): continue
 			if(should_ignore_file(f)): continue
-			if(BufferManager.is_binary(f)): continue
-			has_backup = BufferManager.backup_exists(f)
-			if(not self.buffers.does_file_have_its_own_buffer(f)):
-				self.buffers.create_new_buffer(filename=f, has_backup=has_backup)
-			if(progress_handler != None): 
+			self.buffers.add_stub(f)
+			if(progress_handler != None and i % PROGRESS_REPORT_STEP == 0): 
 				progress = ( ( i / len(all_files) ) * 100 )
 				progress_handler("Loading...", progress)
+		self.buffers.scan_stubs()
 
 		# check if session exists, ask user if they want to restore it
 		if(ask_to_restore_session and self.session_storage.does_project_have_saved_session(self.project_dir)):
@@ -192,9 +194,36 @@ class AshEditorApp:
 			progress_line = "\u2501" * int((progress/100) * (self.screen_width - 9 - len(msg)))
 			self.main_window.repaint(f"{int(progress)}% {progress_line} {msg}")	
 
+	# schedules func(*args) to be called from the main event-loop: safe to call from any thread
+	def post_event(self, func, *args):
+		self.events.put( (func, args) )
+
+	# runs all pending callbacks posted by post_event(); returns the number of callbacks run
+	def process_events(self):
+		count = 0
+		while(True):
+			try:
+				func, args = self.events.get_nowait()
+			except queue.Empty:
+				return count
+			func(*args)
+			count += 1
+
+	# cancels background file loads; returns False if there was nothing to cancel
+	def cancel_loading(self):
+		aed = self.main_window.get_active_editor()
+		if(aed == None):
+			if(len(self.buffers.get_loading_buffers()) == 0): return False
+			self.buffers.cancel_all_loading()
+		else:
+			if(not aed.buffer.is_loading()): return False
+			aed.buffer.cancel_loading()
+		return True
+
 	# called on app_exit
 	def __destroy(self):
-		self.buffers.destroy()		
+		self.buffers.destroy()
+		ash.METADATA_CACHE.save()
 
 	# primary key handler to receive all key combinations from TopLevelWindow
 	def main_key_handler(self, ch):
@@ -216,6 +245,9 @@ class AshEditorApp:
 			# quits the active editor or the active tab (if no editor is active) or the app (if no tab is active)
 			self.dialog_handler.invoke_quit()
 			return -1
+		elif(KeyBindings.is_key(ch, "CANCEL_OPERATION") and self.cancel_loading()):
+			# cancels loading the file in the active editor (or all files, if no editor is active)
+			return -1
 		elif(KeyBindings.is_key(ch, "RESIZE_WINDOW")):
 			self.readjust()
 			self.main_window.repaint()
@@ -343,17 +375,6 @@ class AshEditorApp:
 		self.main_window.repaint()
 		return response
 
-	def load_file(self, filename, encoding):
-		try:
-			self.fileLoader = FileLoader(self, filename, encoding)
-		except:
-			self.warn_insufficient_screen_space()
-			raise
-
-		data = self.fileLoader.load()
-		self.main_window.repaint()
-		return data
-
 	# checks if buffer is up-to-date with file on disk
 	def is_file_already_loaded(self, filename):
 		return self.buffers.does_file_have_its_own_buffer(filename)
@@ -6,6 +6,7 @@
 # This module handles all commands entered through the command-window
 
 from ash import *
+from ash.core.bufferManager import *
 
 class CommandInterpreter:
 	def __init__(self, app, mw):
@@ -93,7 +94,7 @@ class CommandInterpreter:
 		else:
 			bid = self.app.buffers.get_buffer_by_filename(filename)
 			if(bid == None):
-				bid, buffer = self.app.buffers.create_new_buffer(filename)
+				bid, buffer = self.app.buffers.create_new_buffer(filename, has_backup=BufferManager.backup_exists(filename))
 		self.mw.split_horizontally(bid)
 		
 	# Syntax: (filenames are relative to project if PROJECT_MODE)
@@ -112,5 +113,5 @@ class CommandInterpreter:
 		else:
 			bid = self.app.buffers.get_buffer_by_filename(filename)
 			if(bid == None):
-				bid, buffer = self.app.buffers.create_new_buffer(filename)
+				bid, buffer = self.app.buffers.create_new_buffer(filename, has_backup=BufferManager.backup_exists(filename))
 		self.mw.split_vertically(bid)
\ No newline at end of file
@@ -72,8 +72,12 @@ def get_copy_filename(filename):
 	else:
 		return dir + ft[0:pos2] + "-copy" + ft[pos2:]
 
+SNIFF_PREFIX_SIZE	= 8192			# bytes read by sniff_file_prefix()
+SNIFF_LINE_COUNT	= 20			# lines passed to chardet by predict_file_encoding()
+UTF8_CERTAIN_COUNT	= 6				# multi-byte characters after which chardet is certain of UTF-8
+
 # predict the encoding of a file
-def predict_file_encoding(filename, n = 20):
+def predict_file_encoding(filename, n = SNIFF_LINE_COUNT):
 	if(not os.path.isfile(filename)): return None
 	fs = int(os.stat(filename).st_size)
 	n = min([fs, n])
@@ -82,6 +86,85 @@ def predict_file_encoding(filename, n = 20):
 	enc = chardet.detect(rawdata)["encoding"]
 	return ("utf-8" if enc == "ascii" else enc)		# assume UTF-8
 
+# classifies a file by its name (mimetype) and, if that is inconclusive and sniff is True, by its
+# contents; returns tuple(is-binary, predicted-encoding), the encoding being None if not predicted
+def classify_file(filename, sniff = True):
+	if(not os.path.isfile(filename)): return (True, None)
+	mt = str(mimetypes.guess_type(filename, strict=False)[0]).lower()
+	if(mt.startswith("text/")):
+		return (False, None)
+	elif(mt != "none"):
+		return (True, None)
+	elif(not sniff):
+		return (False, None)
+	
+	verdict = sniff_file_prefix(filename)
+	if(verdict != None): return verdict
+	pf = predict_file_encoding(filename)
+	if(pf == None): return (True, None)
+	if(str(pf).lower() not in SUPPORTED_ENCODINGS): return (True, pf)
+	return (False, pf)
+
+# classifies a file from the start of its contents without chardet, for the evident cases:
+# NUL bytes (binary), ASCII and UTF-8 (text); returns tuple(is-binary, encoding), or None if
+# chardet is needed; the verdicts are those chardet would give on the same lines
+def sniff_file_prefix(filename):
+	with open(filename, "rb") as f:
+		data = f.read(SNIFF_PREFIX_SIZE)
+	if(len(data) == 0): return None
+	if(data.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE))): return None		# (also the UTF-32 BOMs)
+	if(data.find(b"\0") > -1): return (True, None)
+
+	# look at the same lines as predict_file_encoding() (or the whole prefix, if they are longer)
+	end = -1
+	for i in range(SNIFF_LINE_COUNT):
+		end = data.find(b"\n", end + 1)
+		if(end < 0): break
+	if(end > -1): data = data[0:end+1]
+
+	if(data.find(b"\x1b") > -1 or data.find(b"~{") > -1): return None		# escape sequences: could be ISO-2022 or HZ
+	if(data.isascii()): return (False, "utf-8")
+	try:
+		text = codecs.getincrementaldecoder("utf-8")().decode(data, False)		# the prefix may end mid-character
+	except UnicodeDecodeError:
+		return None
+	multibyte_count = len(text) - len(text.encode("ascii", "ignore"))
+	return ((False, "utf-8") if multibyte_count >= UTF8_CERTAIN_COUNT else None)
+
+# detects the line-ending used in a text: "\r\n" if the first line ends with it, "\n" otherwise
+def detect_line_ending(text):
+	pos = text.find("\n")
+	return ("\r\n" if pos > 0 and text[pos-1] == "\r" else "\n")
+
+# splits a text into lines at the given line-ending; a trailing line-ending yields an empty last line,
+# so that joining the lines with the same line-ending restores the text exactly
+# (str.splitlines() is not used as it also splits at \v, \f, \x1c-\x1e, \x85, \u2028 and \u2029)
+def split_into_lines(text, newline = "\n"):
+	if(newline != "\n"): text = text.replace(newline, "\n")
+	return text.split("\n")
+
+# reads a text file in a single read, returns tuple(list of lines, line-ending)
+def read_text_file(filename, encoding = "utf-8"):
+	with open(filename, "rb") as f:
+		text = f.read().decode(encoding)
+	newline = detect_line_ending(text)
+	return (split_into_lines(text, newline), newline)
+
+# writes lines to a text file, joined by the given line-ending; the text is encoded in one go unless
+# lines_per_block is given, in which case it is written in blocks of lines (for very large buffers)
+def write_text_file(filename, lines, encoding = "utf-8", newline = "\n", lines_per_block = None):
+	n = len(lines)
+	with open(filename, "wb") as f:
+		if(lines_per_block == None or n <= lines_per_block):
+			f.write(newline.join(lines[0:n]).encode(encoding))
+			return
+		encoder = codecs.getincrementalencoder(encoding)()		# emits a BOM (if any) only once
+		for start in range(0, n, lines_per_block):
+			end = min([n, start + lines_per_block])
+			text = newline.join(lines[start:end])
+			if(end < n): text += newline
+			f.write(encoder.encode(text, end == n))
+
 # returns the size of a filename formatted in units
 def get_file_size(filename):
 	if(filename == None): 
@@ -108,6 +191,14 @@ def get_file_size(filename):
 		else:
 			return str(round(kb,2)) + " KB"
 
+# returns [size, mtime] of a file, used to detect if it has changed; None if it does not exist
+def get_file_version(filename):
+	try:
+		st = os.stat(filename)
+		return [ st.st_size, st.st_mtime_ns ]
+	except OSError:
+		return None
+
 # get the mime-type of a file
 def get_textfile_mimetype(filename):
 	mt = str(mimetypes.guess_type(filename, strict=False)[0]).lower()
@@ -140,4 +231,24 @@ def should_ignore_directory(dirname):
 	if(get_file_title(dirname) not in ash.SETTINGS.get("IGNORED_DIRECTORIES")):
 		return False
 	else:
-		return True
\ No newline at end of file
+		return True
+
+JOURNAL_PREFIX		= ".ash.j-"			# crash-recovery journals (see EditJournal), kept next to their files
+SAVE_TEMP_PREFIX	= ".ash-save-"		# temporary files written by saves in progress (see FileSaver)
+
+# checks if a file is one the editor keeps next to the files it edits (a journal or a temporary file)
+def is_editor_file(filename):
+	name = get_file_title(filename)
+	return (name.startswith(JOURNAL_PREFIX) or name.startswith(SAVE_TEMP_PREFIX))
+
+# returns all the files under a directory, leaving out the IGNORED DIRECTORIES, the files to be ignored,
+# the editor's own files, and (as glob does when a project is opened) hidden files and directories
+def list_project_files(project_dir):
+	files = list()
+	for root, dirs, names in os.walk(project_dir):
+		dirs[:] = [ d for d in dirs if not d.startswith(".") and not should_ignore_directory(d) ]
+		for name in names:
+			if(name.startswith(".") or is_editor_file(name)): continue
+			filename = os.path.join(root, name)
+			if(os.path.isfile(filename) and not should_ignore_file(filename)): files.append(filename)
+	return files
\ No newline at end of file
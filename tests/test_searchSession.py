@@ -0,0 +1,132 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# Tests project-wide searches (see SearchSession) and the replacement of matches in files on disk
+# (see BufferManager.replace_all())
+#
+# usage: python3 -m unittest discover tests
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from ash.core.bufferManager import *
+
+# stands in for the application: events posted by the buffer-manager are dropped
+class DummyApp:
+	def __init__(self):
+		self.app_mode = APP_MODE_PROJECT
+
+	def post_event(self, func, *args):
+		pass
+
+	def progress_handler(self, message, progress):
+		pass
+
+class ReplaceInFilesTest(unittest.TestCase):
+	def setUp(self):
+		self.project_dir = tempfile.mkdtemp()
+		self.buffers = BufferManager(DummyApp())
+
+	def tearDown(self):
+		self.buffers.destroy()
+		shutil.rmtree(self.project_dir)
+
+	def write(self, name, text):
+		filename = os.path.join(self.project_dir, name)
+		with open(filename, "w") as f:
+			f.write(text)
+		return filename
+
+	def read(self, filename):
+		with open(filename) as f:
+			return f.read()
+
+	# the editor's own journals and temporary files must never be rewritten, even if they are given
+	def test_journal_and_temporary_files_are_left_untouched(self):
+		source = self.write("a.py", "foo = 1\n")
+		journal = self.write(JOURNAL_PREFIX + "a.py", '[0, ["foo = 1"], ["foo = 2"]]\n')
+		temp = self.write(SAVE_TEMP_PREFIX + "x1y2z3", "foo = 3\n")
+
+		files = [ (filename, "utf-8") for filename in [ source, journal, temp ] ]
+		self.buffers.replace_all("foo", "bar", True, False, False, files)
+		replacer = self.buffers.replacer
+		self.assertIsNotNone(replacer)
+		self.assertEqual([ item[1] for item in replacer.items ], [ source ])
+		replacer.thread.join()
+
+		self.assertEqual(self.read(source), "bar = 1\n")
+		self.assertEqual(self.read(journal), '[0, ["foo = 1"], ["foo = 2"]]\n')
+		self.assertEqual(self.read(temp), "foo = 3\n")
+
+# the lines of a buffer, held in memory
+class DummyLines(list):
+	def is_lazy(self):
+		return False
+
+# stands in for a Buffer, as seen by a SearchSession
+class DummyBuffer:
+	def __init__(self, bid, lines):
+		self.id = bid
+		self.version = 0
+		self.lines = DummyLines(lines)
+
+# stands in for a BufferManager, holding buffers only
+class DummyBufferManager:
+	def __init__(self, buffers):
+		self.buffers = { buffer.id: buffer for buffer in buffers }
+		self.stubs = dict()
+		self.index = TrigramIndex()
+
+# the hits of a session (found with the trigram index, and by narrowing the previous hits) must be
+# those of a full search
+class SearchSessionTest(unittest.TestCase):
+	def check(self, session, buffers, query):
+		results = session.find_all(*query)
+		pattern = get_search_pattern(*query)
+		for buffer in buffers:
+			self.assertEqual(results[buffer.id], pattern.find_all(buffer.lines), repr((buffer.lines, query)))
+
+	# queries typed a character at a time, with the buffers edited now and then
+	def test_typed_queries(self):
+		rand = random.Random(0)
+		buffers = [ DummyBuffer(bid, [ "".join([ rand.choice("aAbBıI _") for j in range(rand.randint(0, 30)) ]) for k in range(5) ]) for bid in range(4) ]
+		manager = DummyBufferManager(buffers)
+		session = SearchSession(manager)
+		for i in range(300):
+			match_case = (rand.random() < 0.5)
+			whole_words = (rand.random() < 0.2)
+			is_regex = (rand.random() < 0.2)
+			text = ""
+			for j in range(rand.randint(1, 5)):
+				text += rand.choice("abAIı" + ("+*?|()" if is_regex else ""))
+				try:
+					self.check(session, buffers, (text, match_case, whole_words, is_regex))
+				except re.error:
+					pass
+
+			buffer = rand.choice(buffers)
+			y = rand.randint(0, len(buffer.lines) - 1)
+			new_lines = [ "".join([ rand.choice("aAbBıI _") for j in range(rand.randint(0, 30)) ]) ]
+			buffer.lines[y:y+1] = new_lines
+			buffer.version += 1
+			manager.index.update_buffer(buffer, new_lines)
+
+	# a query which overlaps itself: its hits do not include every place it occurs in
+	def test_self_overlapping_query(self):
+		buffers = [ DummyBuffer(0, [ "aaab", "aaaab" ]) ]
+		session = SearchSession(DummyBufferManager(buffers))
+		for text in [ "a", "aa", "aab" ]:
+			self.check(session, buffers, (text, True, False, False))
+		self.assertFalse(SearchSession.can_narrow(("aa", True, False, False), ("aab", True, False, False)))
+		self.assertFalse(SearchSession.can_narrow(("aA", False, False, False), ("aAb", False, False, False)))
+		self.assertTrue(SearchSession.can_narrow(("ab", False, False, False), ("abc", False, False, False)))
+
+if(__name__ == "__main__"):
+	unittest.main()
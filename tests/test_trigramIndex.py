@@ -0,0 +1,129 @@
+# ---------------------------------------------------------------------------------------------
+#  Copyright (c) Akash Nag. All rights reserved.
+#  Licensed under the MIT License. See LICENSE.md in the project root for license information.
+# ---------------------------------------------------------------------------------------------
+
+# Tests that the trigram index never rules out a document holding a match (see TrigramIndex)
+#
+# usage: python3 -m unittest discover tests
+
+import os
+import sys
+import re
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from ash.core.trigramIndex import *
+from ash.core.searchEngine import *
+
+# checks if the index would let a document be searched for a query
+def may_contain(text, search_text, match_case = False, whole_words = False, is_regex = False):
+	query = TrigramQuery.create(search_text, match_case, whole_words, is_regex)
+	return (query == None or query.matches(*make_bitmap(get_trigrams(text))))
+
+class CaseFoldingTest(unittest.TestCase):
+	# str.casefold() turns U+0130 into "i" and a combining dot, so "ist" was never indexed
+	def test_dotted_capital_i(self):
+		self.assertEqual(len(get_search_pattern("istanbul", False, False, False).find_all([ "İstanbul" ])), 1)
+		self.assertTrue(may_contain("İstanbul", "istanbul"))
+		self.assertTrue(may_contain("istanbul", "İSTANBUL"))
+
+	# characters which re.IGNORECASE holds equal although their lowercase forms differ
+	def test_case_equivalents(self):
+		for text, search_text in [ ("ſtraße", "STRA"), ("dıskı", "DISKI"), ("ΟΔΟΣ", "οδος"), ("οδος", "ΟΔΟς"), ("Kelvin", "kelvin") ]:
+			self.assertEqual(len(get_search_pattern(search_text, False, False, False).find_all([ text ])), 1, text)
+			self.assertTrue(may_contain(text, search_text), text)
+
+	# every character folds to a single one, the same as its simple lowercase form (as compared by re)
+	def test_fold_is_one_to_one(self):
+		for c in [ "İ", "ß", "ﬁ", "ŉ", "ǰ", "Σ", "ς", "ſ", "K" ]:
+			self.assertEqual(len(fold_case(c)), 1, c)
+			self.assertIsNotNone(re.fullmatch(re.escape(c), fold_case(c), re.IGNORECASE), c)
+
+# documents are searched line by line: a document which may hold a match must never be ruled out
+CORPUS = [
+	"import os\nimport sys\n\ndef main():\n\treturn os.path.join(sys.argv[0], 'foo.py')",
+	"Color colour COLOR\nfoo_bar = fooBar + FOO\nabcabcabd xxxy xy",
+	"the Straße of İstanbul\nDISKI dıskı\nΟΔΟΣ οδος\nKelvin K",
+	"abab ababab\nfoobarbaz foo bar\nx = a.b; y = a_b",
+	"",
+]
+
+QUERIES = [
+	# plain text: case-sensitive and not, whole words or not
+	("import", True, False, False), ("IMPORT", False, False, False), ("os.path", False, False, False),
+	("foo", False, True, False), ("bar", True, True, False), ("foo_bar", False, True, False),
+	("colour", False, False, False), ("istanbul", False, False, False), ("STRASSE", False, False, False),
+	("diski", False, False, False), ("οδοσ", False, False, False), ("kelvin", False, False, False),
+	# regular expressions: groups, alternations, quantifiers, classes, escapes, anchors and look-arounds
+	("(foo)(bar)", False, False, True), ("foo|xyz", False, False, True), ("(ab|cd)ab", False, False, True),
+	("colou?r", False, False, True), ("ab+c", False, False, True), ("a(bc)*d", False, False, True),
+	("x{2,3}y", False, False, True), ("(?:abc)?abd", False, False, True), ("(abc)+abd", True, False, True),
+	("(?<=a)bab", False, False, True), ("foo(?=bar)", False, False, True), ("(?!xyz)foo", False, False, True),
+	("[fb]oo", False, False, True), ("\\.py", False, False, True), ("\\bimport\\b", True, False, True),
+	("^import", True, False, True), ("baz$", True, False, True), ("(ab)\\1", False, False, True),
+	("a.*?b", False, False, True), ("(?i)FOOBAR", True, False, True), ("(?x) foo \\s bar", True, False, True),
+	("[^a]bab", False, False, True), ("(?P<n>ab)(?P=n)ab", False, False, True), ("ab{0}ab", False, False, True),
+	("import\\nimport", False, False, True),
+]
+
+# returns the hits of a query in a document, searched in full
+def find_all(text, query):
+	return get_search_pattern(*query).find_all(text.split("\n"))
+
+class PruningTest(unittest.TestCase):
+	def check(self, text, query):
+		if(len(find_all(text, query)) > 0): self.assertTrue(may_contain(text, *query), repr((text, query)))
+
+	def test_corpus(self):
+		for text in CORPUS:
+			for query in QUERIES:
+				self.check(text, query)
+
+	# random documents over a few letters (with case-variants), searched for random pieces of them
+	def test_random_queries(self):
+		rand = random.Random(0)
+		pieces = [ "a", "b", "A", "ı", "I", "İ", "ab", "(ab)", "(a|b)", "b?", "a*", "(ba)+", "[ab]", ".", "a{2}", "(?:ab)?" ]
+		for i in range(2000):
+			text = "\n".join([ "".join([ rand.choice("abAIıİ ") for j in range(rand.randint(0, 20)) ]) for k in range(3) ])
+			if(rand.random() < 0.5):
+				line = rand.choice(text.split("\n"))
+				start = rand.randint(0, len(line))
+				query = (line[start:start + rand.randint(1, 6)], rand.random() < 0.5, rand.random() < 0.3, False)
+			else:
+				query = ("".join([ rand.choice(pieces) for j in range(rand.randint(1, 5)) ]), rand.random() < 0.5, False, True)
+			if(len(query[0]) > 0): self.check(text, query)
+
+	# a buffer's bitmap, updated as its lines change, must cover the lines it holds
+	def test_updated_buffer_bitmap(self):
+		rand = random.Random(1)
+		buffer = DummyBuffer([ "" ])
+		index = TrigramIndex()
+		for i in range(500):
+			start = rand.randint(0, len(buffer.lines))
+			end = min([len(buffer.lines), start + rand.randint(0, 2)])
+			new_lines = [ "".join([ rand.choice("abcAB") for j in range(rand.randint(0, 8)) ]) for k in range(rand.randint(0, 2)) ]
+			buffer.lines[start:end] = new_lines
+			if(len(buffer.lines) == 0): buffer.lines.append("")
+			buffer.version += 1
+			index.update_buffer(buffer, new_lines)
+			line = rand.choice(buffer.lines)
+			if(len(line) < 3): continue
+			query = TrigramQuery.create(line[0:3], False, False, False)
+			self.assertTrue(index.may_contain_buffer(buffer, query), line)
+
+# the lines of a buffer, held in memory
+class DummyLines(list):
+	def is_lazy(self):
+		return False
+
+# stands in for a Buffer, as seen by the index
+class DummyBuffer:
+	def __init__(self, lines):
+		self.id = 0
+		self.version = 0
+		self.lines = DummyLines(lines)
+
+if(__name__ == "__main__"):
+	unittest.main()